@@ -10,6 +10,7 @@ The main component is the CustomAgentExecutor class, which:
 - Maintains chat history and agent scratchpad
 - Handles iterative tool calling with configurable limits
 - Provides a clean interface for agent-based interactions
+- Streams tool progress and the tokens of the final answer while it is generated
 
 Example:
     from langchain_core.messages import BaseMessage
@@ -24,16 +25,26 @@ Example:
     
     result = agent.invoke("What is the weather like today?")
 
+    for event in agent.stream("What is the weather like today?"):
+        if event["type"] == "token":
+            print(event["text"], end="")
+
 Dependencies:
     - langchain_core.messages: For message handling
     - langchain_core.runnables.base: For runnable components
     - json: For serialization of tool outputs
 """
 
+import itertools
 import json
-from langchain_core.messages import ToolMessage, BaseMessage
+from typing import Iterator
+
+from langchain_core.messages import ToolMessage, BaseMessage, message_chunk_to_message
 from langchain_core.runnables.base import RunnableSerializable
 
+from answer_stream import AnswerStream
+from openai_scheduler import OpenAIScheduler, estimate_tokens, get_scheduler
+
 class CustomAgentExecutor:
     """
     A custom agent executor that manages LLM-based tool calls.
@@ -47,6 +58,7 @@ class CustomAgentExecutor:
         max_iterations (int): Maximum number of tool calls
         name2tool (dict): Mapping of tool names to tool functions
         agent (RunnableSerializable): The configured agent with prompt and LLM
+        scheduler (OpenAIScheduler): Rate limits and retries the LLM calls
     """
 
     def __init__(
@@ -55,7 +67,7 @@ class CustomAgentExecutor:
         llm,
         tools: list,
         chat_history: list[BaseMessage] = None,
-
+        scheduler: OpenAIScheduler = None,
     ):
         """
         Initialize the CustomAgentExecutor.
@@ -66,12 +78,15 @@ class CustomAgentExecutor:
             tools (list): List of available tools
             max_iterations (int, optional): Maximum number of iterations. Default: 3
             chat_history (list[BaseMessage], optional): Initial chat history. Default: []
+            scheduler (OpenAIScheduler, optional): Scheduler of the LLM calls.
+                Default: the shared process-wide scheduler
             
         Raises:
             ValueError: If the required tool 'final_answer' is missing
         """
         self.chat_history = chat_history or []
         self.max_iterations = 3
+        self.scheduler = scheduler or get_scheduler()
         self.name2tool = {tool.name: tool.func for tool in tools}
 
         if "final_answer" not in self.name2tool:
@@ -87,37 +102,79 @@ class CustomAgentExecutor:
             | llm.bind_tools(tools, tool_choice="any")
         )
 
-    def invoke(self, input: str) -> dict:
+    def _open_stream(self, inputs: dict) -> tuple:
         """
-        Execute the agent with a user input.
-        
-        The agent goes through the following steps:
-        1. Generates a tool call based on the input
-        2. Executes the selected tool
-        3. Adds the result to the scratchpad
-        4. Repeats until final answer or max_iterations
-        
+        Starts streaming an agent step and waits for its first chunk, so
+        the scheduler retries errors of the request before anything was
+        streamed. Returns the first chunk and the iterator of the rest.
+        """
+        chunks = iter(self.agent.stream(inputs))
+        return next(chunks, None), chunks
+
+    def stream(self, input: str) -> Iterator[dict]:
+        """
+        Execute the agent with a user input like invoke, yielding events
+        while it runs:
+
+        - {"type": "tool_start", "tool": name, "args": args} before a tool
+          other than final_answer is executed
+        - {"type": "tool_end", "tool": name} after it was executed
+        - {"type": "token", "text": text} for every piece of the answer of
+          the final_answer call, as the LLM generates its arguments
+        - {"type": "final", "result": result} last, with the result invoke
+          returns
+
         Args:
             input (str): The user input to be processed
-            
-        Returns:
-            dict: The result of the last tool call (usually the final answer)
-            
-        Note:
-            The agent automatically stops when the 'final_answer' tool is called
-            or when the maximum number of iterations is reached.
+
+        Yields:
+            dict: The events of the run
+
+        Raises:
+            ValueError: If the LLM response of a step is empty or contains
+                no tool call
         """
         count = 0
         agent_scratchpad = []
+        tool_out = None
 
         while count < self.max_iterations:
-            # Step 1: Agent generates tool call
-            tool_call = self.agent.invoke({
+            inputs = {
                 "input": input,
                 "chat_history": self.chat_history,
                 "agent_scratchpad": agent_scratchpad
-            })
+            }
+            # Step 1: Agent generates tool call (rate limited and retried by the scheduler)
+            first, chunks = self.scheduler.call(
+                self._open_stream,
+                inputs,
+                tokens=estimate_tokens(input, *(
+                    str(message.content) for message in self.chat_history + agent_scratchpad
+                ))
+            )
 
+            # The answer of a final_answer call is decoded from its arguments while they stream
+            message = None
+            tool_name = None
+            answer = AnswerStream()
+            for chunk in itertools.chain([first] if first is not None else [], chunks):
+                message = chunk if message is None else message + chunk
+                for tool_chunk in chunk.tool_call_chunks:
+                    # Only the first tool call is executed
+                    if tool_chunk.get("index") not in (0, None):
+                        continue
+                    tool_name = tool_name or tool_chunk.get("name")
+                    if tool_name == "final_answer" and tool_chunk.get("args"):
+                        text = answer.feed(tool_chunk["args"])
+                        if text:
+                            yield {"type": "token", "text": text}
+
+            # tool_choice="any" forces a tool call, an empty response is an LLM failure
+            if message is None:
+                raise ValueError("The LLM returned an empty response")
+            tool_call = message_chunk_to_message(message)
+            if not tool_call.tool_calls:
+                raise ValueError("The LLM response contains no tool call")
             print(f"\n[{count}] Tool Call: {tool_call.tool_calls[0]['name']}")
 
             agent_scratchpad.append(tool_call)
@@ -127,6 +184,9 @@ class CustomAgentExecutor:
             tool_args = tool_call.tool_calls[0]["args"]
             tool_call_id = tool_call.tool_calls[0]["id"]
 
+            if tool_name != "final_answer":
+                yield {"type": "tool_start", "tool": tool_name, "args": tool_args}
+
             tool_out = self.name2tool[tool_name](**tool_args)
 
             # Step 3: Create ToolMessage with serialized output
@@ -144,6 +204,37 @@ class CustomAgentExecutor:
             if tool_name == "final_answer":
                 break
 
+            yield {"type": "tool_end", "tool": tool_name}
             count += 1
 
-        return tool_out
+        yield {"type": "final", "result": tool_out}
+
+    def invoke(self, input: str) -> dict:
+        """
+        Execute the agent with a user input.
+        
+        The agent goes through the following steps:
+        1. Generates a tool call based on the input
+        2. Executes the selected tool
+        3. Adds the result to the scratchpad
+        4. Repeats until final answer or max_iterations
+        
+        Args:
+            input (str): The user input to be processed
+            
+        Returns:
+            dict: The result of the last tool call (usually the final answer)
+
+        Raises:
+            ValueError: If the LLM response of a step is empty or contains
+                no tool call
+            
+        Note:
+            The agent automatically stops when the 'final_answer' tool is called
+            or when the maximum number of iterations is reached. See stream
+            for the events of the run.
+        """
+        for event in self.stream(input):
+            if event["type"] == "final":
+                return event["result"]
+        return None
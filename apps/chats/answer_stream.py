@@ -0,0 +1,111 @@
+"""
+Incremental decoder of the answer of a streamed final_answer tool call.
+
+The LLM produces the arguments of a tool call as a JSON string in pieces,
+e.g. '{"ans', 'wer": "The vid', 'eo says \\u00e9', '..."}'. AnswerStream
+scans the pieces as they arrive and returns the decoded characters of the
+top-level "answer" string value, so they can be shown before the call is
+complete.
+"""
+
+ESCAPES = {'"': '"', "\\": "\\", "/": "/", "b": "\b", "f": "\f", "n": "\n", "r": "\r", "t": "\t"}
+
+
+class AnswerStream:
+    """
+    Decodes the string value of a top-level key from pieces of a JSON object.
+
+    Attributes:
+        key (str): Key of the string value to decode
+        done (bool): Whether the value was read completely
+    """
+
+    def __init__(self, key: str = "answer"):
+        self.key = key
+        self.done = False
+        self._in_value = False
+        self._depth = 0
+        self._in_string = False
+        self._escaped = False
+        self._string = []
+        self._last_key = None
+        self._after_colon = False
+        self._unicode = None
+        self._high_surrogate = None
+
+    def feed(self, piece: str) -> str:
+        """Scans the next piece of the JSON text, returns the newly decoded characters of the value."""
+        decoded = []
+        for char in piece:
+            if self.done:
+                break
+            if self._in_value:
+                self._value_char(char, decoded)
+            else:
+                self._structure_char(char)
+        return "".join(decoded)
+
+    def _structure_char(self, char: str) -> None:
+        if self._in_string:
+            if self._escaped:
+                self._escaped = False
+                self._string.append(char)
+            elif char == "\\":
+                self._escaped = True
+            elif char == '"':
+                self._in_string = False
+                self._last_key = "".join(self._string) if self._depth == 1 else None
+            else:
+                self._string.append(char)
+            return
+
+        if char == '"':
+            if self._after_colon:
+                self._in_value = True
+            else:
+                self._in_string = True
+                self._string = []
+            return
+
+        if char.isspace():
+            return
+        if char == ":" and self._last_key == self.key:
+            self._after_colon = True
+            return
+
+        if char in "{[":
+            self._depth += 1
+        elif char in "}]":
+            self._depth -= 1
+        self._after_colon = False
+        self._last_key = None
+
+    def _value_char(self, char: str, decoded: list) -> None:
+        if self._unicode is not None:
+            self._unicode += char
+            if len(self._unicode) == 4:
+                self._code_point(int(self._unicode, 16), decoded)
+                self._unicode = None
+        elif self._escaped:
+            self._escaped = False
+            if char == "u":
+                self._unicode = ""
+            else:
+                decoded.append(ESCAPES.get(char, char))
+        elif char == "\\":
+            self._escaped = True
+        elif char == '"':
+            self.done = True
+        else:
+            decoded.append(char)
+
+    def _code_point(self, code: int, decoded: list) -> None:
+        # Characters outside the BMP arrive as two escaped UTF-16 surrogates
+        if 0xD800 <= code < 0xDC00:
+            self._high_surrogate = code
+        elif 0xDC00 <= code < 0xE000 and self._high_surrogate is not None:
+            decoded.append(chr(0x10000 + ((self._high_surrogate - 0xD800) << 10) + (code - 0xDC00)))
+            self._high_surrogate = None
+        else:
+            self._high_surrogate = None
+            decoded.append(chr(code))
@@ -0,0 +1,129 @@
+"""
+Latency benchmark of the hybrid (lexical + dense) search of the chat path.
+
+Builds a synthetic namespace of --chunks chunks in a temporary directory,
+both as lexical documents and as a NumPy vector index, and measures:
+
+- the cold load of the lexical index (first question of a namespace in a
+  container) and its warm refresh,
+- BM25 query latency,
+- the search latency of a question with dense search only and with hybrid
+  search, where the lexical search runs while the query is embedded. The
+  embedding request is simulated with --embed-ms of latency.
+
+Usage (from apps/chats):
+    python benchmarks/hybrid_search_benchmark.py [--chunks 1000,10000,50000] [--embed-ms 150]
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "..", "shared", "python"))
+
+# pylint: disable=wrong-import-position
+from lexical_index import LexicalDocument, LexicalIndex, LexicalStorage, fuse
+from numpy_index import NumpyIndex
+# pylint: enable=wrong-import-position
+
+WORDS = (
+    "the model we video training data so and vector search embedding query chunk latency "
+    "transcript index cost users language okay right basically because token pipeline storage"
+).split()
+CHUNKS_PER_VIDEO = 600
+DIMENSIONS = 1536
+
+
+def build_namespace(root: str, n_chunks: int, seed: int = 7) -> list:
+    """Writes lexical documents and vectors, returns the rare keywords planted in the chunks."""
+    rng = random.Random(seed)
+    vectors = np.random.default_rng(seed).standard_normal((n_chunks, DIMENSIONS)).astype(np.float32)
+    storage = LexicalStorage(directory=os.path.join(root, "lexical"))
+    index = NumpyIndex(os.path.join(root, "vectors", "ns"))
+    keywords = []
+
+    for first in range(0, n_chunks, CHUNKS_PER_VIDEO):
+        video_id = f"video{first // CHUNKS_PER_VIDEO}"
+        document = LexicalDocument()
+        ids, metadata = [], []
+        for i in range(first, min(n_chunks, first + CHUNKS_PER_VIDEO)):
+            words = [rng.choice(WORDS) for _ in range(180)]
+            if i % 50 == 0:
+                keyword = f"xj-{i}"
+                words[rng.randrange(len(words))] = keyword
+                keywords.append((keyword, f"{video_id}#{i - first}"))
+            text = " ".join(words)
+            ids.append(f"{video_id}#{i - first}")
+            metadata.append({"video_id": video_id, "chunk_index": i - first, "text": text})
+            document.add(ids[-1], text, metadata[-1])
+        storage.put("ns", video_id, document)
+        index.upsert(ids, vectors[first:first + len(ids)], metadata)
+
+    return keywords
+
+
+def percentiles(samples: list) -> str:
+    samples = sorted(samples)
+    return (f"p50 {1000 * samples[len(samples) // 2]:.2f} ms, "
+            f"p95 {1000 * samples[int(len(samples) * 0.95)]:.2f} ms")
+
+
+def timed(fn, *args) -> tuple:
+    started = time.perf_counter()
+    result = fn(*args)
+    return time.perf_counter() - started, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chunks", default="1000,10000,50000")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--embed-ms", type=float, default=150.0, help="simulated query embedding latency")
+    args = parser.parse_args()
+
+    for n_chunks in (int(value) for value in args.chunks.split(",")):
+        with tempfile.TemporaryDirectory() as root:
+            keywords = build_namespace(root, n_chunks)
+            storage = LexicalStorage(directory=os.path.join(root, "lexical"))
+            vectors = NumpyIndex(os.path.join(root, "vectors", "ns"))
+            query_vector = np.random.default_rng(1).standard_normal(DIMENSIONS)
+            print(f"{n_chunks} chunks in {-(-n_chunks // CHUNKS_PER_VIDEO)} videos")
+
+            lexical = LexicalIndex(storage, "ns", refresh_seconds=0)
+            cold, _ = timed(lexical.refresh)
+            warm = [timed(lexical.refresh)[0] for _ in range(20)]
+            print(f"  lexical index cold load {1000 * cold:.1f} ms, warm refresh {percentiles(warm)}")
+
+            queries = [f"what did they say about {keyword} and the model" for keyword, _ in keywords]
+            queries = [queries[i % len(queries)] for i in range(args.queries)]
+            bm25 = [timed(lexical.search, query, 10)[0] for query in queries]
+            hits = sum(lexical.search(f"what about {keyword}", 3)[0]["id"] == vector_id
+                       for keyword, vector_id in keywords)
+            print(f"  BM25 query {percentiles(bm25)}, planted keyword found first {hits}/{len(keywords)}")
+
+            def dense(_query):
+                time.sleep(args.embed_ms / 1000)
+                return vectors.search(query_vector, 10, mode="ivf")
+
+            def hybrid(query):
+                with ThreadPoolExecutor(max_workers=1) as executor:
+                    dense_future = executor.submit(dense, query)
+                    lexical.refresh()
+                    sparse = lexical.search(query, 10)
+                    return fuse(dense_future.result(), sparse)[:3]
+
+            n = min(50, len(queries))
+            dense_only = [timed(dense, query)[0] for query in queries[:n]]
+            hybrid_path = [timed(hybrid, query)[0] for query in queries[:n]]
+            print(f"  dense only  {percentiles(dense_only)}")
+            print(f"  hybrid      {percentiles(hybrid_path)} "
+                  f"(+{1000 * (np.median(hybrid_path) - np.median(dense_only)):.2f} ms median)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+"""
+Benchmark of the coarse-to-fine (section, then chunk) dense search of the
+chat path against the flat search of all chunks.
+
+Builds a synthetic namespace of --chunks chunks in a temporary directory as
+NumPy indexes, with section vectors computed like the embeddings service
+does (normalized mean of EMBEDDING_SECTION_CHUNKS consecutive chunk
+embeddings). Chunks drift slowly between topics within a video, like the
+subjects of a lecture. Reports for flat and for every --sections value the
+rows scored per query, the latency, the recall@k of the exact flat top-k
+and the share of matches on the topic of the query. As the chunks of a
+topic are about equally relevant, the topic share is the closer measure of
+answer quality.
+
+Usage (from apps/chats):
+    python benchmarks/section_search_benchmark.py [--chunks 10000,50000] [--sections 2,4,8,16]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "..", "shared", "python"))
+
+# pylint: disable=wrong-import-position
+from embedding_compression import normalize
+from numpy_index import NumpyIndex
+# pylint: enable=wrong-import-position
+
+CHUNKS_PER_VIDEO = 600
+SECTION_CHUNKS = 8
+DIMENSIONS = 1536
+TOPICS = 400
+
+
+def build_namespace(root: str, n_chunks: int, seed: int = 7) -> tuple:
+    """Writes the chunk and section indexes, returns them with the topic centers."""
+    rng = np.random.default_rng(seed)
+    topics = normalize(rng.standard_normal((TOPICS, DIMENSIONS)).astype(np.float32))
+    chunks = NumpyIndex(os.path.join(root, "ns"), ivf_min_vectors=10 ** 9)
+    sections = NumpyIndex(os.path.join(root, "ns-sections"), ivf_min_vectors=10 ** 9)
+
+    for first in range(0, n_chunks, CHUNKS_PER_VIDEO):
+        video_id = f"video{first // CHUNKS_PER_VIDEO}"
+        count = min(CHUNKS_PER_VIDEO, n_chunks - first)
+        # A new topic every 30 chunks on average, chunks mix their topic with noise
+        topic_of_chunk = rng.integers(0, TOPICS, count // 30 + 1).repeat(30)[:count]
+        vectors = normalize(topics[topic_of_chunk] + 1.2 * normalize(
+            rng.standard_normal((count, DIMENSIONS)).astype(np.float32)))
+
+        ids = [f"{video_id}#{i}" for i in range(count)]
+        chunks.upsert(ids, vectors, [
+            {"video_id": video_id, "chunk_index": i, "section_id": f"{video_id}#{i // SECTION_CHUNKS}",
+             "topic": int(topic_of_chunk[i])}
+            for i in range(count)
+        ])
+
+        n_sections = -(-count // SECTION_CHUNKS)
+        section_vectors = normalize(np.stack([
+            vectors[j * SECTION_CHUNKS:(j + 1) * SECTION_CHUNKS].sum(axis=0) for j in range(n_sections)
+        ]))
+        sections.upsert([f"{video_id}#{j}" for j in range(n_sections)], section_vectors,
+                         [{"video_id": video_id, "section_index": j} for j in range(n_sections)])
+
+    return chunks, sections, topics
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chunks", default="10000,50000")
+    parser.add_argument("--sections", default="2,4,8,16", help="sections searched before their chunks")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=3)
+    args = parser.parse_args()
+
+    for n_chunks in (int(value) for value in args.chunks.split(",")):
+        with tempfile.TemporaryDirectory() as root:
+            chunks, sections, topics = build_namespace(root, n_chunks)
+            rng = np.random.default_rng(11)
+            query_topics = rng.integers(0, TOPICS, args.queries)
+            queries = normalize(topics[query_topics] + 1.5 * normalize(
+                rng.standard_normal((args.queries, DIMENSIONS)).astype(np.float32)))
+            n_sections = sections.count()
+            print(f"{n_chunks} chunks in {n_sections} sections of {SECTION_CHUNKS} chunks, k={args.k}")
+
+            def on_topic(matches: list, topic: int) -> int:
+                return sum(match["metadata"]["topic"] == topic for match in matches)
+
+            started = time.perf_counter()
+            flat = [chunks.search(query, args.k, mode="flat") for query in queries]
+            flat_ms = 1000 * (time.perf_counter() - started) / len(queries)
+            reference = [{match["id"] for match in matches} for matches in flat]
+            topic_share = sum(map(on_topic, flat, query_topics)) / (args.k * len(queries))
+            print(f"  {'flat':>12}: {n_chunks:>7} rows scored, {flat_ms:7.2f} ms/query, recall@k 1.000, "
+                  f"on topic {topic_share:.3f}")
+
+            for n_probe_sections in (int(value) for value in args.sections.split(",")):
+                hits = topic_hits = 0
+                started = time.perf_counter()
+                for query, topic, expected in zip(queries, query_topics, reference):
+                    found = sections.search(query, n_probe_sections, mode="flat")
+                    matches = chunks.search(query, args.k, where={"section_id": [match["id"] for match in found]})
+                    hits += len(expected & {match["id"] for match in matches})
+                    topic_hits += on_topic(matches, topic)
+                seconds = (time.perf_counter() - started) / len(queries)
+                rows = n_sections + n_probe_sections * SECTION_CHUNKS
+                print(f"  {f'{n_probe_sections} sections':>12}: {rows:>7} rows scored, {1000 * seconds:7.2f} ms/query, "
+                      f"recall@k {hits / (args.k * len(queries)):.3f}, "
+                      f"on topic {topic_hits / (args.k * len(queries)):.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -20,12 +20,15 @@ Dependencies:
 
 import json
 import logging
+import os
+from typing import Optional
 
+from botocore.exceptions import BotoCoreError, ClientError
 from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
 from langchain_openai import ChatOpenAI
 
 from agent import CustomAgentExecutor
-from helper import convert_history, load_and_set_api_keys
+from helper import ConnectionStream, convert_history, finalize_chat_message, load_and_set_api_keys
 from pinecone_client import (
     final_answer,
     init_embedding_and_pinecone,
@@ -36,6 +39,10 @@ from pinecone_client import (
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
+# Management endpoint of the API Gateway WebSocket API the answers are streamed to,
+# https://{api-id}.execute-api.{region}.amazonaws.com/{stage}
+CHATS_STREAM_ENDPOINT = os.environ.get("CHATS_STREAM_ENDPOINT", "")
+
 prompt = ChatPromptTemplate.from_messages([
     ("system", """\
 You are a helpful assistant that answers user questions by using tools.
@@ -61,6 +68,103 @@ Do NOT call "final_answer" first. If you want to give an answer, you need to ret
 ])
 
 
+def parse_result(result) -> dict:
+    """Parses the final_answer result of the agent into a dict with parsed metadata."""
+    if isinstance(result, str):
+        try:
+            result_dict = json.loads(result)
+        except json.JSONDecodeError as e:
+            print(f"Error decoding result JSON string: {e}")
+            raise
+    elif isinstance(result, dict):
+        result_dict = result
+    else:
+        raise TypeError(f"Unexpected result type: {type(result)}")
+
+    if "metadata" in result_dict and isinstance(result_dict["metadata"], list):
+        try:
+            result_dict["metadata"] = [
+                json.loads(m) if isinstance(m, str) else m for m in result_dict["metadata"]
+            ]
+        except json.JSONDecodeError as e:
+            print(f"Error decoding metadata items: {e}")
+            raise
+
+    return result_dict
+
+
+def related_documents(result_dict: dict) -> list:
+    """Video segments of the metadata of a parsed result, as stored with the answer."""
+    return [
+        {"videoId": m["video_id"], "start": m["start"], "end": m["end"]}
+        for m in result_dict.get("metadata") or []
+    ]
+
+
+def open_connection(stream: dict) -> Optional[ConnectionStream]:
+    """
+    Opens the WebSocket connection of a stream request, with its endpoint
+    or CHATS_STREAM_ENDPOINT.
+
+    Returns None without a stream endpoint, or when the connection cannot be
+    set up, the agent then runs like a request without stream, so the chat
+    still answers.
+    """
+    endpoint = stream.get("endpoint") or CHATS_STREAM_ENDPOINT
+    if not endpoint:
+        logger.warning("No stream endpoint configured, answering without streaming")
+        return None
+
+    try:
+        return ConnectionStream(endpoint, stream["connectionId"], stream.get("requestId"))
+    except (BotoCoreError, ValueError) as e:
+        # An invalid endpoint URL, or no region to sign the posts with
+        logger.error("Cannot stream to connection %s, answering without streaming: %s",
+                     stream.get("connectionId"), e)
+        return None
+
+
+def stream_to_connection(executor: CustomAgentExecutor, message: str, connection: ConnectionStream) -> dict:
+    """
+    Runs the agent and forwards its tool_start and tool_end events and the
+    tokens of the answer while it is generated to the connection. Returns
+    the parsed result, the caller sends the final or error event.
+    """
+    result = None
+    for agent_event in executor.stream(message):
+        if agent_event["type"] == "final":
+            result = agent_event["result"]
+        else:
+            connection.send(agent_event)
+
+    return parse_result(result)
+
+
+def run_agent(event: dict, connection: Optional[ConnectionStream]) -> dict:
+    """Answers the message of the event, streaming to the connection if there is one."""
+    user_id = event["userId"]
+    knowledge_room_id = event["knowledgeRoomId"]
+
+    load_and_set_api_keys()
+    init_embedding_and_pinecone()
+    init_vectorstore(f"{user_id}_{knowledge_room_id}")
+
+    message = event['message']
+    history_raw = event.get("history", [])
+    chat_history = convert_history(history_raw)
+
+    # Retries are handled by the OpenAI scheduler of the agent executor
+    llm = ChatOpenAI(model="gpt-4o", temperature=0, max_retries=0)
+
+    tools = [final_answer, semantic_search]
+
+    executor = CustomAgentExecutor(prompt=prompt, llm=llm, tools=tools, chat_history=chat_history)
+
+    if connection:
+        return stream_to_connection(executor, message, connection)
+    return parse_result(executor.invoke(message))
+
+
 def lambda_handler(event, _context=None):
     """
     AWS Lambda handler function for processing chat messages.
@@ -75,6 +179,15 @@ def lambda_handler(event, _context=None):
             - knowledgeRoomId (str): Identifier for the knowledge room/video context
             - message (str): The user's input message
             - history (list, optional): Previous conversation messages
+            - stream (dict, optional): Streams the run to a WebSocket connection,
+              with connectionId, optional requestId and optional endpoint
+              (default CHATS_STREAM_ENDPOINT), followed by a final event with
+              the result or an error event, see open_connection
+            - answerId (str, optional): Pending chat message of conversationId
+              the answer is stored in, marked FAILED when no answer is
+              generated, for callers that invoke the function asynchronously
+              and do not receive the result
+            - conversationId (str, optional): Conversation of answerId
         context: AWS Lambda context object (unused)
     
     Returns:
@@ -101,42 +214,33 @@ def lambda_handler(event, _context=None):
     """
     print(event)
 
-    user_id = event["userId"]
-    knowledge_room_id = event["knowledgeRoomId"]
-
-    load_and_set_api_keys()
-    init_embedding_and_pinecone()
-    init_vectorstore(f"{user_id}_{knowledge_room_id}")
-
-    message = event['message']
-    history_raw = event.get("history", [])
-    chat_history = convert_history(history_raw)
-
-    llm = ChatOpenAI(model="gpt-4o", temperature=0)
-
-    tools = [final_answer, semantic_search]
-
-    executor = CustomAgentExecutor(prompt=prompt, llm=llm, tools=tools, chat_history=chat_history)
-    result = executor.invoke(message)
-
-    if isinstance(result, str):
-        try:
-            result_dict = json.loads(result)
-        except json.JSONDecodeError as e:
-            print(f"Error decoding result JSON string: {e}")
-            raise
-    elif isinstance(result, dict):
-        result_dict = result
-    else:
-        raise TypeError(f"Unexpected result type: {type(result)}")
-
-    if "metadata" in result_dict and isinstance(result_dict["metadata"], list):
-        try:
-            result_dict["metadata"] = [
-                json.loads(m) if isinstance(m, str) else m for m in result_dict["metadata"]
-            ]
-        except json.JSONDecodeError as e:
-            print(f"Error decoding metadata items: {e}")
-            raise
-
-    return result_dict
+    answer_id = event.get("answerId")
+    connection = open_connection(event["stream"]) if event.get("stream") else None
+
+    try:
+        result_dict = run_agent(event, connection)
+
+        # The GraphQL resolver stored the answer as pending, a client loading
+        # the conversation after the final event sees the stored answer
+        if answer_id:
+            finalize_chat_message(answer_id, event["knowledgeRoomId"], event["conversationId"], "COMPLETED",
+                                  result_dict["answer"], related_documents(result_dict))
+        if connection:
+            connection.send({"type": "final", "result": result_dict})
+
+        return result_dict
+    except Exception:
+        # Asynchronous invocations are not retried, so this is the last chance
+        # to tell the client and to close the pending answer
+        logger.exception("Answering the chat message failed")
+        if connection:
+            connection.send({"type": "error", "message": "Cannot generate response message."})
+        if answer_id:
+            try:
+                finalize_chat_message(answer_id, event["knowledgeRoomId"], event["conversationId"], "FAILED")
+            except ClientError as e:
+                logger.error("Cannot mark the answer %s as failed: %s", answer_id, e)
+        raise
+    finally:
+        if connection:
+            connection.close()
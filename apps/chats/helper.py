@@ -7,21 +7,30 @@ for external service integrations like Pinecone and OpenAI.
 
 Functions:
     convert_history: Converts chat history from dictionary format to LangChain message format
-    get_api_key_from_secret: Retrieves API keys from AWS Secrets Manager
     load_and_set_api_keys: Loads and sets API keys from secrets into environment variables
+    finalize_chat_message: Stores the answer of a pending chat message
+
+Classes:
+    ConnectionStream: Forwards agent events to a WebSocket connection of API Gateway
 """
 
-import os
+import json
 import logging
-from typing import List, Dict
+import os
+import queue
+import threading
+from typing import List, Dict, Optional
 
 import boto3
+from botocore.exceptions import ClientError
 from langchain_core.messages import AIMessage, HumanMessage
 
-secretsmanager = boto3.client("secretsmanager")
+import bootstrap
 
 logger = logging.getLogger()
 
+dynamodb = boto3.client("dynamodb")
+
 def convert_history(history: List[Dict]) -> List:
     """
     Convert chat history from dictionary format to LangChain message format.
@@ -50,38 +59,13 @@ def convert_history(history: List[Dict]) -> List:
     return msgs
 
 
-def get_api_key_from_secret(secret_arn: str) -> str:
-    """
-    Retrieve a secret string (API key) from AWS Secrets Manager.
-
-    Fetches the secret value from AWS Secrets Manager using the provided
-    secret ARN and returns the secret string content.
-
-    Args:
-        secret_arn (str): The ARN of the secret in AWS Secrets Manager.
-            Format: arn:aws:secretsmanager:region:account:secret:secret-name
-
-    Returns:
-        str: The secret string stored in Secrets Manager.
-
-    Raises:
-        ValueError: If the secret is not found or the response format is invalid.
-        botocore.exceptions.ClientError: If there's an AWS API error (e.g., 
-            secret doesn't exist, insufficient permissions).
-    """
-    response = secretsmanager.get_secret_value(SecretId=secret_arn)
-    if "SecretString" in response:
-        return response["SecretString"]
-    raise ValueError("Secret not found or invalid format")
-
-
 def load_and_set_api_keys() -> None:
     """
     Load API keys from AWS Secrets Manager and set them as environment variables.
     
-    Retrieves Pinecone and OpenAI API keys from AWS Secrets Manager using
-    the ARNs specified in environment variables, then sets them as
-    environment variables for use by the application.
+    Retrieves Pinecone and OpenAI API keys through the shared bootstrap module,
+    which fetches both secrets in parallel and caches them in the process with
+    a TTL, so warm invocations skip the Secrets Manager round trips.
     
     Required Environment Variables:
         PINECONE_SECRET_ARN: ARN of the Pinecone API key secret
@@ -97,11 +81,134 @@ def load_and_set_api_keys() -> None:
         ValueError: If any secret is not found or invalid format.
         botocore.exceptions.ClientError: If there's an AWS API error.
     """
-    pinecone_secret_arn = os.environ["PINECONE_SECRET_ARN"]
-    openai_secret_arn = os.environ["OPENAI_SECRET_ARN"]
+    bootstrap.load_and_set_api_keys(
+        PINECONE_API_KEY="PINECONE_SECRET_ARN",
+        OPENAI_API_KEY="OPENAI_SECRET_ARN"
+    )
+
+
+def finalize_chat_message(message_id: str, knowledge_room_id: str, conversation_id: str, status: str,
+                          content: str = "", related_documents: Optional[List[Dict]] = None) -> None:
+    """
+    Finalize the pending answer the GraphQL service stored for a chat message.
+
+    The GraphQL service writes the chat message items, an answer it requested
+    asynchronously is stored with status PENDING and an empty content. This
+    only sets the content, the video segments and the final status of it.
 
-    pinecone_api_key = get_api_key_from_secret(pinecone_secret_arn)
-    openai_api_key = get_api_key_from_secret(openai_secret_arn)
+    Args:
+        message_id (str): Id of the pending answer
+        knowledge_room_id (str): Knowledge room of the conversation
+        conversation_id (str): Conversation of the message
+        status (str): COMPLETED, or FAILED when no answer was generated
+        content (str): The answer
+        related_documents (List[Dict], optional): Video segments with videoId, start and end
+
+    Raises:
+        KeyError: If SEMANTIC_VIDEO_CHAT_TABLE_NAME is not set
+        botocore.exceptions.ClientError: If there's an AWS API error, or
+            ConditionalCheckFailedException when the answer is not pending.
+    """
+    dynamodb.update_item(
+        TableName=os.environ["SEMANTIC_VIDEO_CHAT_TABLE_NAME"],
+        Key={
+            "PK": {"S": f"ROOM#{knowledge_room_id}#CONVERSATION#{conversation_id}"},
+            "SK": {"S": f"MESSAGE#{message_id}"},
+        },
+        UpdateExpression=(
+            "SET metadata.content = :content, metadata.relatedDocuments = :documents, metadata.#status = :status"
+        ),
+        ConditionExpression="metadata.#status = :pending",
+        ExpressionAttributeNames={"#status": "status"},
+        ExpressionAttributeValues={
+            ":content": {"S": content},
+            ":documents": {"L": [
+                {"M": {
+                    "videoId": {"S": document["videoId"]},
+                    "start": {"N": str(document["start"])},
+                    "end": {"N": str(document["end"])},
+                }}
+                for document in related_documents or []
+            ]},
+            ":status": {"S": status},
+            ":pending": {"S": "PENDING"},
+        },
+    )
+
+
+class ConnectionStream:
+    """
+    Forwards the events of an agent run to a client connected to an API
+    Gateway WebSocket API, see CustomAgentExecutor.stream.
+
+    Events are posted from a background thread, so the agent never waits
+    for the connection. Token events queued while a post is in flight are
+    merged into one message, which bounds the number of posts of a long
+    answer without delaying the first token. When the client disconnected
+    (GoneException), further events are dropped and the run continues.
+
+    Attributes:
+        connection_id (str): WebSocket connection of the client
+        request_id (str, optional): Added to every message, so the client can
+            tell the answers of its messages apart
+        gone (bool): Whether the client disconnected
+    """
 
-    os.environ["PINECONE_API_KEY"] = pinecone_api_key
-    os.environ["OPENAI_API_KEY"] = openai_api_key
+    def __init__(self, endpoint: str, connection_id: str, request_id: Optional[str] = None):
+        self.client = boto3.client("apigatewaymanagementapi", endpoint_url=endpoint)
+        self.connection_id = connection_id
+        self.request_id = request_id
+        self.gone = False
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def send(self, event: dict) -> None:
+        """Queues an event for the client."""
+        if not self.gone:
+            self._queue.put(event)
+
+    def close(self) -> None:
+        """Posts the queued events and stops the background thread."""
+        self._queue.put(None)
+        self._thread.join()
+
+    def _run(self) -> None:
+        while True:
+            events = [self._queue.get()]
+            while True:
+                try:
+                    events.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            closed = None in events
+            if closed:
+                events = events[:events.index(None)]
+
+            merged = []
+            for event in events:
+                if event["type"] == "token" and merged and merged[-1]["type"] == "token":
+                    merged[-1] = {"type": "token", "text": merged[-1]["text"] + event["text"]}
+                else:
+                    merged.append(event)
+            for event in merged:
+                self._post(event)
+
+            if closed:
+                return
+
+    def _post(self, event: dict) -> None:
+        if self.gone:
+            return
+        if self.request_id is not None:
+            event = {**event, "requestId": self.request_id}
+
+        try:
+            self.client.post_to_connection(ConnectionId=self.connection_id, Data=json.dumps(event).encode("utf-8"))
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") == "GoneException":
+                logger.info("Connection %s closed, no longer streaming", self.connection_id)
+                self.gone = True
+            else:
+                logger.warning("Posting to connection %s failed: %s", self.connection_id, e)
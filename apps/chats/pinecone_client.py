@@ -1,80 +1,177 @@
 """
 Pinecone client module for semantic search functionality.
 
-This module provides tools for initializing Pinecone vector store,
-performing semantic searches, and generating final answers with metadata.
+This module provides tools for initializing the vector store (Pinecone or
+the self-hosted NumPy index, see shared/python/vector_store.py), performing
+semantic searches, and generating final answers with metadata.
 """
 
 import os
 import logging
 import json
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 # These imports are provided by Lambda layers and may not be available during linting
 from pinecone import Pinecone  # pylint: disable=import-error
-from langchain_pinecone import PineconeVectorStore  # pylint: disable=import-error
 from langchain_openai import OpenAIEmbeddings
 from langchain_core.tools import tool
 
+from embedding_compression import get_compression
+from lexical_index import LexicalIndex, create_lexical_storage, fuse
+from scheduled_embeddings import ScheduledEmbeddings
+from vector_store import VECTOR_STORE_BACKEND, create_vector_store, section_namespace
+
 logger = logging.getLogger()
 
-PINECONE_VECTORSTORE = None
+VECTOR_STORE = None
+NAMESPACE = None
 EMBEDDING_MODEL = None
 PINECONE_INDEX = None
 PINECONE_API_KEY = None
-
-PINECONE_INDEX_NAME = os.environ["PINECONE_INDEX_NAME"]
+LEXICAL_STORAGE = None
+LEXICAL_INDEXES = OrderedDict()
+
+PINECONE_INDEX_NAME = os.environ.get("PINECONE_INDEX_NAME")
+# Must match the model the embeddings service indexed with
+EMBEDDING_MODEL_NAME = os.environ.get("EMBEDDING_MODEL_NAME", "text-embedding-ada-002")
+# "rrf" or "weighted" fuse dense and lexical matches, "dense" searches the vector store only
+SEARCH_FUSION = os.environ.get("SEARCH_FUSION", "rrf")
+# Weight of the dense matches in the fusion, the lexical matches get the rest
+SEARCH_DENSE_WEIGHT = float(os.environ.get("SEARCH_DENSE_WEIGHT", "0.5"))
+SEARCH_RRF_K = int(os.environ.get("SEARCH_RRF_K", "60"))
+# Candidates per retriever, and matches returned to the agent
+SEARCH_CANDIDATES = int(os.environ.get("SEARCH_CANDIDATES", "10"))
+SEARCH_TOP_K = int(os.environ.get("SEARCH_TOP_K", "3"))
+# Sections searched first, whose chunks are then searched only, 0 searches all chunks
+SEARCH_SECTIONS = int(os.environ.get("SEARCH_SECTIONS", "8"))
+# Dense matches need this cosine similarity, lexical matches this share of the best BM25 score
+SEARCH_MIN_DENSE_SCORE = float(os.environ.get("SEARCH_MIN_DENSE_SCORE", "0.75"))
+SEARCH_MIN_SPARSE_RATIO = float(os.environ.get("SEARCH_MIN_SPARSE_RATIO", "0.5"))
+# Seconds between checks for new lexical documents of a namespace
+LEXICAL_INDEX_REFRESH_SECONDS = float(os.environ.get("LEXICAL_INDEX_REFRESH_SECONDS", "30"))
+# Lexical indexes of the most recently searched namespaces kept in a warm container
+LEXICAL_INDEX_CACHE_SIZE = int(os.environ.get("LEXICAL_INDEX_CACHE_SIZE", "8"))
 
 
 def init_embedding_and_pinecone():
-    """Initialize embedding model and Pinecone index."""
-    global EMBEDDING_MODEL, PINECONE_INDEX, PINECONE_API_KEY
+    """Initialize embedding model and vector store."""
+    global EMBEDDING_MODEL, PINECONE_INDEX, PINECONE_API_KEY, VECTOR_STORE, LEXICAL_STORAGE
 
-    if EMBEDDING_MODEL is not None and PINECONE_INDEX is not None:
+    if EMBEDDING_MODEL is not None and VECTOR_STORE is not None:
         # already initialized
         return
 
-    PINECONE_API_KEY = os.environ.get("PINECONE_API_KEY")
+    if VECTOR_STORE_BACKEND == "pinecone":
+        PINECONE_API_KEY = os.environ.get("PINECONE_API_KEY")
+
+        if not PINECONE_API_KEY:
+            raise ValueError("PINECONE_API_KEY not set in environment variables")
 
-    if not PINECONE_API_KEY:
-        raise ValueError("PINECONE_API_KEY not set in environment variables")
+        pc = Pinecone(api_key=PINECONE_API_KEY)
+        PINECONE_INDEX = pc.Index(PINECONE_INDEX_NAME)
 
     openai_api_key = os.environ.get("OPENAI_API_KEY")
 
     if not openai_api_key:
         raise ValueError("OPENAI_API_KEY not set in environment variables")
 
-    EMBEDDING_MODEL = OpenAIEmbeddings(openai_api_key=openai_api_key)
+    # Requests are rate limited and retried by the shared OpenAI scheduler, and query
+    # embeddings are compressed like the vectors stored by the embeddings service
+    compression = get_compression()
+    EMBEDDING_MODEL = ScheduledEmbeddings(
+        OpenAIEmbeddings(model=EMBEDDING_MODEL_NAME, openai_api_key=openai_api_key, max_retries=0,
+                         dimensions=compression.api_dimensions),
+        compression=compression
+    )
 
-    pc = Pinecone(api_key=PINECONE_API_KEY)
-    PINECONE_INDEX = pc.Index(PINECONE_INDEX_NAME)
+    VECTOR_STORE = create_vector_store(PINECONE_INDEX)
+    LEXICAL_STORAGE = create_lexical_storage()
 
 
 def init_vectorstore(namespace: str):
-    """Initialize Pinecone vector store with given namespace."""
-    global PINECONE_VECTORSTORE
-
-    PINECONE_VECTORSTORE = PineconeVectorStore(
-        pinecone_api_key=PINECONE_API_KEY,
-        index=PINECONE_INDEX,
-        embedding=EMBEDDING_MODEL,
-        namespace=namespace
+    """Set the namespace searched by semantic_search."""
+    global NAMESPACE
+
+    NAMESPACE = namespace
+
+
+def dense_search(query: str, top_k: int) -> list:
+    """
+    Matches of the query embedding in the vector store, coarse to fine: the
+    SEARCH_SECTIONS closest sections first, then the chunks of those
+    sections and the chunks without a section. Namespaces without section
+    vectors are searched flat.
+    """
+    vector = EMBEDDING_MODEL.embed_query(query)
+
+    if SEARCH_SECTIONS > 0:
+        sections = VECTOR_STORE.query(vector, top_k=SEARCH_SECTIONS, namespace=section_namespace(NAMESPACE))
+        if sections:
+            # Chunks embedded before sections were introduced have no section_id and stay searchable
+            return VECTOR_STORE.query(vector, top_k=top_k, namespace=NAMESPACE,
+                                      where={"section_id": [section["id"] for section in sections] + [None]})
+
+    return VECTOR_STORE.query(vector, top_k=top_k, namespace=NAMESPACE)
+
+
+def lexical_search(query: str, top_k: int) -> list:
+    """BM25 matches of the query, empty when the lexical index is not available."""
+    if NAMESPACE in LEXICAL_INDEXES:
+        LEXICAL_INDEXES.move_to_end(NAMESPACE)
+    else:
+        LEXICAL_INDEXES[NAMESPACE] = LexicalIndex(LEXICAL_STORAGE, NAMESPACE, LEXICAL_INDEX_REFRESH_SECONDS)
+        # Evicts the least recently searched namespaces
+        while len(LEXICAL_INDEXES) > max(1, LEXICAL_INDEX_CACHE_SIZE):
+            LEXICAL_INDEXES.popitem(last=False)
+    index = LEXICAL_INDEXES[NAMESPACE]
+
+    try:
+        index.refresh()
+    except Exception as e:  # pylint: disable=broad-except
+        logger.warning("Lexical index of %s not refreshed: %s", NAMESPACE, e)
+    return index.search(query, top_k)
+
+
+def hybrid_search(query: str) -> list:
+    """
+    Searches the vector store and the lexical index concurrently and fuses
+    the relevant matches of both, best first.
+    """
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        # The lexical index is refreshed and searched while the query is embedded
+        dense_future = executor.submit(dense_search, query, SEARCH_CANDIDATES)
+        sparse = lexical_search(query, SEARCH_CANDIDATES)
+        dense = dense_future.result()
+
+    best_sparse = sparse[0]["score"] if sparse else 0.0
+    fused = fuse(
+        [match for match in dense if match["score"] >= SEARCH_MIN_DENSE_SCORE],
+        [match for match in sparse if match["score"] >= SEARCH_MIN_SPARSE_RATIO * best_sparse],
+        method=SEARCH_FUSION, dense_weight=SEARCH_DENSE_WEIGHT, rrf_k=SEARCH_RRF_K
     )
+    return fused[:SEARCH_TOP_K]
 
 
 @tool
 def semantic_search(query: str) -> str:
-    """Search for relevant documents using Pinecone and return their content and metadata."""
-    docs_with_scores = PINECONE_VECTORSTORE.similarity_search_with_score(query, k=3)
-    filtered = [(doc, score) for doc, score in docs_with_scores if score >= 0.75]
-
-    contents = [doc.page_content for doc, score in filtered]
-    metadatas = [doc.metadata for doc, score in filtered]
+    """Search for relevant documents by meaning and by exact keywords (names, acronyms, numbers)
+    and return their content and metadata."""
+    if LEXICAL_STORAGE is None or SEARCH_FUSION == "dense":
+        matches = dense_search(query, SEARCH_TOP_K)
+        filtered = [match for match in matches if match["score"] >= SEARCH_MIN_DENSE_SCORE]
+    else:
+        filtered = hybrid_search(query)
+
+    contents = [match["metadata"].get("text", "") for match in filtered]
+    metadatas = [{key: value for key, value in match["metadata"].items() if key != "text"}
+                 for match in filtered]
 
     result = {
         "contents": contents,
         "metadata": metadatas
     }
 
-    print("semantic_search result: ", filtered)
+    print("semantic_search result: ", [(match["id"], match["score"]) for match in filtered])
 
     return json.dumps(result)
 
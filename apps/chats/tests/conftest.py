@@ -0,0 +1,15 @@
+"""
+Test setup of the chats service: the service modules and the shared modules
+are importable flat, like in the Lambda package. pinecone and LangChain come
+from the Lambda layer and have to be installed to run the tests.
+"""
+import os
+import sys
+
+SERVICE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+sys.path.insert(0, os.path.join(SERVICE_DIR, "..", "..", "shared", "python"))
+sys.path.insert(0, SERVICE_DIR)
+
+# boto3 clients are created on import, the tests never reach AWS
+os.environ.setdefault("AWS_DEFAULT_REGION", "eu-central-1")
@@ -0,0 +1,49 @@
+"""Tests of the agent executor on a fake LLM."""
+from types import SimpleNamespace
+
+import pytest
+
+from agent import CustomAgentExecutor
+
+
+class FakeScheduler:
+    """Calls the function right away, without budgets or retries."""
+
+    def call(self, fn, *args, requests=1, tokens=0, work=0.0):
+        return fn(*args)
+
+
+class FakeAgent:
+    """Prompt and LLM in one: streams the given chunks for every step."""
+
+    def __init__(self, chunks):
+        self.chunks = chunks
+
+    def __ror__(self, _inputs):
+        return self
+
+    def __or__(self, _llm):
+        return self
+
+    def bind_tools(self, _tools, tool_choice=None):
+        return self
+
+    def stream(self, _inputs):
+        return iter(self.chunks)
+
+
+def executor(chunks):
+    fake = FakeAgent(chunks)
+    tools = [SimpleNamespace(name="final_answer", func=lambda **kwargs: kwargs)]
+    return CustomAgentExecutor(prompt=fake, llm=fake, tools=tools, scheduler=FakeScheduler())
+
+
+def test_empty_response_raises():
+    with pytest.raises(ValueError, match="empty response"):
+        executor([]).invoke("question")
+
+
+def test_response_without_tool_call_raises():
+    chunk = SimpleNamespace(tool_call_chunks=[], tool_calls=[])
+    with pytest.raises(ValueError, match="no tool call"):
+        list(executor([chunk]).stream("question"))
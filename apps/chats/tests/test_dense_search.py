@@ -0,0 +1,93 @@
+"""
+Tests of the coarse-to-fine dense search on a NumPy vector store holding
+videos embedded with sections and videos embedded before sections existed.
+"""
+import numpy as np
+import pytest
+
+import pinecone_client
+from vector_store import NumpyStore, section_namespace
+
+DIMENSIONS = 32
+NAMESPACE = "room"
+SECTION_CHUNKS = 4
+
+
+class FakeEmbeddings:
+    """Returns the query vectors registered by the test."""
+
+    def __init__(self, vectors: dict):
+        self.vectors = vectors
+
+    def embed_query(self, text: str) -> list:
+        return self.vectors[text]
+
+
+def unit(vectors: np.ndarray) -> np.ndarray:
+    return vectors / np.linalg.norm(vectors, axis=-1, keepdims=True)
+
+
+def chunk(video_id: str, index: int, vector: np.ndarray, sectioned: bool) -> dict:
+    metadata = {"video_id": video_id, "chunk_index": index, "text": f"{video_id} chunk {index}"}
+    if sectioned:
+        metadata["section_id"] = f"{video_id}#{index // SECTION_CHUNKS}"
+    return {"id": f"{video_id}#{index}", "values": vector.tolist(), "metadata": metadata}
+
+
+@pytest.fixture(name="store")
+def fixture_store(tmp_path, monkeypatch):
+    """Two sectioned videos and one legacy video without section ids, returns the chunk vectors by id."""
+    rng = np.random.default_rng(3)
+    store = NumpyStore(str(tmp_path), search="flat", segment_size=1)
+    vectors = {}
+
+    for video_id, sectioned in (("new1", True), ("new2", True), ("legacy", False)):
+        chunk_vectors = unit(rng.standard_normal((16, DIMENSIONS)))
+        store.upsert([chunk(video_id, i, v, sectioned) for i, v in enumerate(chunk_vectors)], NAMESPACE)
+        vectors.update({f"{video_id}#{i}": v for i, v in enumerate(chunk_vectors)})
+
+        if sectioned:
+            sections = unit(chunk_vectors.reshape(-1, SECTION_CHUNKS, DIMENSIONS).sum(axis=1))
+            store.upsert([
+                {"id": f"{video_id}#{j}", "values": v.tolist(), "metadata": {"video_id": video_id}}
+                for j, v in enumerate(sections)
+            ], section_namespace(NAMESPACE))
+    store.flush()
+
+    monkeypatch.setattr(pinecone_client, "VECTOR_STORE", store)
+    monkeypatch.setattr(pinecone_client, "NAMESPACE", NAMESPACE)
+    monkeypatch.setattr(pinecone_client, "SEARCH_SECTIONS", 2)
+    return vectors
+
+
+def search(vectors: dict, target: str, top_k: int = 3) -> list:
+    pinecone_client.EMBEDDING_MODEL = FakeEmbeddings({"query": vectors[target]})
+    return [match["id"] for match in pinecone_client.dense_search("query", top_k)]
+
+
+def test_finds_chunks_of_videos_without_sections(store):
+    for i in range(16):
+        assert search(store, f"legacy#{i}")[0] == f"legacy#{i}"
+
+
+def test_finds_chunks_of_sectioned_videos(store):
+    for video_id in ("new1", "new2"):
+        for i in range(16):
+            assert search(store, f"{video_id}#{i}")[0] == f"{video_id}#{i}"
+
+
+def test_skips_chunks_of_sections_not_selected(store, monkeypatch):
+    monkeypatch.setattr(pinecone_client, "SEARCH_SECTIONS", 1)
+
+    found = search(store, "new1#0", top_k=48)
+
+    sectioned = [vector_id for vector_id in found if not vector_id.startswith("legacy#")]
+    # One section of SECTION_CHUNKS chunks, plus every legacy chunk
+    assert len(sectioned) == SECTION_CHUNKS
+    assert len(found) == SECTION_CHUNKS + 16
+
+
+def test_flat_search_without_section_vectors(store, monkeypatch):
+    monkeypatch.setattr(pinecone_client, "SEARCH_SECTIONS", 0)
+
+    assert len(search(store, "new2#5", top_k=48)) == 48
@@ -0,0 +1,42 @@
+"""Tests of storing an answer generated asynchronously in its pending chat message."""
+import helper
+from handler import related_documents
+
+
+class FakeDynamoDB:
+    def __init__(self):
+        self.updates = []
+
+    def update_item(self, **kwargs):
+        self.updates.append(kwargs)
+
+
+def test_completes_the_pending_answer(monkeypatch):
+    dynamodb = FakeDynamoDB()
+    monkeypatch.setattr(helper, "dynamodb", dynamodb)
+    monkeypatch.setenv("SEMANTIC_VIDEO_CHAT_TABLE_NAME", "table")
+    documents = related_documents({"answer": "The answer", "metadata": [
+        {"video_id": "v1", "start": 1.5, "end": 4, "text": "chunk"}
+    ]})
+
+    helper.finalize_chat_message("a1", "room", "conversation", "COMPLETED", "The answer", documents)
+
+    update = dynamodb.updates[0]
+    assert update["TableName"] == "table"
+    assert update["Key"] == {"PK": {"S": "ROOM#room#CONVERSATION#conversation"}, "SK": {"S": "MESSAGE#a1"}}
+    assert update["ConditionExpression"] == "metadata.#status = :pending"
+    values = update["ExpressionAttributeValues"]
+    assert values[":content"] == {"S": "The answer"}
+    assert values[":documents"]["L"] == [{"M": {"videoId": {"S": "v1"}, "start": {"N": "1.5"}, "end": {"N": "4"}}}]
+    assert (values[":status"], values[":pending"]) == ({"S": "COMPLETED"}, {"S": "PENDING"})
+
+
+def test_fails_the_pending_answer(monkeypatch):
+    dynamodb = FakeDynamoDB()
+    monkeypatch.setattr(helper, "dynamodb", dynamodb)
+    monkeypatch.setenv("SEMANTIC_VIDEO_CHAT_TABLE_NAME", "table")
+
+    helper.finalize_chat_message("a1", "room", "conversation", "FAILED")
+
+    values = dynamodb.updates[0]["ExpressionAttributeValues"]
+    assert (values[":status"], values[":content"], values[":documents"]) == ({"S": "FAILED"}, {"S": ""}, {"L": []})
@@ -0,0 +1,104 @@
+"""
+Tests of the hybrid search: the cache of lexical indexes by namespace and
+the fusion of dense and lexical matches.
+"""
+from collections import OrderedDict
+
+import pytest
+
+import pinecone_client
+from lexical_index import LexicalDocument, LexicalStorage
+
+
+def document(video_id: str, *texts: str) -> LexicalDocument:
+    lexical = LexicalDocument()
+    for i, text in enumerate(texts):
+        lexical.add(f"{video_id}#{i}", text, {"video_id": video_id})
+    return lexical
+
+
+def match(vector_id: str, score: float) -> dict:
+    return {"id": vector_id, "score": score, "metadata": {"video_id": vector_id.split("#")[0]}}
+
+
+@pytest.fixture(name="storage")
+def fixture_storage(tmp_path, monkeypatch):
+    storage = LexicalStorage(directory=str(tmp_path))
+    for namespace in ("a", "b", "c"):
+        storage.put(namespace, "v1", document("v1", f"Chunk about {namespace}-topic"))
+
+    monkeypatch.setattr(pinecone_client, "LEXICAL_STORAGE", storage)
+    monkeypatch.setattr(pinecone_client, "LEXICAL_INDEXES", OrderedDict())
+    monkeypatch.setattr(pinecone_client, "LEXICAL_INDEX_REFRESH_SECONDS", 0.0)
+    return storage
+
+
+def search_in(namespace: str, query: str) -> list:
+    pinecone_client.init_vectorstore(namespace)
+    return [match["id"] for match in pinecone_client.lexical_search(query, 5)]
+
+
+def test_evicts_the_least_recently_searched_namespace(storage, monkeypatch):
+    monkeypatch.setattr(pinecone_client, "LEXICAL_INDEX_CACHE_SIZE", 2)
+
+    search_in("a", "a-topic")
+    search_in("b", "b-topic")
+    index_a = pinecone_client.LEXICAL_INDEXES["a"]
+    search_in("a", "a-topic")
+    search_in("c", "c-topic")
+
+    assert list(pinecone_client.LEXICAL_INDEXES) == ["a", "c"]
+    assert pinecone_client.LEXICAL_INDEXES["a"] is index_a
+    # An evicted namespace is loaded again on its next search
+    assert search_in("b", "b-topic") == ["v1#0"]
+    assert list(pinecone_client.LEXICAL_INDEXES) == ["c", "b"]
+
+
+def test_sees_documents_written_after_the_first_search(storage):
+    assert search_in("a", "websocket") == []
+
+    storage.put("a", "v2", document("v2", "The websocket API streams the answer"))
+    assert search_in("a", "websocket") == ["v2#0"]
+
+    storage.delete("a", "v2")
+    assert search_in("a", "websocket") == []
+
+
+def test_keeps_the_cached_index_until_the_refresh_is_due(storage, monkeypatch):
+    monkeypatch.setattr(pinecone_client, "LEXICAL_INDEX_REFRESH_SECONDS", 3600.0)
+    search_in("a", "a-topic")
+
+    storage.put("a", "v2", document("v2", "The websocket API streams the answer"))
+
+    assert search_in("a", "websocket") == []
+
+
+def test_failing_refresh_searches_the_cached_index(storage, monkeypatch):
+    search_in("a", "a-topic")
+
+    def failing_marker(_namespace):
+        raise OSError("S3 not reachable")
+
+    monkeypatch.setattr(storage, "marker", failing_marker)
+
+    assert search_in("a", "a-topic") == ["v1#0"]
+
+
+def test_fuses_relevant_dense_and_lexical_matches(storage, monkeypatch):
+    storage.put("a", "v2", document("v2", "GPT-4o pricing", "GPT-4o pricing and GPT-4o latency", "unrelated"))
+    dense = [match("v1#0", 0.9), match("v2#1", 0.8), match("v2#2", 0.7)]
+
+    monkeypatch.setattr(pinecone_client, "dense_search", lambda query, top_k: dense)
+    monkeypatch.setattr(pinecone_client, "SEARCH_FUSION", "rrf")
+    monkeypatch.setattr(pinecone_client, "SEARCH_MIN_DENSE_SCORE", 0.75)
+    monkeypatch.setattr(pinecone_client, "SEARCH_MIN_SPARSE_RATIO", 0.5)
+    monkeypatch.setattr(pinecone_client, "SEARCH_TOP_K", 3)
+    pinecone_client.init_vectorstore("a")
+
+    fused = pinecone_client.hybrid_search("GPT-4o latency")
+
+    # v2#1 is found by both. v2#2 is below the dense threshold, and v2#0 matches
+    # only "gpt-4o", scoring less than half of the best lexical match
+    assert [entry["id"] for entry in fused] == ["v2#1", "v1#0"]
+    assert fused[0]["dense_score"] == 0.8
+    assert fused[0]["sparse_score"] > 0
@@ -0,0 +1,106 @@
+"""Tests of streaming a chat answer, its fallbacks and its terminal events."""
+import pytest
+
+import handler
+
+RESULT = {"answer": "The answer", "metadata": [{"video_id": "v1", "start": 1.5, "end": 4}], "contents": []}
+
+
+class FakeExecutor:
+    def stream(self, _message):
+        yield {"type": "tool_start", "tool": "semantic_search"}
+        yield {"type": "token", "text": "The answer"}
+        yield {"type": "final", "result": RESULT}
+
+
+class FakeConnection:
+    def __init__(self):
+        self.sent = []
+
+    def send(self, event):
+        self.sent.append(event)
+
+    def close(self):
+        self.sent.append(None)
+
+
+def event(**fields) -> dict:
+    return {"userId": "user", "knowledgeRoomId": "room", "message": "question", **fields}
+
+
+def test_without_endpoint_answers_without_streaming(monkeypatch):
+    monkeypatch.setattr(handler, "CHATS_STREAM_ENDPOINT", "")
+    monkeypatch.setattr(handler, "ConnectionStream", lambda *args: pytest.fail("connection created"))
+
+    assert handler.open_connection({"connectionId": "c1"}) is None
+
+
+def test_failing_connection_answers_without_streaming(monkeypatch):
+    def failing_connection(*_args):
+        raise ValueError("Invalid endpoint")
+
+    monkeypatch.setattr(handler, "ConnectionStream", failing_connection)
+
+    assert handler.open_connection({"connectionId": "c1", "endpoint": "https://example.com/dev"}) is None
+
+
+def test_opens_the_connection_of_the_stream_request(monkeypatch):
+    monkeypatch.setattr(handler, "CHATS_STREAM_ENDPOINT", "https://example.com/dev")
+    monkeypatch.setattr(handler, "ConnectionStream", lambda *args: args)
+
+    assert handler.open_connection({"connectionId": "c1", "requestId": "r1"}) == ("https://example.com/dev", "c1", "r1")
+
+
+def test_streams_the_agent_events():
+    connection = FakeConnection()
+
+    assert handler.stream_to_connection(FakeExecutor(), "question", connection) == RESULT
+    assert connection.sent == [{"type": "tool_start", "tool": "semantic_search"}, {"type": "token", "text": "The answer"}]
+
+
+@pytest.fixture(name="finalized")
+def fixture_finalized(monkeypatch):
+    finalized = []
+    monkeypatch.setattr(handler, "finalize_chat_message", lambda *args: finalized.append(args))
+    return finalized
+
+
+def test_stores_the_answer_before_the_final_event(monkeypatch, finalized):
+    connection = FakeConnection()
+    monkeypatch.setattr(handler, "open_connection", lambda stream: connection)
+
+    def run_agent(_event, _connection):
+        assert not finalized
+        return RESULT
+
+    monkeypatch.setattr(handler, "run_agent", run_agent)
+
+    result = handler.lambda_handler(event(answerId="a1", conversationId="conversation", stream={"connectionId": "c1"}))
+
+    assert result == RESULT
+    assert finalized == [("a1", "room", "conversation", "COMPLETED", "The answer",
+                          [{"videoId": "v1", "start": 1.5, "end": 4}])]
+    assert connection.sent == [{"type": "final", "result": RESULT}, None]
+
+
+def test_failure_sends_an_error_event_and_fails_the_answer(monkeypatch, finalized):
+    connection = FakeConnection()
+    monkeypatch.setattr(handler, "open_connection", lambda stream: connection)
+
+    def failing_agent(_event, _connection):
+        raise KeyError("OPENAI_SECRET_ARN")
+
+    monkeypatch.setattr(handler, "run_agent", failing_agent)
+
+    with pytest.raises(KeyError):
+        handler.lambda_handler(event(answerId="a1", conversationId="conversation", stream={"connectionId": "c1"}))
+
+    assert connection.sent == [{"type": "error", "message": "Cannot generate response message."}, None]
+    assert finalized == [("a1", "room", "conversation", "FAILED")]
+
+
+def test_synchronous_request_stores_nothing(monkeypatch, finalized):
+    monkeypatch.setattr(handler, "run_agent", lambda _event, connection: connection or RESULT)
+
+    assert handler.lambda_handler(event()) == RESULT
+    assert not finalized
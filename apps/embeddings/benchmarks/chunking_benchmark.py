@@ -0,0 +1,130 @@
+"""
+Benchmark of the transcript chunker on a synthetic 10-hour transcript.
+
+Compares chunking.chunk_transcript with the previous character-based
+chunker (kept below for reference) and checks the invariants of the new
+chunks: chunk size and overlap in tokens, whole-segment overlap and exact
+timestamps.
+
+Usage (from apps/embeddings):
+    python benchmarks/chunking_benchmark.py [--hours 10] [--chunk-size 250] [--chunk-overlap 25]
+
+Token counts use tiktoken when installed, otherwise the character estimate.
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from chunking import chunk_transcript, count_tokens  # pylint: disable=wrong-import-position
+
+WORDS = (
+    "the model we video training data so and vector search embedding query chunk latency "
+    "transcript index cost users language okay right basically because token pipeline storage"
+).split()
+
+
+def synthetic_transcript(hours: float, seed: int = 7) -> list:
+    """Whisper-like segments of 2-8 seconds at about 2.5 words per second."""
+    rng = random.Random(seed)
+    segments = []
+    position = 0.0
+
+    while position < hours * 3600:
+        duration = rng.uniform(2.0, 8.0)
+        words = max(1, int(duration * rng.uniform(2.0, 3.0)))
+        segments.append({
+            "start": round(position, 2),
+            "end": round(position + duration, 2),
+            "text": " ".join(rng.choice(WORDS) for _ in range(words)).capitalize() + "."
+        })
+        position += duration + rng.uniform(0.0, 0.5)
+
+    return segments
+
+
+def legacy_chunk_transcript(transcript_segments, chunk_size=1000, chunk_overlap=100):
+    """The previous character-based chunker, for comparison."""
+    chunks = []
+    current_chunk_text = ""
+    current_chunk_start = None
+    current_chunk_end = None
+
+    for segment in transcript_segments:
+        if current_chunk_start is None:
+            current_chunk_start = segment["start"]
+
+        current_chunk_text += segment["text"] + " "
+        current_chunk_end = segment["end"]
+
+        if len(current_chunk_text) >= chunk_size:
+            chunks.append({"text": current_chunk_text.strip(), "start": current_chunk_start,
+                           "end": current_chunk_end})
+            current_chunk_text = current_chunk_text[-chunk_overlap:]
+            current_chunk_start = current_chunk_end - 1
+
+    if current_chunk_text.strip():
+        chunks.append({"text": current_chunk_text.strip(), "start": current_chunk_start,
+                       "end": current_chunk_end})
+
+    return chunks
+
+
+def timed(fn, *args, repeat: int = 3):
+    best = float("inf")
+    result = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn(*args)
+        best = min(best, time.perf_counter() - started)
+    return best, result
+
+
+def check_chunks(segments: list, chunks: list, chunk_size: int, chunk_overlap: int) -> None:
+    starts = {segment["start"] for segment in segments}
+    ends = {segment["end"] for segment in segments}
+    token_counts = count_tokens([chunk["text"] for chunk in chunks])
+
+    oversized = sum(1 for chunk in chunks if chunk["tokens"] > chunk_size)
+    misaligned = sum(1 for chunk in chunks if chunk["start"] not in starts or chunk["end"] not in ends)
+    overlaps = [max(0, previous["end"] - chunk["start"]) for previous, chunk in zip(chunks, chunks[1:])]
+
+    print(f"  chunks over {chunk_size} tokens (single long segments): {oversized}")
+    print(f"  chunks not aligned to segment timestamps: {misaligned}")
+    print(f"  mean tokens per chunk: {sum(token_counts) / max(1, len(token_counts)):.1f} "
+          f"(max {max(token_counts, default=0)}), mean overlap {sum(overlaps) / max(1, len(overlaps)):.1f}s "
+          f"for {chunk_overlap} overlap tokens")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--hours", type=float, default=10.0)
+    parser.add_argument("--chunk-size", type=int, default=250, help="tokens per chunk")
+    parser.add_argument("--chunk-overlap", type=int, default=25, help="overlap tokens")
+    args = parser.parse_args()
+
+    segments = synthetic_transcript(args.hours)
+    characters = sum(len(segment["text"]) for segment in segments)
+    print(f"Synthetic transcript: {args.hours:g}h, {len(segments)} segments, {characters} characters")
+
+    # Load the encoding outside of the measurement
+    count_tokens(["warm up"])
+
+    legacy_seconds, legacy_chunks = timed(
+        legacy_chunk_transcript, segments, args.chunk_size * 4, args.chunk_overlap * 4
+    )
+    print(f"legacy (characters {args.chunk_size * 4}/{args.chunk_overlap * 4}): "
+          f"{legacy_seconds * 1000:.1f} ms, {len(legacy_chunks)} chunks")
+
+    seconds, chunks = timed(chunk_transcript, segments, args.chunk_size, args.chunk_overlap)
+    print(f"token-aware (tokens {args.chunk_size}/{args.chunk_overlap}): "
+          f"{seconds * 1000:.1f} ms, {len(chunks)} chunks, "
+          f"{len(segments) / seconds:.0f} segments/s including tokenization")
+    check_chunks(segments, chunks, args.chunk_size, args.chunk_overlap)
+
+
+if __name__ == "__main__":
+    main()
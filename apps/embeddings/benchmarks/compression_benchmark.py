@@ -0,0 +1,110 @@
+"""
+Offline recall benchmark of reduced-dimension and int8 embeddings.
+
+Runs exact cosine top-k search over a fixed corpus with full-precision
+vectors as the reference, then with every compression setting, and reports
+recall@k against the reference, bytes per vector and search time.
+
+The corpus is one of:
+    --vectors corpus.npy    float32 array of shape (n, dimensions), e.g. exported from the index
+    --cache-dir DIR         the *.f32 files of a local embedding cache (/tmp/embedding-cache)
+    (default)               a seeded synthetic corpus of clustered 1536-dimensional vectors whose
+                            variance decays over the dimensions like in text-embedding-3 models
+
+Queries are corpus vectors with added noise. For text-embedding-3 models
+"truncate" gives the same vectors as requesting the dimensions from the API,
+so the truncated rows also measure EMBEDDING_REDUCTION=api.
+
+Usage (from apps/embeddings):
+    python benchmarks/compression_benchmark.py [--k 10] [--dimensions 1536,1024,512,256]
+"""
+import argparse
+import glob
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "..", "shared", "python"))
+
+from embedding_compression import EmbeddingCompression, normalize  # pylint: disable=wrong-import-position
+
+
+def synthetic_corpus(n: int, dimensions: int, clusters: int = 200, seed: int = 7) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    decay = 1 / np.sqrt(np.arange(1, dimensions + 1))
+    centers = rng.standard_normal((clusters, dimensions)) * decay
+    members = rng.integers(0, clusters, n)
+    vectors = centers[members] + 0.6 * rng.standard_normal((n, dimensions)) * decay
+    return normalize(vectors.astype(np.float32))
+
+
+def cache_corpus(directory: str) -> np.ndarray:
+    vectors = [np.fromfile(path, dtype="<f4") for path in sorted(glob.glob(os.path.join(directory, "*")))
+               if not path.endswith(".tmp")]
+    dimensions = max(len(vector) for vector in vectors)
+    return normalize(np.stack([vector for vector in vectors if len(vector) == dimensions]))
+
+
+def top_k(corpus: np.ndarray, queries: np.ndarray, k: int) -> tuple:
+    started = time.perf_counter()
+    scores = queries @ corpus.T
+    indices = np.argpartition(-scores, k, axis=1)[:, :k]
+    return indices, time.perf_counter() - started
+
+
+def recall(reference: np.ndarray, found: np.ndarray) -> float:
+    hits = sum(len(set(expected) & set(actual)) for expected, actual in zip(reference, found))
+    return hits / reference.size
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--vectors", help="corpus as a .npy file")
+    parser.add_argument("--cache-dir", help="corpus from an embedding cache directory")
+    parser.add_argument("--size", type=int, default=20000, help="synthetic corpus size")
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--noise", type=float, default=0.5, help="query noise relative to a unit vector")
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--dimensions", default="1536,1024,512,256")
+    args = parser.parse_args()
+
+    if args.vectors:
+        corpus = normalize(np.load(args.vectors).astype(np.float32))
+    elif args.cache_dir:
+        corpus = cache_corpus(args.cache_dir)
+    else:
+        corpus = synthetic_corpus(args.size, 1536)
+
+    rng = np.random.default_rng(11)
+    sample = corpus[rng.integers(0, len(corpus), args.queries)]
+    noise = rng.standard_normal(sample.shape).astype(np.float32)
+    queries = normalize(sample + args.noise * normalize(noise))
+
+    full_dimensions = corpus.shape[1]
+    print(f"Corpus: {len(corpus)} vectors of {full_dimensions} dimensions, {len(queries)} queries, k={args.k}")
+
+    reference, reference_seconds = top_k(corpus, queries, args.k)
+    print(f"{'dimensions':>10} {'quantization':>12} {'recall@k':>9} {'bytes/vector':>12} {'search ms/query':>15}")
+    print(f"{full_dimensions:>10} {'none':>12} {1.0:>9.3f} {4 * full_dimensions:>12} "
+          f"{1000 * reference_seconds / len(queries):>15.3f}")
+
+    for dimensions in (int(value) for value in args.dimensions.split(",")):
+        if dimensions > full_dimensions:
+            continue
+        for quantization in ("none", "int8"):
+            if dimensions == full_dimensions and quantization == "none":
+                continue
+            compression = EmbeddingCompression(dimensions, "truncate", quantization)
+            stored = np.asarray(compression.apply(corpus), dtype=np.float32)
+            queried = np.asarray(compression.apply(queries), dtype=np.float32)
+            found, seconds = top_k(stored, queried, args.k)
+
+            bytes_per_vector = dimensions + 4 if quantization == "int8" else 4 * dimensions
+            print(f"{dimensions:>10} {quantization:>12} {recall(reference, found):>9.3f} "
+                  f"{bytes_per_vector:>12} {1000 * seconds / len(queries):>15.3f}")
+
+
+if __name__ == "__main__":
+    main()
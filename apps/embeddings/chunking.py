@@ -0,0 +1,145 @@
+"""
+Token-aware transcript chunking for the embeddings service.
+
+Chunks are built from whole transcript segments. Segment sizes are counted
+in tokens of the embedding model once, and chunk boundaries are found with
+two pointers over the prefix sums of those counts, so chunking is linear in
+the number of segments. The overlap between consecutive chunks consists of
+whole trailing segments of the previous chunk, and every chunk carries the
+exact start of its first and end of its last segment. iter_chunks works
+on a stream of segments and yields chunks while the stream is still read.
+"""
+import itertools
+import logging
+from typing import Dict, Iterable, Iterator, List, Sequence
+
+logger = logging.getLogger()
+
+# Encoding of the OpenAI embedding models (text-embedding-ada-002, text-embedding-3-*)
+TOKEN_ENCODING = "cl100k_base"
+
+_ENCODING = None
+
+
+def _get_encoding():
+    global _ENCODING
+
+    if _ENCODING is None:
+        try:
+            # pylint: disable=import-error,import-outside-toplevel
+            # tiktoken comes with langchain-openai from the Lambda layer
+            import tiktoken
+            # pylint: enable=import-error,import-outside-toplevel
+            _ENCODING = tiktoken.get_encoding(TOKEN_ENCODING)
+        except ImportError:
+            logger.warning("tiktoken not available, estimating token counts from characters")
+            _ENCODING = False
+
+    return _ENCODING
+
+
+def count_tokens(texts: Sequence[str]) -> List[int]:
+    """
+    Returns the token count of every text. Falls back to an estimate of
+    four characters per token when tiktoken is not installed.
+    """
+    encoding = _get_encoding()
+
+    if not encoding:
+        return [len(text) // 4 + 1 for text in texts]
+
+    return [len(tokens) for tokens in encoding.encode_ordinary_batch(list(texts))]
+
+
+def iter_chunks(
+    transcript_segments: Iterable[Dict[str, float | str]],
+    chunk_size: int = 250,
+    chunk_overlap: int = 25,
+    block_size: int = 256
+) -> Iterator[Dict[str, float | str]]:
+    """
+    Yields the chunks of a stream of transcript segments, see chunk_transcript.
+
+    Segments are pulled and token-counted in blocks of block_size, and only
+    the segments from the start of the current chunk on are kept, so memory
+    is bounded by the chunk size and the block size, not the transcript.
+    """
+    source = iter(transcript_segments)
+    # Segments from absolute index base on, prefix[k] is the token count of
+    # segments [0, base + k) of the whole stream
+    window = []
+    prefix = [0]
+    base = 0
+
+    def _have(index: int) -> bool:
+        """Loads segments until the segment at the absolute index is in the window."""
+        while index - base >= len(window):
+            block = list(itertools.islice(source, block_size))
+            if not block:
+                return False
+            texts = [segment["text"].strip() for segment in block]
+            for segment, text, tokens in zip(block, texts, count_tokens(texts)):
+                window.append((segment["start"], segment["end"], text))
+                prefix.append(prefix[-1] + tokens)
+        return True
+
+    def _tokens(first: int, last: int) -> int:
+        return prefix[last - base] - prefix[first - base]
+
+    first = 0
+    last = 0
+    overlap_first = 0
+
+    while _have(first):
+        # Every chunk takes at least one segment after the previous chunk,
+        # then extends while the next segment still fits
+        last += 1
+        # Drop overlap segments that would push that segment over the chunk size
+        while first < last - 1 and _tokens(first, last) > chunk_size:
+            first += 1
+        while _have(last) and _tokens(first, last + 1) <= chunk_size:
+            last += 1
+
+        yield {
+            "text": " ".join(text for _, _, text in window[first - base:last - base] if text),
+            "start": window[first - base][0],
+            "end": window[last - base - 1][1],
+            "tokens": _tokens(first, last)
+        }
+
+        if not _have(last):
+            break
+
+        # The next chunk starts with the longest run of trailing segments within the overlap,
+        # but always after the start of this chunk so every step makes progress
+        overlap_first = max(overlap_first, first + 1)
+        while _tokens(overlap_first, last) > chunk_overlap:
+            overlap_first += 1
+        first = overlap_first
+
+        del window[:first - base]
+        del prefix[:first - base]
+        base = first
+
+
+def chunk_transcript(
+    transcript_segments: List[Dict[str, float | str]],
+    chunk_size: int = 250,
+    chunk_overlap: int = 25
+) -> List[Dict[str, float | str]]:
+    """
+    Splits transcript segments into chunks of whole segments.
+
+    Args:
+        transcript_segments: List of dicts with keys 'text' (str), 'start' (float), 'end' (float)
+        chunk_size: max tokens per chunk, a single longer segment forms a chunk on its own
+        chunk_overlap: max tokens of trailing segments repeated at the start of the next chunk
+
+    Returns:
+        List of dicts with keys:
+          - 'text' (str): the chunk text
+          - 'start' (float): start time of the first segment of the chunk
+          - 'end' (float): end time of the last segment of the chunk
+          - 'tokens' (int): token count of the chunk segments
+    """
+    return list(iter_chunks(transcript_segments, chunk_size, chunk_overlap))
@@ -0,0 +1,232 @@
+"""
+Persistent embedding cache for the embeddings service.
+
+Embeddings are keyed by the SHA-256 of the embedding model name and the
+normalized chunk text (Unicode NFKC, collapsed whitespace), so identical
+text across re-processed videos or a course series is embedded only once.
+
+Two tiers are looked up in order:
+
+- A local on-disk tier in /tmp with LRU eviction above a byte budget. It
+  lives as long as the warm Lambda container.
+- An optional S3 tier shared by all containers. Hits from S3 are copied
+  into the disk tier.
+
+Vectors are stored as raw little-endian float32. Cache failures are logged
+and treated as misses, they never fail an embedding job.
+"""
+import hashlib
+import logging
+import os
+import re
+import threading
+import unicodedata
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Sequence
+
+from botocore.exceptions import ClientError
+
+import numpy as np  # pylint: disable=import-error
+
+from s3_objects import get_bytes, put_bytes
+
+logger = logging.getLogger()
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_text(text: str) -> str:
+    """Normalizes text before hashing, so formatting differences share an entry."""
+    return _WHITESPACE.sub(" ", unicodedata.normalize("NFKC", text)).strip()
+
+
+def embedding_key(text: str, model: str) -> str:
+    """Cache key of the embedding of text by model."""
+    return hashlib.sha256(f"{model}\0{normalize_text(text)}".encode("utf-8")).hexdigest()
+
+
+def _encode(values: Sequence[float]) -> bytes:
+    return np.asarray(values, dtype="<f4").tobytes()
+
+
+def _decode(data: bytes) -> List[float]:
+    return np.frombuffer(data, dtype="<f4").tolist()
+
+
+class DiskLRUTier:
+    """
+    Local cache directory with least-recently-used eviction.
+
+    The recency order is kept in memory and rebuilt from file modification
+    times when a new container finds an existing directory.
+    """
+
+    def __init__(self, directory: str, max_bytes: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.size = 0
+        self._lock = threading.Lock()
+
+        os.makedirs(directory, exist_ok=True)
+        files = []
+        for name in os.listdir(directory):
+            if name.endswith(".tmp"):
+                continue
+            stat = os.stat(os.path.join(directory, name))
+            files.append((stat.st_mtime, name, stat.st_size))
+
+        for _, name, size in sorted(files):
+            self.entries[name] = size
+            self.size += size
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key)
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            if key not in self.entries:
+                return None
+            self.entries.move_to_end(key)
+
+        try:
+            with open(self._path(key), "rb") as f:
+                data = f.read()
+            os.utime(self._path(key))
+            return data
+        except OSError:
+            with self._lock:
+                self.size -= self.entries.pop(key, 0)
+            return None
+
+    def put(self, key: str, data: bytes) -> None:
+        if len(data) > self.max_bytes:
+            return
+
+        try:
+            # Write and rename, so a concurrent reader never sees a partial file
+            temporary_path = f"{self._path(key)}.{threading.get_ident()}.tmp"
+            with open(temporary_path, "wb") as f:
+                f.write(data)
+            os.replace(temporary_path, self._path(key))
+        except OSError as e:
+            logger.warning("Embedding cache write to disk failed: %s", e)
+            return
+
+        with self._lock:
+            self.size += len(data) - self.entries.pop(key, 0)
+            self.entries[key] = len(data)
+
+            while self.size > self.max_bytes and self.entries:
+                evicted, size = self.entries.popitem(last=False)
+                self.size -= size
+                try:
+                    os.remove(self._path(evicted))
+                except OSError:
+                    pass
+
+
+class EmbeddingCache:
+    """
+    Two-tier embedding cache.
+
+    Attributes:
+        model (str): Embedding model name, part of every key
+        disk (DiskLRUTier): Local tier, None when disabled
+        bucket (str): S3 bucket of the shared tier
+        prefix (str): Key prefix of the shared tier, empty disables it
+        stats (dict): Lookups, disk hits, S3 hits and misses since creation
+    """
+
+    def __init__(self, model: str, disk_directory: str = "/tmp/embedding-cache",
+                 disk_max_bytes: int = 256 * 1024 * 1024, bucket: Optional[str] = None,
+                 prefix: str = "", max_workers: int = 16):
+        self.model = model
+        self.disk = DiskLRUTier(disk_directory, disk_max_bytes) if disk_max_bytes > 0 else None
+        self.bucket = bucket
+        self.prefix = prefix.strip("/") if bucket else ""
+        self.max_workers = max_workers
+        self.stats = {"lookups": 0, "disk_hits": 0, "s3_hits": 0, "misses": 0}
+        self._lock = threading.Lock()
+
+    def _s3_key(self, key: str) -> str:
+        return f"{self.prefix}/{self.model}/{key}.f32"
+
+    def _s3_get(self, key: str) -> Optional[bytes]:
+        try:
+            return get_bytes(self.bucket, self._s3_key(key))
+        except ClientError as e:
+            logger.warning("Embedding cache lookup of %s failed: %s", key, e)
+            return None
+
+    def _s3_put(self, key: str, data: bytes) -> None:
+        try:
+            put_bytes(self.bucket, self._s3_key(key), data)
+        except ClientError as e:
+            logger.warning("Embedding cache store of %s failed: %s", key, e)
+
+    def get_many(self, texts: Sequence[str]) -> Dict[int, List[float]]:
+        """Returns the cached embeddings by position in texts, misses are left out."""
+        keys = [embedding_key(text, self.model) for text in texts]
+        found = {}
+        disk_hits = 0
+
+        if self.disk is not None:
+            for position, key in enumerate(keys):
+                data = self.disk.get(key)
+                if data is not None:
+                    found[position] = data
+            disk_hits = len(found)
+
+        remaining = [position for position in range(len(keys)) if position not in found]
+        s3_hits = 0
+
+        if self.prefix and remaining:
+            with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                results = executor.map(self._s3_get, [keys[position] for position in remaining])
+                for position, data in zip(remaining, results):
+                    if data is None:
+                        continue
+                    found[position] = data
+                    s3_hits += 1
+                    if self.disk is not None:
+                        self.disk.put(keys[position], data)
+
+        with self._lock:
+            self.stats["lookups"] += len(keys)
+            self.stats["disk_hits"] += disk_hits
+            self.stats["s3_hits"] += s3_hits
+            self.stats["misses"] += len(keys) - len(found)
+
+        return {position: _decode(data) for position, data in found.items()}
+
+    def put_many(self, texts: Sequence[str], embeddings: Sequence[Sequence[float]]) -> None:
+        """Stores fresh embeddings in every enabled tier."""
+        entries = [(embedding_key(text, self.model), _encode(values))
+                   for text, values in zip(texts, embeddings)]
+
+        if self.disk is not None:
+            for key, data in entries:
+                self.disk.put(key, data)
+
+        if self.prefix and entries:
+            with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                list(executor.map(lambda entry: self._s3_put(*entry), entries))
+
+    def hit_rate(self) -> float:
+        """Share of lookups served by any tier."""
+        with self._lock:
+            lookups = self.stats["lookups"]
+            hits = self.stats["disk_hits"] + self.stats["s3_hits"]
+        return hits / lookups if lookups else 0.0
+
+    def log_stats(self) -> None:
+        with self._lock:
+            stats = dict(self.stats)
+
+        logger.info(
+            "Embedding cache: %d lookups, %d disk hits, %d S3 hits, %d misses (hit rate %.1f%%)",
+            stats["lookups"], stats["disk_hits"], stats["s3_hits"], stats["misses"],
+            100 * self.hit_rate()
+        )
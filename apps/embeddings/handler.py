@@ -2,108 +2,372 @@
 AWS Lambda handler for processing video transcripts and creating embeddings.
 
 This module handles the embedding generation process for video transcripts.
-It downloads transcripts from S3, chunks them, and upserts the embeddings to Pinecone.
+It streams transcripts from S3 (or downloads them), chunks them, and upserts the
+embeddings to Pinecone.
+
+SQS messages carry an "action":
+
+- "index" (default): embeds the transcript of a video.
+- "reindex": re-embeds a video with its recorded transcript unless it was
+  embedded with the current parameters already, or "force" is set.
+- "delete": deletes the vectors and lexical document of a video.
+
+A direct invocation with {"reindexRoom": {"knowledgeRoomId": ...}} re-embeds
+the videos of a knowledge room whose vectors were created with other
+parameters, see reindex_room.
 """
 import json
 import logging
 import os
-import boto3
-from pinecone_client import init_client, upsert_chunks_to_pinecone
-from helper import chunk_transcript, update_video_status, download_from_s3
+import time
+from typing import Any, Dict, Optional
+
+from bootstrap import load_and_set_api_keys
+from openai_scheduler import get_scheduler
+from pinecone_client import (
+    EmbeddingJob, delete_stale_sections, delete_stale_vectors, delete_video_vectors, embed_and_upsert,
+    init_client, log_cache_stats
+)
+from reindex import (
+    INDEX_EMBEDDING, estimate_cost, fingerprint, index_parameters, indexed_count, indexed_section_count,
+    is_current, job_index
+)
+from transcript_format import iter_transcript_segments, read_transcript_segments
+from chunking import iter_chunks
+from progress import create_progress_reporter
+from sqs_batch import batch_item_failures, process_sqs_records
+from helper import (
+    update_video_status, download_from_s3, open_s3_object,
+    read_embedding_index, write_embedding_index, set_embedding_index_state,
+    delete_embedding_index, list_room_videos
+)
 
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
-secretsmanager = boto3.client("secretsmanager")
-
 S3_BUCKET_NAME = os.environ.get("S3_VIDEO_BUCKET_NAME")
+# Number of SQS records of a batch processed concurrently
+EMBEDDINGS_RECORD_WORKERS = int(os.environ.get("EMBEDDINGS_RECORD_WORKERS", "4"))
+# "invocation" embeds the chunks of all records of an invocation in shared requests, "record" per record
+EMBEDDINGS_BATCH_MODE = os.environ.get("EMBEDDINGS_BATCH_MODE", "invocation")
+# Chunk size and overlap in tokens of the embedding model
+EMBEDDINGS_CHUNK_TOKENS = int(os.environ.get("EMBEDDINGS_CHUNK_TOKENS", "250"))
+EMBEDDINGS_CHUNK_OVERLAP_TOKENS = int(os.environ.get("EMBEDDINGS_CHUNK_OVERLAP_TOKENS", "25"))
+# "stream" chunks transcripts while they are read from S3, "download" saves them to /tmp first
+EMBEDDINGS_INGEST_MODE = os.environ.get("EMBEDDINGS_INGEST_MODE", "stream")
+# Videos embedded together by a room re-index, and the time left to the Lambda timeout below
+# which it stops starting new batches (the remaining videos are re-indexed by the next invocation)
+EMBEDDINGS_REINDEX_BATCH_VIDEOS = int(os.environ.get("EMBEDDINGS_REINDEX_BATCH_VIDEOS", "10"))
+EMBEDDINGS_REINDEX_MIN_REMAINING_SECONDS = int(os.environ.get("EMBEDDINGS_REINDEX_MIN_REMAINING_SECONDS", "180"))
+
+INDEX_PARAMETERS = index_parameters(EMBEDDINGS_CHUNK_TOKENS, EMBEDDINGS_CHUNK_OVERLAP_TOKENS)
+INDEX_FINGERPRINT = fingerprint(INDEX_PARAMETERS)
+
+
+class VideoJob(EmbeddingJob):
+    """
+    Embedding job of a video with its transcript key and the embedding index
+    of its previous run, None for a video embedded the first time.
+    """
+
+    def __init__(self, chunks, transcript_key: str, previous_index: Optional[Dict[str, Any]], **kwargs):
+        super().__init__(chunks, **kwargs)
+        self.transcript_key = transcript_key
+        self.previous_index = previous_index
+
+
+def stream_transcript_chunks(transcript_key: str):
+    """
+    Yields the chunks of a transcript while it is read from S3. The object
+    is only opened once the first chunk is requested.
+    """
+    body = open_s3_object(S3_BUCKET_NAME, transcript_key)
+    try:
+        yield from iter_chunks(
+            iter_transcript_segments(body),
+            chunk_size=EMBEDDINGS_CHUNK_TOKENS,
+            chunk_overlap=EMBEDDINGS_CHUNK_OVERLAP_TOKENS
+        )
+    finally:
+        body.close()
+
+
+def download_transcript_chunks(video_id: str, transcript_key: str) -> list:
+    """Downloads a transcript to /tmp and returns its chunks."""
+    base_tmp_path = f"/tmp/{video_id}"
+    os.makedirs(base_tmp_path, exist_ok=True)
+
+    input_path = f"{base_tmp_path}/{os.path.basename(transcript_key)}"
+    download_from_s3(S3_BUCKET_NAME, transcript_key, input_path)
+
+    # Compact binary or plain JSON format
+    return list(iter_chunks(
+        read_transcript_segments(input_path),
+        chunk_size=EMBEDDINGS_CHUNK_TOKENS,
+        chunk_overlap=EMBEDDINGS_CHUNK_OVERLAP_TOKENS
+    ))
+
+
+def prepare_record(record: dict) -> Optional[VideoJob]:
+    """
+    Creates the embedding job of the transcript of a single SQS record for
+    its knowledge room namespace in Pinecone. In the "stream" ingest mode
+    the transcript is read and chunked lazily while the job is embedded.
+
+    Returns None when there is nothing to embed: for a "delete" action,
+    which is carried out here, and for a "reindex" of a video that is
+    embedded with the current parameters already.
+    """
+    body = json.loads(record["body"])
+    action = body.get("action", "index")
+    video_id = body["videoId"]
+    user_id = body["userId"]
+    knowledge_room_id = body["knowledgeRoomId"]
+    namespace = f"{user_id}_{knowledge_room_id}"
+
+    if action not in ("index", "reindex", "delete"):
+        raise ValueError(f"Unknown action {action!r}")
+
+    previous_index = read_embedding_index(knowledge_room_id, video_id)
+
+    if action == "delete":
+        delete_video_vectors(namespace, video_id, count=indexed_count(previous_index),
+                             section_count=indexed_section_count(previous_index))
+        if previous_index is not None:
+            delete_embedding_index(knowledge_room_id, video_id)
+        return None
+
+    if action == "reindex" and not body.get("force") and is_current(previous_index, INDEX_FINGERPRINT):
+        logger.info("Video %s is embedded with the current parameters, skipping", video_id)
+        return None
+
+    transcript_key = body.get("transcriptKey") or (previous_index or {}).get("transcriptKey")
+    if not transcript_key:
+        raise ValueError(f"No transcript key known for video {video_id}")
+
+    if previous_index is not None:
+        # Until the run completes, more chunks than recorded may have been upserted
+        set_embedding_index_state(knowledge_room_id, video_id, INDEX_EMBEDDING)
 
-def get_api_key_from_secret(secret_arn: str) -> str:
+    if EMBEDDINGS_INGEST_MODE == "stream":
+        chunks = stream_transcript_chunks(transcript_key)
+    else:
+        chunks = download_transcript_chunks(video_id, transcript_key)
+
+    return VideoJob(
+        chunks,
+        transcript_key=transcript_key,
+        previous_index=previous_index,
+        namespace=namespace,
+        user_id=user_id,
+        video_id=video_id,
+        knowledge_room_id=knowledge_room_id,
+        progress=create_progress_reporter(knowledge_room_id, video_id, "embeddings")
+    )
+
+
+def complete_job(job: VideoJob) -> None:
+    """
+    Deletes the vectors of chunks the video no longer has, records its
+    embedding index with the cost of the run and marks the video as done.
     """
-    Retrieves a secret string (API key) from AWS Secrets Manager.
+    # Without a recorded chunk count, e.g. for videos embedded before it was recorded, they are looked up
+    delete_stale_vectors(job.namespace, job.video_id, job.count, indexed_count(job.previous_index))
+    delete_stale_sections(job.namespace, job.video_id, job.section_count, indexed_section_count(job.previous_index))
 
-    Args:
-        secret_arn (str): The ARN of the secret in AWS Secrets Manager.
+    index = job_index(job, INDEX_PARAMETERS, job.transcript_key)
+    write_embedding_index(job.knowledge_room_id, job.video_id, index)
+    logger.info(
+        "Embedded video %s: %d chunks (%d cached), %d tokens embedded, estimated cost $%.4f, %.1fs",
+        job.video_id, job.count, job.cached, job.embedded_tokens, index["estimatedCost"], job.seconds
+    )
 
-    Returns:
-        str: The secret string stored in Secrets Manager.
+    update_video_status(
+        knowledge_room_id=job.knowledge_room_id,
+        video_id=job.video_id,
+        new_status="DONE"
+    )
 
-    Raises:
-        ValueError: If the secret is not found or the response format is invalid.
+
+def process_record(record: dict) -> None:
+    """
+    Chunks the transcript of a single SQS record and upserts the chunks
+    into its knowledge room namespace in Pinecone.
     """
-    response = secretsmanager.get_secret_value(SecretId=secret_arn)
-    if "SecretString" in response:
-        return response["SecretString"]
-    raise ValueError("Secret not found or invalid format")
+    job = prepare_record(record)
+    if job is None:
+        return
+
+    embed_and_upsert([job])
+    if job.error is not None:
+        raise job.error
+
+    complete_job(job)
+
+
+def process_records_batched(records: list, jobs: Optional[dict] = None) -> list:
+    """
+    Processes all records of an invocation with shared embedding requests.
+
+    Transcripts are prepared concurrently, then the chunks of every video
+    are embedded together in requests up to the API batch limits and routed
+    back to the namespace of their video. Failures stay isolated per record.
+    The jobs are collected in jobs by message id when it is given.
+    Returns the message ids of the failed records.
+    """
+    jobs = {} if jobs is None else jobs
+
+    def _prepare(record: dict) -> None:
+        job = prepare_record(record)
+        if job is not None:
+            jobs[record["messageId"]] = job
+
+    failed_message_ids = process_sqs_records(records, _prepare, max_workers=EMBEDDINGS_RECORD_WORKERS)
 
+    embed_and_upsert(list(jobs.values()))
 
-def load_and_set_api_keys() -> None:
+    embedded = []
+    for record in records:
+        job = jobs.get(record["messageId"])
+        if job is None:
+            continue
+        if job.error is not None:
+            failed_message_ids.append(record["messageId"])
+        else:
+            embedded.append(record)
+
+    failed_message_ids += process_sqs_records(
+        embedded, lambda record: complete_job(jobs[record["messageId"]]),
+        max_workers=EMBEDDINGS_RECORD_WORKERS
+    )
+
+    return failed_message_ids
+
+
+def reindex_room(knowledge_room_id: str, force: bool = False, dry_run: bool = False,
+                 context=None) -> Dict[str, Any]:
     """
-    Loads API keys from AWS Secrets Manager based on environment variables
-    'PINECONE_SECRET_ARN' and 'OPENAI_SECRET_ARN', then sets them into
-    environment variables 'PINECONE_API_KEY' and 'OPENAI_API_KEY' respectively.
+    Re-embeds the videos of a knowledge room whose embedding index has
+    another fingerprint than the current parameters (all of them with
+    force), e.g. after the chunk size changed. Unchanged videos cost
+    nothing. Videos without an embedding index, embedded before it was
+    recorded or not embedded yet, have no known transcript key and are
+    reported as unknown; an "index" message re-embeds them.
 
-    Raises:
-        KeyError: If the required environment variables are not set.
-        ValueError: If any secret is not found or invalid.
+    Videos are embedded in batches of EMBEDDINGS_REINDEX_BATCH_VIDEOS.
+    Close to the Lambda timeout no further batches are started; as done
+    videos are current afterwards, invoking the re-index again continues
+    with the rest. A dry run only reports the videos to re-embed and the
+    estimated cost from the tokens of their previous run.
+
+    Returns a report of the videos, embedded tokens, estimated cost and
+    duration, which is logged as well.
     """
-    pinecone_secret_arn = os.environ["PINECONE_SECRET_ARN"]
-    openai_secret_arn = os.environ["OPENAI_SECRET_ARN"]
+    started = time.perf_counter()
+    videos = list_room_videos(knowledge_room_id)
+    outdated = [video for video in videos
+                if video["embeddingIndex"] is not None and video["userId"]
+                and (force or not is_current(video["embeddingIndex"], INDEX_FINGERPRINT))]
+    unknown = [video["videoId"] for video in videos if video["embeddingIndex"] is None]
+
+    report = {
+        "knowledgeRoomId": knowledge_room_id,
+        "fingerprint": INDEX_FINGERPRINT,
+        "videos": len(videos),
+        "outdated": len(outdated),
+        "unknown": unknown,
+        "reindexed": [],
+        "failed": [],
+        "remaining": [],
+        "embeddedTokens": 0,
+        "estimatedCost": 0.0
+    }
+
+    if dry_run:
+        tokens = sum(video["embeddingIndex"].get("tokens", 0) for video in outdated)
+        report["remaining"] = [video["videoId"] for video in outdated]
+        report["estimatedTokens"] = tokens
+        report["estimatedCost"] = estimate_cost(tokens)
+    else:
+        batch_size = max(1, EMBEDDINGS_REINDEX_BATCH_VIDEOS)
+        for first in range(0, len(outdated), batch_size):
+            batch = outdated[first:first + batch_size]
+            if (context is not None
+                    and context.get_remaining_time_in_millis() < 1000 * EMBEDDINGS_REINDEX_MIN_REMAINING_SECONDS):
+                report["remaining"] = [video["videoId"] for video in outdated[first:]]
+                break
 
-    pinecone_api_key = get_api_key_from_secret(pinecone_secret_arn)
-    openai_api_key = get_api_key_from_secret(openai_secret_arn)
+            records = [{
+                "messageId": video["videoId"],
+                "body": json.dumps({
+                    "action": "reindex",
+                    "force": True,
+                    "videoId": video["videoId"],
+                    "userId": video["userId"],
+                    "knowledgeRoomId": knowledge_room_id
+                })
+            } for video in batch]
+            jobs = {}
+            failed = set(process_records_batched(records, jobs))
 
-    os.environ["PINECONE_API_KEY"] = pinecone_api_key
-    os.environ["OPENAI_API_KEY"] = openai_api_key
+            for video in batch:
+                job = jobs.get(video["videoId"])
+                if video["videoId"] in failed:
+                    report["failed"].append(video["videoId"])
+                    continue
+                report["reindexed"].append({
+                    "videoId": video["videoId"],
+                    "chunks": job.count,
+                    "previousChunks": video["embeddingIndex"].get("chunkCount"),
+                    "embeddedTokens": job.embedded_tokens,
+                    "cachedChunks": job.cached,
+                    "estimatedCost": estimate_cost(job.embedded_tokens),
+                    "seconds": round(job.seconds, 2)
+                })
+                report["embeddedTokens"] += job.embedded_tokens
+
+        report["estimatedCost"] = estimate_cost(report["embeddedTokens"])
+
+    report["seconds"] = round(time.perf_counter() - started, 2)
+    logger.info("Re-index of room %s: %s", knowledge_room_id, json.dumps(report))
+    return report
 
 
 def lambda_handler(event: dict, _context=None) -> dict:
     """
     AWS Lambda handler function to process incoming records containing video transcripts,
     split the transcripts into chunks, and upsert them into a Pinecone index.
+
+    In the "invocation" batch mode (default) the chunks of all records share
+    embedding requests, in the "record" mode every record is processed on
+    its own, concurrently with the others. Failed records are reported as
+    batchItemFailures so SQS only redelivers those messages.
     """
-    load_and_set_api_keys()
+    load_and_set_api_keys(
+        PINECONE_API_KEY="PINECONE_SECRET_ARN",
+        OPENAI_API_KEY="OPENAI_SECRET_ARN"
+    )
     init_client()
 
-    for record in event.get("Records", []):
-        try:
-            body = json.loads(record["body"])
-            video_id = body["videoId"]
-            user_id = body["userId"]
-            knowledge_room_id = body["knowledgeRoomId"]
-            transcript_key = body["transcriptKey"]
-
-            # 1. Download transcript from S3
-            base_tmp_path = f"/tmp/{video_id}"
-            os.makedirs(base_tmp_path, exist_ok=True)
-
-            input_path = f"{base_tmp_path}/{os.path.basename(transcript_key)}"
-            download_from_s3(S3_BUCKET_NAME, transcript_key, input_path)
-
-            # 2. Load transcript
-            with open(input_path, "r", encoding="utf-8") as f:
-                transcript = json.load(f)
-
-            transcript_segments = transcript.get("segments", [])
-
-            chunks = chunk_transcript(
-                transcript_segments, chunk_size=1000, chunk_overlap=100
-            )
-
-            namespace = f"{user_id}_{knowledge_room_id}"
-            upsert_chunks_to_pinecone(
-                chunks, namespace, user_id, video_id, knowledge_room_id
-            )
-
-            update_video_status(
-                knowledge_room_id=knowledge_room_id,
-                video_id=video_id,
-                new_status="DONE"
-            )
-        except Exception as e:
-            logger.error("Error processing record: %s", e)
-
-    return {
-        'statusCode': 200,
-        'body': json.dumps({'message': 'Done!'})
-    }
+    if "reindexRoom" in event:
+        request = event["reindexRoom"]
+        report = reindex_room(
+            request["knowledgeRoomId"], force=request.get("force", False),
+            dry_run=request.get("dryRun", False), context=_context
+        )
+        get_scheduler().log_stats()
+        log_cache_stats()
+        return report
+
+    records = event.get("Records", [])
+
+    if EMBEDDINGS_BATCH_MODE == "invocation":
+        failed_message_ids = process_records_batched(records)
+    else:
+        failed_message_ids = process_sqs_records(
+            records, process_record, max_workers=EMBEDDINGS_RECORD_WORKERS
+        )
+    get_scheduler().log_stats()
+    log_cache_stats()
+
+    return batch_item_failures(failed_message_ids)
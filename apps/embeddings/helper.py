@@ -3,11 +3,14 @@ Helper functions for the embeddings service.
 """
 import logging
 import os
-from typing import List, Dict
+from decimal import Decimal
+from typing import List, Optional
 
 import boto3
+from boto3.dynamodb.types import TypeDeserializer, TypeSerializer
 from botocore.exceptions import ClientError
 
+
 logger = logging.getLogger()
 
 dynamodb = boto3.client("dynamodb")
@@ -28,82 +31,157 @@ def download_from_s3(bucket: str, key: str, local_path: str) -> None:
         raise
 
 
-def chunk_transcript(
-    transcript_segments: List[Dict[str, float | str]],
-    chunk_size: int = 1000,
-    chunk_overlap: int = 200
-) -> List[Dict[str, float | str]]:
+def open_s3_object(bucket: str, key: str):
+    """
+    Opens an S3 object as a readable stream, so it can be processed while
+    it downloads instead of being written to /tmp first.
     """
-    Splits transcript segments into chunks with specified
-    chunk_size and chunk_overlap (in characters).
+    try:
+        logger.info("Streaming s3://%s/%s", bucket, key)
+        return s3.get_object(Bucket=bucket, Key=key)["Body"]
+    except ClientError as e:
+        logger.error("Failed to open file from S3: %s", e)
+        raise
+
 
-    Args:
-        transcript_segments: List of dicts with keys 'text' (str), 'start' (float), 'end' (float)
-        chunk_size: max characters per chunk
-        chunk_overlap: characters to overlap between chunks
+def _video_key(knowledge_room_id: str, video_id: str) -> dict:
+    return {
+        "PK": {"S": f"ROOM#{knowledge_room_id}"},
+        "SK": {"S": f"VIDEO#{video_id}"}
+    }
 
-    Returns:
-        List of dicts with keys:
-          - 'text' (str): the chunk text
-          - 'start' (float): start time of chunk
-          - 'end' (float): end time of chunk
+
+def update_video_status(knowledge_room_id: str, video_id: str, new_status: str) -> dict:
     """
-    chunks: List[Dict[str, float | str]] = []
-    current_chunk_text: str = ""
-    current_chunk_start: float | None = None
-    current_chunk_end: float | None = None
+    Updates the video status in DynamoDB.
+    """
+    try:
+        return dynamodb.update_item(
+            TableName=DDB_TABLE_NAME,
+            Key=_video_key(knowledge_room_id, video_id),
+            UpdateExpression="SET metadata.#status = :new_status",
+            ExpressionAttributeNames={"#status": "status"},
+            ExpressionAttributeValues={":new_status": {"S": new_status}}
+        )
+    except ClientError as e:
+        logger.error("Error updating video status: %s", e)
+        raise
 
-    i = 0
-    n = len(transcript_segments)
 
-    while i < n:
-        segment = transcript_segments[i]
-        segment_text = segment["text"]
+def _from_item(value: dict) -> dict:
+    """Deserializes a DynamoDB map, numbers become ints or floats."""
+    python_value = TypeDeserializer().deserialize(value)
+    return {
+        key: (int(item) if item == item.to_integral_value() else float(item))
+        if isinstance(item, Decimal) else item
+        for key, item in python_value.items()
+    }
 
-        if current_chunk_start is None:
-            current_chunk_start = segment["start"]
 
-        current_chunk_text += segment_text + " "
-        current_chunk_end = segment["end"]
+def read_embedding_index(knowledge_room_id: str, video_id: str) -> Optional[dict]:
+    """
+    Reads the embedding index of a video, the record of how its vectors
+    were created (see write_embedding_index). None if the video was not
+    embedded yet.
+    """
+    try:
+        response = dynamodb.get_item(
+            TableName=DDB_TABLE_NAME,
+            Key=_video_key(knowledge_room_id, video_id),
+            ProjectionExpression="metadata.embeddingIndex"
+        )
+    except ClientError as e:
+        logger.error("Error reading the embedding index of video %s: %s", video_id, e)
+        raise
 
-        if len(current_chunk_text) >= chunk_size:
-            chunks.append({
-                "text": current_chunk_text.strip(),
-                "start": current_chunk_start,
-                "end": current_chunk_end,    
-            })
+    index = response.get("Item", {}).get("metadata", {}).get("M", {}).get("embeddingIndex")
+    return _from_item(index) if index else None
 
-            # Overlap text for next chunk
-            overlap_text = current_chunk_text[-chunk_overlap:]
-            current_chunk_text = overlap_text
-            current_chunk_start = current_chunk_end - 1 if current_chunk_end is not None else 0
 
-        i += 1
+def write_embedding_index(knowledge_room_id: str, video_id: str, index: dict) -> None:
+    """
+    Stores the embedding index of a video under metadata.embeddingIndex:
+    its chunk count, which gives the ids of its vectors, and the parameters
+    and cost of the embedding run. Flat maps of strings and numbers only.
+    """
+    value = {
+        key: Decimal(str(round(item, 6))) if isinstance(item, float) else item
+        for key, item in index.items()
+    }
+    try:
+        dynamodb.update_item(
+            TableName=DDB_TABLE_NAME,
+            Key=_video_key(knowledge_room_id, video_id),
+            UpdateExpression="SET metadata.embeddingIndex = :index",
+            ExpressionAttributeValues={":index": TypeSerializer().serialize(value)}
+        )
+    except ClientError as e:
+        logger.error("Error writing the embedding index of video %s: %s", video_id, e)
+        raise
+
 
-    if current_chunk_text.strip():
-        chunks.append({
-            "text": current_chunk_text.strip(),
-            "start": current_chunk_start if current_chunk_start is not None else 0,
-            "end": current_chunk_end if current_chunk_end is not None else 0,
-        })
+def set_embedding_index_state(knowledge_room_id: str, video_id: str, state: str) -> None:
+    """
+    Sets the state of an existing embedding index, e.g. while a video is
+    re-embedded and its recorded chunk count may be exceeded.
+    """
+    try:
+        dynamodb.update_item(
+            TableName=DDB_TABLE_NAME,
+            Key=_video_key(knowledge_room_id, video_id),
+            UpdateExpression="SET metadata.embeddingIndex.#state = :state",
+            ExpressionAttributeNames={"#state": "state"},
+            ExpressionAttributeValues={":state": {"S": state}}
+        )
+    except ClientError as e:
+        logger.error("Error updating the embedding index of video %s: %s", video_id, e)
+        raise
 
-    return chunks
 
-def update_video_status(knowledge_room_id: str, video_id: str, new_status: str) -> dict:
+def delete_embedding_index(knowledge_room_id: str, video_id: str) -> None:
     """
-    Updates the video status in DynamoDB.
+    Removes the embedding index of a video once its vectors were deleted.
     """
     try:
-        return dynamodb.update_item(
+        dynamodb.update_item(
             TableName=DDB_TABLE_NAME,
-            Key={
-                "PK": {"S": f"ROOM#{knowledge_room_id}"},
-                "SK": {"S": f"VIDEO#{video_id}"}
-            },
-            UpdateExpression="SET metadata.#status = :new_status",
-            ExpressionAttributeNames={"#status": "status"},
-            ExpressionAttributeValues={":new_status": {"S": new_status}}
+            Key=_video_key(knowledge_room_id, video_id),
+            UpdateExpression="REMOVE metadata.embeddingIndex"
         )
     except ClientError as e:
-        logger.error("Error updating video status: %s", e)
+        logger.error("Error deleting the embedding index of video %s: %s", video_id, e)
+        raise
+
+
+def list_room_videos(knowledge_room_id: str) -> List[dict]:
+    """
+    Lists the videos of a knowledge room with their userId and embedding
+    index (None for videos not embedded yet).
+    """
+    videos = []
+    kwargs = {
+        "TableName": DDB_TABLE_NAME,
+        "KeyConditionExpression": "PK = :pk AND begins_with(SK, :sk)",
+        "ExpressionAttributeValues": {
+            ":pk": {"S": f"ROOM#{knowledge_room_id}"},
+            ":sk": {"S": "VIDEO#"}
+        },
+        "ProjectionExpression": "SK, userId, metadata.embeddingIndex"
+    }
+
+    try:
+        while True:
+            response = dynamodb.query(**kwargs)
+            for item in response.get("Items", []):
+                index = item.get("metadata", {}).get("M", {}).get("embeddingIndex")
+                videos.append({
+                    "videoId": item["SK"]["S"].removeprefix("VIDEO#"),
+                    "userId": item.get("userId", {}).get("S"),
+                    "embeddingIndex": _from_item(index) if index else None
+                })
+            if "LastEvaluatedKey" not in response:
+                return videos
+            kwargs["ExclusiveStartKey"] = response["LastEvaluatedKey"]
+    except ClientError as e:
+        logger.error("Error listing the videos of room %s: %s", knowledge_room_id, e)
         raise
@@ -1,76 +1,535 @@
 """
 Pinecone client module for handling vector embeddings and storage.
+
+Vectors are written through the vector store of VECTOR_STORE_BACKEND,
+Pinecone or the self-hosted NumPy index (see shared/python/vector_store.py).
 """
+import itertools
+import math
 import os
 import logging
-from typing import List, Dict, Any
+import threading
+import time
+from collections.abc import Sized
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, as_completed, wait
+from typing import List, Dict, Any, Iterable, Iterator, Optional
+
+import numpy as np  # pylint: disable=import-error
 # pylint: disable=import-error
 # These imports come from the Lambda layer and are not available during local development
 from pinecone import Pinecone
 from langchain_openai import OpenAIEmbeddings
-from langchain_pinecone import PineconeVectorStore
 # pylint: enable=import-error
 
+from embedding_cache import EmbeddingCache
+from embedding_compression import get_compression
+from lexical_index import LexicalDocument, create_lexical_storage
+from openai_scheduler import estimate_tokens
+from progress import ProgressReporter
+from scheduled_embeddings import ScheduledEmbeddings
+from vector_store import VECTOR_STORE_BACKEND, VectorStore, create_vector_store, section_namespace, vector_id
+
 logger = logging.getLogger()
 
 PC = None
 EMBEDDING_MODEL = None
+EMBEDDING_CACHE = None
+EMBEDDING_COMPRESSION = None
 PINECONE_INDEX = None
+VECTOR_STORE: Optional[VectorStore] = None
+LEXICAL_STORAGE = None
 
-PINECONE_INDEX_NAME = os.environ["PINECONE_INDEX_NAME"]
+PINECONE_INDEX_NAME = os.environ.get("PINECONE_INDEX_NAME")
+EMBEDDING_MODEL_NAME = os.environ.get("EMBEDDING_MODEL_NAME", "text-embedding-ada-002")
+# Byte budget of the local embedding cache in /tmp, 0 disables it
+EMBEDDING_CACHE_DISK_BYTES = int(os.environ.get("EMBEDDING_CACHE_DISK_BYTES", str(256 * 1024 * 1024)))
+# S3 prefix of the shared embedding cache, empty disables it
+EMBEDDING_CACHE_S3_PREFIX = os.environ.get("EMBEDDING_CACHE_S3_PREFIX", "")
+# Texts and tokens per embedding request, and embedding requests in flight
+EMBEDDING_BATCH_SIZE = int(os.environ.get("EMBEDDING_BATCH_SIZE", "256"))
+EMBEDDING_BATCH_TOKENS = int(os.environ.get("EMBEDDING_BATCH_TOKENS", "100000"))
+EMBEDDING_CONCURRENCY = int(os.environ.get("EMBEDDING_CONCURRENCY", "4"))
+# Vectors per upsert request, and upsert requests in flight
+UPSERT_BATCH_SIZE = int(os.environ.get("UPSERT_BATCH_SIZE", "100"))
+UPSERT_CONCURRENCY = int(os.environ.get("UPSERT_CONCURRENCY", "4"))
+# Consecutive chunks per section vector searched first by the chats service, 0 disables sections
+EMBEDDING_SECTION_CHUNKS = int(os.environ.get("EMBEDDING_SECTION_CHUNKS", "8"))
 
 
 def init_client():
-    """Initialize Pinecone client and embedding model."""
-    global PC, EMBEDDING_MODEL, PINECONE_INDEX
+    """Initialize the vector store and embedding model."""
+    global PC, EMBEDDING_MODEL, EMBEDDING_CACHE, EMBEDDING_COMPRESSION, PINECONE_INDEX, VECTOR_STORE, LEXICAL_STORAGE
 
-    if PC is not None and EMBEDDING_MODEL is not None and PINECONE_INDEX is not None:
+    if EMBEDDING_MODEL is not None and VECTOR_STORE is not None:
         # already initialized
         return
 
-    pinecone_api_key = os.environ.get("PINECONE_API_KEY")
+    if VECTOR_STORE_BACKEND == "pinecone":
+        pinecone_api_key = os.environ.get("PINECONE_API_KEY")
 
-    if not pinecone_api_key:
-        raise ValueError("PINECONE_API_KEY not set in environment variables")
+        if not pinecone_api_key:
+            raise ValueError("PINECONE_API_KEY not set in environment variables")
 
-    PC = Pinecone(api_key=pinecone_api_key)
+        PC = Pinecone(api_key=pinecone_api_key)
+        PINECONE_INDEX = PC.Index(PINECONE_INDEX_NAME)
 
     openai_api_key = os.environ.get("OPENAI_API_KEY")
 
     if not openai_api_key:
         raise ValueError("OPENAI_API_KEY not set in environment variables")
 
-    EMBEDDING_MODEL = OpenAIEmbeddings(openai_api_key=openai_api_key)
+    # Local compression runs after the cache, so cached embeddings keep full precision
+    EMBEDDING_COMPRESSION = get_compression()
+
+    # Requests are rate limited and retried by the shared OpenAI scheduler
+    EMBEDDING_MODEL = ScheduledEmbeddings(
+        OpenAIEmbeddings(model=EMBEDDING_MODEL_NAME, openai_api_key=openai_api_key, max_retries=0,
+                         dimensions=EMBEDDING_COMPRESSION.api_dimensions)
+    )
+
+    if EMBEDDING_CACHE_DISK_BYTES > 0 or EMBEDDING_CACHE_S3_PREFIX:
+        EMBEDDING_CACHE = EmbeddingCache(
+            EMBEDDING_COMPRESSION.cache_model(EMBEDDING_MODEL_NAME),
+            disk_max_bytes=EMBEDDING_CACHE_DISK_BYTES,
+            bucket=os.environ.get("S3_VIDEO_BUCKET_NAME"),
+            prefix=EMBEDDING_CACHE_S3_PREFIX
+        )
+
+    VECTOR_STORE = create_vector_store(PINECONE_INDEX)
+    # Lexical documents for the hybrid search of the chats service
+    LEXICAL_STORAGE = create_lexical_storage()
+
+
+def log_cache_stats() -> None:
+    """Logs the hit rates of the embedding cache."""
+    if EMBEDDING_CACHE is not None:
+        EMBEDDING_CACHE.log_stats()
+
+
+class EmbeddingJob:
+    """
+    Chunks of one video to embed and upsert into its namespace.
+
+    The chunks may be a list or a lazy iterable, such as the chunks of a
+    transcript streamed from S3. A lazy iterable is consumed once, while
+    its chunks are embedded.
+
+    With section_chunks, every section_chunks consecutive chunks also form
+    a section, whose vector is the normalized mean of the embeddings of its
+    chunks. Section vectors are upserted into the section namespace once
+    all chunks of the section are embedded, and cost no embedding requests.
+
+    Attributes:
+        error (Exception): First error of the job, None while it succeeds
+        count (int): Number of chunks read so far
+        ids (list): Ids of the upserted vectors once the job succeeded
+        lexical (LexicalDocument): Term statistics of the embedded chunks, None
+            without a lexical index
+        embedded_tokens (int): Tokens of the chunks sent to the embedding API
+        cached (int): Number of chunks found in the embedding cache
+        cached_tokens (int): Tokens of the chunks found in the embedding cache
+        section_chunks (int): Chunks per section, 0 without sections
+        seconds (float): Time from reading the first chunk until all jobs
+            of the run were upserted
+    """
+
+    def __init__(self, chunks: Iterable[Dict[str, Any]], namespace: str, user_id: str, video_id: str,
+                 knowledge_room_id: str, progress: Optional[ProgressReporter] = None):
+        self.chunks = chunks
+        self.namespace = namespace
+        self.user_id = user_id
+        self.video_id = video_id
+        self.knowledge_room_id = knowledge_room_id
+        self.progress = progress
+        self.error = None
+        self.count = 0
+        self.ids = []
+        self.lexical = None
+        self.embedded_tokens = 0
+        self.cached = 0
+        self.cached_tokens = 0
+        self.started = None
+        self.seconds = 0.0
+        self.section_chunks = 0
+        self._sections = {}
+        self._pending = []
+        self._pending_sections = []
+        self._lock = threading.Lock()
+
+    def fail(self, error: Exception) -> None:
+        with self._lock:
+            if self.error is None:
+                logger.error("Embedding video %s failed: %s", self.video_id, error)
+                self.error = error
+
+    def add_usage(self, embedded_tokens: int = 0, cached_tokens: int = 0, cached: int = 0) -> None:
+        with self._lock:
+            self.embedded_tokens += embedded_tokens
+            self.cached_tokens += cached_tokens
+            self.cached += cached
+
+    def iter_items(self) -> Iterator[tuple]:
+        """
+        Yields the (job, chunk index, chunk) items of the job. An error while
+        reading the chunks fails the job and ends its items, and a failed job
+        stops reading.
+        """
+        self.started = time.perf_counter()
+        try:
+            for i, chunk in enumerate(self.chunks):
+                if self.error is not None:
+                    return
+                self.count = i + 1
+                yield self, i, chunk
+        except Exception as e:  # pylint: disable=broad-except
+            self.fail(e)
+
+    @property
+    def section_count(self) -> int:
+        return math.ceil(self.count / self.section_chunks) if self.section_chunks else 0
+
+    def vector(self, i: int, chunk: Dict[str, Any], values: List[float]) -> Dict[str, Any]:
+        metadata = {
+            "text": chunk["text"],
+            "user_id": self.user_id,
+            "video_id": self.video_id,
+            "knowledge_room_id": self.knowledge_room_id,
+            "start": chunk["start"],
+            "end": chunk["end"],
+            "chunk_index": i
+        }
+        if self.section_chunks:
+            metadata["section_id"] = vector_id(self.video_id, i // self.section_chunks)
+        return {"id": vector_id(self.video_id, i), "values": values, "metadata": metadata}
+
+    def section_vector(self, section_index: int, section: Dict[str, Any]) -> Dict[str, Any]:
+        mean = section["sum"] / max(float(np.linalg.norm(section["sum"])), 1e-12)
+        return {
+            "id": vector_id(self.video_id, section_index),
+            "values": mean.tolist(),
+            "metadata": {
+                "user_id": self.user_id,
+                "video_id": self.video_id,
+                "knowledge_room_id": self.knowledge_room_id,
+                "start": section["start"],
+                "end": section["end"],
+                "section_index": section_index,
+                "chunk_count": section["count"]
+            }
+        }
+
+    def _add_to_sections(self, items: List[tuple]) -> None:
+        for i, chunk, values in items:
+            section_index = i // self.section_chunks
+            section = self._sections.setdefault(section_index, {
+                "sum": 0.0, "count": 0, "start": chunk["start"], "end": chunk["end"]
+            })
+            values = np.asarray(values, dtype=np.float64)
+            section["sum"] = section["sum"] + values / max(float(np.linalg.norm(values)), 1e-12)
+            section["count"] += 1
+            section["start"] = min(section["start"], chunk["start"])
+            section["end"] = max(section["end"], chunk["end"])
+
+            if section["count"] == self.section_chunks:
+                self._pending_sections.append(self.section_vector(section_index, self._sections.pop(section_index)))
+
+    def add_embeddings(self, items: List[tuple]) -> List[tuple]:
+        """
+        Buffers the vectors of (chunk index, chunk, embedding) items and
+        returns the full upsert batches as (namespace, vectors). flush()
+        returns the rest.
+        """
+        if self.progress is not None:
+            self.progress.advance("chunksEmbedded", len(items))
+
+        vectors = [self.vector(i, chunk, values) for i, chunk, values in items]
+        if self.lexical is not None:
+            for vector in vectors:
+                self.lexical.add(vector["id"], vector["metadata"]["text"], vector["metadata"])
+        if self.section_chunks:
+            self._add_to_sections(items)
+
+        self._pending.extend(vectors)
+        batches = []
+        for namespace, pending in ((self.namespace, self._pending),
+                                   (section_namespace(self.namespace), self._pending_sections)):
+            while len(pending) >= UPSERT_BATCH_SIZE:
+                batches.append((namespace, pending[:UPSERT_BATCH_SIZE]))
+                del pending[:UPSERT_BATCH_SIZE]
+        return batches
+
+    def flush(self) -> List[tuple]:
+        """Returns the remaining upsert batches, with the sections of the last chunks."""
+        self._pending_sections.extend(self.section_vector(section_index, section)
+                                      for section_index, section in sorted(self._sections.items()))
+        self._sections = {}
+
+        batches = [(namespace, pending) for namespace, pending in (
+            (self.namespace, self._pending), (section_namespace(self.namespace), self._pending_sections)
+        ) if pending]
+        self._pending = []
+        self._pending_sections = []
+        return batches
+
+
+def _chunk_tokens(chunk: Dict[str, Any]) -> int:
+    return chunk.get("tokens") or estimate_tokens(chunk["text"])
+
+
+def _embedding_batches(items: Iterable[tuple], max_texts: int, max_tokens: int):
+    """Yields the (job, chunk index, chunk) items of every embedding request."""
+    batch = []
+    tokens = 0
+
+    for job, i, chunk in items:
+        chunk_tokens = _chunk_tokens(chunk)
+        if batch and (len(batch) >= max_texts or tokens + chunk_tokens > max_tokens):
+            yield batch
+            batch = []
+            tokens = 0
+        batch.append((job, i, chunk))
+        tokens += chunk_tokens
+
+    if batch:
+        yield batch
+
+
+def _embed_texts(texts: List[str]) -> List[List[float]]:
+    embeddings = EMBEDDING_MODEL.embed_documents(texts)
+    if EMBEDDING_CACHE is not None:
+        EMBEDDING_CACHE.put_many(texts, embeddings)
+    return embeddings
+
+
+def _embed_items(batch: List[tuple]) -> tuple:
+    """
+    Embeds a batch spanning one or more jobs and returns the (job, chunk
+    index, chunk, embedding) items and the number of cache hits.
+
+    Embeddings found in the embedding cache are not requested again. When
+    the shared request fails, the items of every job are retried in a
+    request of their own, so a failing video only fails itself and not the
+    others sharing the batch.
+    """
+    cached = {}
+    if EMBEDDING_CACHE is not None:
+        cached = EMBEDDING_CACHE.get_many([chunk["text"] for _, _, chunk in batch])
+    results = [(job, i, chunk, cached[position])
+               for position, (job, i, chunk) in enumerate(batch) if position in cached]
+    missing = [item for position, item in enumerate(batch) if position not in cached]
+    for job, _, chunk, _ in results:
+        job.add_usage(cached_tokens=_chunk_tokens(chunk), cached=1)
+
+    if not missing:
+        return results, len(cached)
+
+    try:
+        embeddings = _embed_texts([chunk["text"] for _, _, chunk in missing])
+        results.extend((job, i, chunk, values) for (job, i, chunk), values in zip(missing, embeddings))
+        for job, _, chunk in missing:
+            job.add_usage(embedded_tokens=_chunk_tokens(chunk))
+        return results, len(cached)
+    except Exception as e:  # pylint: disable=broad-except
+        jobs = list(dict.fromkeys(job for job, _, _ in missing))
+        if len(jobs) == 1:
+            jobs[0].fail(e)
+            return results, len(cached)
+
+        logger.warning("Embedding batch of %d videos failed (%s), retrying per video", len(jobs), e)
 
-    PINECONE_INDEX = PC.Index(PINECONE_INDEX_NAME)
+    for job in jobs:
+        job_items = [(i, chunk) for batch_job, i, chunk in missing if batch_job is job]
+        try:
+            embeddings = _embed_texts([chunk["text"] for _, chunk in job_items])
+            results.extend((job, i, chunk, values) for (i, chunk), values in zip(job_items, embeddings))
+            job.add_usage(embedded_tokens=sum(_chunk_tokens(chunk) for _, chunk in job_items))
+        except Exception as e:  # pylint: disable=broad-except
+            job.fail(e)
+    return results, len(cached)
+
+
+def _embed_batch(batch: List[tuple]) -> tuple:
+    """Embeds a batch like _embed_items and compresses the embeddings for storage."""
+    results, hits = _embed_items(batch)
+
+    if results and EMBEDDING_COMPRESSION is not None and EMBEDDING_COMPRESSION.enabled:
+        embeddings = EMBEDDING_COMPRESSION.apply([values for _, _, _, values in results])
+        results = [(job, i, chunk, values) for (job, i, chunk, _), values in zip(results, embeddings)]
+
+    return results, hits
+
+
+def _upsert_vectors(job: EmbeddingJob, namespace: str, vectors: List[Dict[str, Any]]) -> None:
+    if job.error is not None:
+        return
+
+    try:
+        VECTOR_STORE.upsert(vectors, namespace)
+    except Exception as e:  # pylint: disable=broad-except
+        job.fail(e)
+        return
+
+    if job.progress is not None and namespace == job.namespace:
+        job.progress.advance("vectorsUpserted", len(vectors))
+
+
+def embed_and_upsert(jobs: List[EmbeddingJob]) -> None:
+    """
+    Embeds the chunks of all jobs in shared requests, upserts every vector
+    into the namespace of its job and the section vectors into the section
+    namespace of the job.
+
+    Chunks are read lazily and embedded and upserted concurrently, with a
+    bounded number of requests queued, so a streamed transcript is never
+    held in memory as a whole. The lexical document of every succeeded job
+    is stored once its vectors are flushed.
+
+    Args:
+        jobs: Jobs of the videos to embed. A failed job stops reading and
+            upserting while the other jobs continue.
+
+    Returns:
+        None, the outcome is recorded on every job: error, ids, embedded
+        and cached tokens and seconds.
+    """
+    started = time.perf_counter()
+    n_cached = 0
+
+    for job in jobs:
+        if job.progress is not None and isinstance(job.chunks, Sized):
+            job.progress.set_total(len(job.chunks))
+        if LEXICAL_STORAGE is not None:
+            job.lexical = LexicalDocument()
+        job.section_chunks = EMBEDDING_SECTION_CHUNKS
+
+    items = itertools.chain.from_iterable(job.iter_items() for job in jobs)
+    upsert_slots = threading.BoundedSemaphore(2 * UPSERT_CONCURRENCY)
+
+    def _upsert_and_release(job: EmbeddingJob, namespace: str, vectors: List[Dict[str, Any]]) -> None:
+        try:
+            _upsert_vectors(job, namespace, vectors)
+        finally:
+            upsert_slots.release()
+
+    with ThreadPoolExecutor(max_workers=EMBEDDING_CONCURRENCY) as embed_pool, \
+            ThreadPoolExecutor(max_workers=UPSERT_CONCURRENCY) as upsert_pool:
+
+        def _submit_upsert(job: EmbeddingJob, namespace: str, vectors: List[Dict[str, Any]]) -> None:
+            # Blocks while the upsert queue is full
+            upsert_slots.acquire()  # pylint: disable=consider-using-with
+            upsert_pool.submit(_upsert_and_release, job, namespace, vectors)
+
+        def _route(future) -> None:
+            nonlocal n_cached
+            results, hits = future.result()
+            n_cached += hits
+
+            by_job = {}
+            for job, i, chunk, values in results:
+                by_job.setdefault(job, []).append((i, chunk, values))
+
+            for job, job_items in by_job.items():
+                for namespace, vectors in job.add_embeddings(job_items):
+                    _submit_upsert(job, namespace, vectors)
+
+        embed_futures = set()
+        for batch in _embedding_batches(items, EMBEDDING_BATCH_SIZE, EMBEDDING_BATCH_TOKENS):
+            if len(embed_futures) >= 2 * EMBEDDING_CONCURRENCY:
+                done, embed_futures = wait(embed_futures, return_when=FIRST_COMPLETED)
+                for future in done:
+                    _route(future)
+            embed_futures.add(embed_pool.submit(_embed_batch, batch))
+
+        for future in as_completed(embed_futures):
+            _route(future)
+
+        for job in jobs:
+            for namespace, vectors in job.flush():
+                _submit_upsert(job, namespace, vectors)
+
+    try:
+        VECTOR_STORE.flush()
+    except Exception as e:  # pylint: disable=broad-except
+        for job in jobs:
+            job.fail(e)
+
+    for job in jobs:
+        if job.error is None and job.lexical is not None:
+            try:
+                LEXICAL_STORAGE.put(job.namespace, job.video_id, job.lexical)
+            except Exception as e:  # pylint: disable=broad-except
+                job.fail(e)
+
+    elapsed = time.perf_counter() - started
+    n_vectors = sum(job.count for job in jobs if job.error is None)
+    logger.info("Upserted %d vectors of %d videos in %.2fs (%.1f vectors/s, %d embeddings cached)",
+                n_vectors, len(jobs), elapsed, n_vectors / max(elapsed, 1e-9), n_cached)
+
+    finished = time.perf_counter()
+    for job in jobs:
+        if job.started is not None:
+            job.seconds = finished - job.started
+        if job.error is None:
+            job.ids = [vector_id(job.video_id, i) for i in range(job.count)]
+        if job.progress is not None:
+            if not isinstance(job.chunks, Sized):
+                job.progress.set_total(job.count)
+            job.progress.flush()
 
 
 def upsert_chunks_to_pinecone(
-    chunks: List[Dict[str, Any]],
+    chunks: Iterable[Dict[str, Any]],
     namespace: str,
     user_id: str,
     video_id: str,
     knowledge_room_id: str,
-):
-    """Upsert text chunks to Pinecone vector store with metadata."""
-    docs = []
-    metadatas = []
-
-    for i, chunk in enumerate(chunks):
-        docs.append(chunk["text"])
-        metadatas.append({
-            "user_id": user_id,
-            "video_id": video_id,
-            "knowledge_room_id": knowledge_room_id,
-            "start": chunk["start"],
-            "end": chunk["end"],
-            "chunk_index": i
-        })
-
-    PineconeVectorStore.from_texts(
-        texts=docs,
-        embedding=EMBEDDING_MODEL,
-        index_name=PINECONE_INDEX_NAME,
-        metadatas=metadatas,
-        namespace=namespace
-    )
+    progress: Optional[ProgressReporter] = None,
+) -> List[str]:
+    """
+    Embeds the text chunks of one video and upserts them to Pinecone with
+    metadata, see embed_and_upsert.
+
+    Returns the ids of the upserted vectors.
+    """
+    job = EmbeddingJob(chunks, namespace, user_id, video_id, knowledge_room_id, progress)
+    embed_and_upsert([job])
+
+    if job.error is not None:
+        raise job.error
+
+    return job.ids
+
+
+def delete_video_vectors(namespace: str, video_id: str, count: Optional[int] = None,
+                         section_count: Optional[int] = None) -> None:
+    """
+    Deletes the vectors, section vectors and the lexical document of a
+    video. With the chunk and section counts recorded when the video was
+    embedded, the vector ids are known and deleted in batches, otherwise
+    they are looked up by id prefix, and vectors of the video written
+    before the ids were deterministic by its video_id metadata.
+    """
+    VECTOR_STORE.delete_video(video_id, namespace, count=count)
+    if section_count != 0:
+        VECTOR_STORE.delete_video(video_id, section_namespace(namespace), count=section_count)
+    if LEXICAL_STORAGE is not None:
+        LEXICAL_STORAGE.delete(namespace, video_id)
+    logger.info("Deleted the vectors of video %s from %s", video_id, namespace)
+
+
+def delete_stale_vectors(namespace: str, video_id: str, count: int, previous_count: Optional[int]) -> None:
+    """
+    Deletes the vectors from chunk index count on, left over when a video
+    was re-embedded into fewer chunks than before, the other vectors were
+    overwritten by id. previous_count is the chunk count of the previous
+    run, None when it is unknown and the vectors are looked up instead.
+    """
+    if previous_count is not None and previous_count <= count:
+        return
+    VECTOR_STORE.delete_video(video_id, namespace, count=previous_count, start=count)
+
+
+def delete_stale_sections(namespace: str, video_id: str, section_count: int,
+                          previous_section_count: Optional[int]) -> None:
+    """Deletes the section vectors left over from a previous run, see delete_stale_vectors."""
+    delete_stale_vectors(section_namespace(namespace), video_id, section_count, previous_section_count)
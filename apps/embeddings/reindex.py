@@ -0,0 +1,96 @@
+"""
+Embedding index records of videos, used to delete and re-index one video.
+
+When a video is embedded, the metadata.embeddingIndex map of its DynamoDB
+item records its chunk count, so the ids of its vectors ({video_id}#0 up to
+{video_id}#{chunkCount - 1}) and of its section vectors are known without
+listing the vector store, and
+the parameters its vectors were created with. The fingerprint of these
+parameters tells which videos a change of the chunking, the embedding model
+or the compression affects, so a re-index only re-embeds those.
+"""
+import hashlib
+import json
+import math
+import os
+import time
+from typing import Any, Dict, Optional
+
+from chunking import TOKEN_ENCODING
+from embedding_compression import get_compression
+from pinecone_client import EMBEDDING_MODEL_NAME, EMBEDDING_SECTION_CHUNKS, EmbeddingJob
+
+# Price of the embedding model in USD per million tokens, for the cost reported per video
+EMBEDDING_PRICE_PER_MILLION_TOKENS = float(os.environ.get("EMBEDDING_PRICE_PER_MILLION_TOKENS", "0.10"))
+
+# States of an embedding index, a video is re-embedded while it is EMBEDDING
+INDEX_EMBEDDING = "EMBEDDING"
+INDEX_DONE = "DONE"
+
+
+def index_parameters(chunk_tokens: int, chunk_overlap: int) -> Dict[str, Any]:
+    """The parameters that determine the vectors of a video."""
+    compression = get_compression()
+    return {
+        "chunkTokens": chunk_tokens,
+        "chunkOverlapTokens": chunk_overlap,
+        "tokenEncoding": TOKEN_ENCODING,
+        "embeddingModel": EMBEDDING_MODEL_NAME,
+        "dimensions": compression.dimensions,
+        "reduction": compression.reduction,
+        "quantization": compression.quantization,
+        "sectionChunks": EMBEDDING_SECTION_CHUNKS
+    }
+
+
+def fingerprint(parameters: Dict[str, Any]) -> str:
+    return hashlib.sha256(json.dumps(parameters, sort_keys=True).encode("utf-8")).hexdigest()[:16]
+
+
+def estimate_cost(tokens: int) -> float:
+    """Embedding cost in USD of a number of tokens."""
+    return tokens * EMBEDDING_PRICE_PER_MILLION_TOKENS / 1_000_000
+
+
+def is_current(index: Optional[Dict[str, Any]], current_fingerprint: str) -> bool:
+    """Whether a video was completely embedded with the current parameters."""
+    return (index is not None and index.get("state") == INDEX_DONE
+            and index.get("fingerprint") == current_fingerprint)
+
+
+def indexed_count(index: Optional[Dict[str, Any]]) -> Optional[int]:
+    """
+    The number of vectors of a video, None when unknown: before its first
+    embedding index, or after an interrupted run that may have upserted
+    more chunks than recorded.
+    """
+    if index is None or index.get("state") != INDEX_DONE:
+        return None
+    return index.get("chunkCount")
+
+
+def indexed_section_count(index: Optional[Dict[str, Any]]) -> Optional[int]:
+    """The number of section vectors of a video, None when unknown like in indexed_count."""
+    count = indexed_count(index)
+    if count is None:
+        return None
+    section_chunks = index.get("sectionChunks", 0)
+    return math.ceil(count / section_chunks) if section_chunks else 0
+
+
+def job_index(job: EmbeddingJob, parameters: Dict[str, Any], transcript_key: str) -> Dict[str, Any]:
+    """The embedding index of a completed job, with the cost and duration of its run."""
+    return {
+        **parameters,
+        "state": INDEX_DONE,
+        "fingerprint": fingerprint(parameters),
+        "chunkCount": job.count,
+        "sectionCount": job.section_count,
+        "transcriptKey": transcript_key,
+        "tokens": job.embedded_tokens + job.cached_tokens,
+        "embeddedTokens": job.embedded_tokens,
+        "cachedChunks": job.cached,
+        "estimatedCost": estimate_cost(job.embedded_tokens),
+        "seconds": job.seconds,
+        "indexedAt": int(time.time())
+    }
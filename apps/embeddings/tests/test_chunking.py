@@ -0,0 +1,114 @@
+"""
+Tests of the transcript chunker. Tokens are counted as words, so the tests
+do not depend on tiktoken being installed.
+"""
+import pytest
+
+import chunking
+from chunking import chunk_transcript, iter_chunks
+
+
+@pytest.fixture(autouse=True)
+def word_tokens(monkeypatch):
+    monkeypatch.setattr(chunking, "count_tokens", lambda texts: [len(text.split()) for text in texts])
+
+
+def segments(*sizes):
+    """One segment per size, of that many words, one second each."""
+    return [
+        {"text": " ".join(f"w{i}" for _ in range(size)), "start": float(i), "end": float(i + 1)}
+        for i, size in enumerate(sizes)
+    ]
+
+
+def spans(chunks):
+    """(first, last) segment index of every chunk, from its timestamps."""
+    return [(int(chunk["start"]), int(chunk["end"]) - 1) for chunk in chunks]
+
+
+def test_chunks_carry_text_timestamps_and_tokens():
+    chunks = list(iter_chunks(segments(2, 3, 4), chunk_size=5, chunk_overlap=0))
+
+    assert chunks == [
+        {"text": "w0 w0 w1 w1 w1", "start": 0.0, "end": 2.0, "tokens": 5},
+        {"text": "w2 w2 w2 w2", "start": 2.0, "end": 3.0, "tokens": 4},
+    ]
+
+
+def test_overlap_repeats_trailing_segments():
+    chunks = list(iter_chunks(segments(*[10] * 7), chunk_size=30, chunk_overlap=10))
+
+    assert spans(chunks) == [(0, 2), (2, 4), (4, 6)]
+    assert all(chunk["tokens"] == 30 for chunk in chunks)
+
+
+def test_overlap_is_trimmed_to_fit_the_next_segment():
+    # The overlap of segments 1 and 2 would push segment 3 over the chunk size
+    chunks = list(iter_chunks(segments(10, 10, 10, 25), chunk_size=30, chunk_overlap=20))
+
+    assert spans(chunks) == [(0, 2), (3, 3)]
+    assert chunks[1]["tokens"] == 25
+
+
+def test_overlap_is_partly_trimmed():
+    chunks = list(iter_chunks(segments(10, 10, 10, 15), chunk_size=30, chunk_overlap=20))
+
+    assert spans(chunks) == [(0, 2), (2, 3)]
+    assert chunks[1]["tokens"] == 25
+
+
+def test_segment_over_chunk_size_forms_a_chunk_on_its_own():
+    chunks = list(iter_chunks(segments(5, 50, 5), chunk_size=20, chunk_overlap=10))
+
+    assert spans(chunks) == [(0, 0), (1, 1), (2, 2)]
+    assert [chunk["tokens"] for chunk in chunks] == [5, 50, 5]
+
+
+@pytest.mark.parametrize("chunk_overlap", [20, 25, 1000])
+def test_overlap_not_below_chunk_size_still_advances(chunk_overlap):
+    chunks = list(iter_chunks(segments(*[10] * 6), chunk_size=20, chunk_overlap=chunk_overlap))
+
+    # Every chunk starts one segment after the previous one
+    assert spans(chunks) == [(0, 1), (1, 2), (2, 3), (3, 4), (4, 5)]
+
+
+def test_empty_segments_are_left_out_of_the_text():
+    transcript = [
+        {"text": " Hello ", "start": 0.0, "end": 1.0},
+        {"text": "   ", "start": 1.0, "end": 2.0},
+        {"text": "world", "start": 2.0, "end": 3.5},
+    ]
+
+    assert chunk_transcript(transcript, chunk_size=10, chunk_overlap=0) == [
+        {"text": "Hello world", "start": 0.0, "end": 3.5, "tokens": 2}
+    ]
+
+
+def test_empty_transcript_has_no_chunks():
+    assert not list(iter_chunks([]))
+
+
+@pytest.mark.parametrize("block_size", [1, 2, 3, 4, 5, 7])
+def test_chunks_do_not_depend_on_block_boundaries(block_size):
+    sizes = [3, 8, 1, 12, 5, 5, 2, 9, 4, 6, 7, 1, 1, 10, 3]
+    expected = list(iter_chunks(segments(*sizes), chunk_size=15, chunk_overlap=6, block_size=256))
+
+    assert list(iter_chunks(segments(*sizes), chunk_size=15, chunk_overlap=6, block_size=block_size)) == expected
+    assert len(expected) > 3
+
+
+def test_reads_the_stream_one_block_at_a_time():
+    read = []
+
+    def stream():
+        for segment in segments(*[10] * 40):
+            read.append(segment)
+            yield segment
+
+    chunks = iter_chunks(stream(), chunk_size=30, chunk_overlap=0, block_size=4)
+
+    assert spans([next(chunks)]) == [(0, 2)]
+    # The first chunk needs segments 0 to 3, which is one block
+    assert len(read) == 4
+    assert len(list(chunks)) == 13
+    assert len(read) == 40
@@ -0,0 +1,256 @@
+"""
+Tests of embedding and upserting chunks: the embedding cache, the retry of
+shared embedding requests per video, the vector ids, the compression of the
+stored vectors and the section vectors. The embedding model and the vector
+store are fakes.
+"""
+import zlib
+
+import numpy as np
+import pytest
+
+import pinecone_client
+from embedding_cache import EmbeddingCache
+from embedding_compression import EmbeddingCompression
+from pinecone_client import EmbeddingJob, embed_and_upsert, upsert_chunks_to_pinecone
+from vector_store import NumpyStore, VectorStore, section_namespace
+
+DIMENSIONS = 8
+NAMESPACE = "room"
+
+
+def embedding(text: str) -> list:
+    """Deterministic full-precision embedding of a text."""
+    return np.random.default_rng(zlib.crc32(text.encode("utf-8"))).normal(size=DIMENSIONS).tolist()
+
+
+class FakeEmbeddings:
+    """Embedding model recording its requests, failing every request with a text of fail_on."""
+
+    def __init__(self, fail_on: str = ""):
+        self.fail_on = fail_on
+        self.requests = []
+
+    def embed_documents(self, texts: list) -> list:
+        self.requests.append(list(texts))
+        if self.fail_on and any(self.fail_on in text for text in texts):
+            raise RuntimeError("Embedding request failed")
+        return [embedding(text) for text in texts]
+
+    @property
+    def texts(self) -> list:
+        return [text for request in self.requests for text in request]
+
+
+class FakeStore(VectorStore):
+    """Vectors by namespace and id."""
+
+    def __init__(self):
+        self.vectors = {}
+
+    def upsert(self, vectors, namespace):
+        self.vectors.setdefault(namespace, {}).update({vector["id"]: vector for vector in vectors})
+
+
+def chunks(video_id: str, count: int) -> list:
+    return [{"text": f"{video_id} chunk {i}", "start": 10.0 * i, "end": 10.0 * i + 12, "tokens": 3}
+            for i in range(count)]
+
+
+def job(video_id: str, count: int) -> EmbeddingJob:
+    return EmbeddingJob(chunks(video_id, count), NAMESPACE, "user", video_id, "room-id")
+
+
+@pytest.fixture(name="model")
+def fixture_model(monkeypatch):
+    model = FakeEmbeddings()
+    monkeypatch.setattr(pinecone_client, "EMBEDDING_MODEL", model)
+    monkeypatch.setattr(pinecone_client, "EMBEDDING_CACHE", None)
+    monkeypatch.setattr(pinecone_client, "EMBEDDING_COMPRESSION", EmbeddingCompression())
+    monkeypatch.setattr(pinecone_client, "LEXICAL_STORAGE", None)
+    monkeypatch.setattr(pinecone_client, "EMBEDDING_SECTION_CHUNKS", 0)
+    monkeypatch.setattr(pinecone_client, "EMBEDDING_BATCH_SIZE", 4)
+    monkeypatch.setattr(pinecone_client, "UPSERT_BATCH_SIZE", 3)
+    return model
+
+
+@pytest.fixture(name="store")
+def fixture_store(monkeypatch):
+    store = FakeStore()
+    monkeypatch.setattr(pinecone_client, "VECTOR_STORE", store)
+    return store
+
+
+@pytest.fixture(name="cache")
+def fixture_cache(tmp_path, monkeypatch):
+    cache = EmbeddingCache("fake-model", disk_directory=str(tmp_path), disk_max_bytes=1024 * 1024)
+    monkeypatch.setattr(pinecone_client, "EMBEDDING_CACHE", cache)
+    return cache
+
+
+def test_vector_ids_are_deterministic(model, store):
+    ids = upsert_chunks_to_pinecone(chunks("v1", 7), NAMESPACE, "user", "v1", "room-id")
+
+    assert ids == [f"v1#{i}" for i in range(7)]
+    assert upsert_chunks_to_pinecone(chunks("v1", 7), NAMESPACE, "user", "v1", "room-id") == ids
+    # The second run overwrote the vectors of the first
+    assert sorted(store.vectors[NAMESPACE]) == sorted(ids)
+
+
+def test_vectors_carry_the_chunk_metadata(model, store):
+    upsert_chunks_to_pinecone(iter(chunks("v1", 2)), NAMESPACE, "user", "v1", "room-id")
+
+    vector = store.vectors[NAMESPACE]["v1#1"]
+    assert vector["values"] == embedding("v1 chunk 1")
+    assert vector["metadata"] == {
+        "text": "v1 chunk 1", "user_id": "user", "video_id": "v1", "knowledge_room_id": "room-id",
+        "start": 10.0, "end": 22.0, "chunk_index": 1
+    }
+
+
+def test_chunks_of_all_jobs_share_embedding_requests(model, store):
+    jobs = [job("v1", 3), job("v2", 3)]
+
+    embed_and_upsert(jobs)
+
+    assert [len(request) for request in model.requests] == [4, 2]
+    assert all(j.error is None for j in jobs)
+    assert sorted(store.vectors[NAMESPACE]) == [f"{video_id}#{i}" for video_id in ("v1", "v2") for i in range(3)]
+
+
+def test_cached_embeddings_are_not_requested_again(model, store, cache):
+    first = job("v1", 5)
+    embed_and_upsert([first])
+
+    assert len(model.texts) == 5
+    assert (first.cached, first.embedded_tokens) == (0, 15)
+
+    model.requests.clear()
+    second = EmbeddingJob(chunks("v1", 5) + [{"text": "new chunk", "start": 50.0, "end": 60.0, "tokens": 2}],
+                          NAMESPACE, "user", "v1", "room-id")
+    embed_and_upsert([second])
+
+    assert model.texts == ["new chunk"]
+    assert (second.cached, second.cached_tokens, second.embedded_tokens) == (5, 15, 2)
+    assert store.vectors[NAMESPACE]["v1#4"]["values"] == pytest.approx(embedding("v1 chunk 4"))
+    assert cache.stats["misses"] == 6
+    assert cache.stats["disk_hits"] == 5
+
+
+def test_failed_shared_request_is_retried_per_video(model):
+    model.fail_on = "bad"
+    good, bad = job("good", 1), job("bad", 1)
+    batch = [(good, 0, good.chunks[0]), (bad, 0, bad.chunks[0])]
+
+    results, hits = pinecone_client._embed_items(batch)  # pylint: disable=protected-access
+
+    assert [(item[0], item[1]) for item in results] == [(good, 0)]
+    assert hits == 0
+    assert model.requests == [["good chunk 0", "bad chunk 0"], ["good chunk 0"], ["bad chunk 0"]]
+    assert good.error is None and good.embedded_tokens == 3
+    assert isinstance(bad.error, RuntimeError)
+
+
+def test_failed_request_of_one_video_is_not_retried(model):
+    model.fail_on = "bad"
+    bad = job("bad", 2)
+
+    batch = [(bad, i, chunk) for i, chunk in enumerate(bad.chunks)]
+
+    results, _ = pinecone_client._embed_items(batch)  # pylint: disable=protected-access
+
+    assert results == []
+    assert len(model.requests) == 1
+    assert bad.error is not None
+
+
+def test_failing_video_does_not_fail_the_others(model, store):
+    model.fail_on = "bad"
+    jobs = [job("good", 3), job("bad", 3)]
+
+    embed_and_upsert(jobs)
+
+    assert jobs[0].error is None
+    assert jobs[0].ids == ["good#0", "good#1", "good#2"]
+    assert jobs[1].error is not None
+    assert jobs[1].ids == []
+    assert all(vector_id.startswith("good#") for vector_id in store.vectors[NAMESPACE])
+
+
+def test_compressed_vectors_round_trip(model, store, cache, monkeypatch):
+    monkeypatch.setattr(pinecone_client, "EMBEDDING_COMPRESSION",
+                        EmbeddingCompression(dimensions=4, reduction="truncate", quantization="int8"))
+
+    embed_and_upsert([job("v1", 5)])
+
+    for i in range(5):
+        full = np.asarray(embedding(f"v1 chunk {i}"))
+        truncated = full[:4] / np.linalg.norm(full[:4])
+        stored = np.asarray(store.vectors[NAMESPACE][f"v1#{i}"]["values"])
+
+        assert stored.shape == (4,)
+        # int8 codes with a per-vector scale of max / 127
+        assert stored == pytest.approx(truncated, abs=np.abs(truncated).max() / 127)
+        assert float(stored @ truncated) > 0.99
+
+    # The cache keeps the full-precision embeddings of the API
+    assert cache.get_many(["v1 chunk 0"])[0] == pytest.approx(embedding("v1 chunk 0"))
+
+
+def test_section_vectors(model, store, monkeypatch):
+    monkeypatch.setattr(pinecone_client, "EMBEDDING_SECTION_CHUNKS", 2)
+    video = job("v1", 5)
+
+    embed_and_upsert([video])
+
+    sections = store.vectors[section_namespace(NAMESPACE)]
+    assert sorted(sections) == ["v1#0", "v1#1", "v1#2"]
+    assert video.section_count == 3
+    assert [store.vectors[NAMESPACE][f"v1#{i}"]["metadata"]["section_id"] for i in range(5)] == [
+        "v1#0", "v1#0", "v1#1", "v1#1", "v1#2"
+    ]
+
+    units = [np.asarray(embedding(f"v1 chunk {i}")) for i in range(5)]
+    units = [values / np.linalg.norm(values) for values in units]
+    mean = units[2] + units[3]
+    assert sections["v1#1"]["values"] == pytest.approx((mean / np.linalg.norm(mean)).tolist())
+    assert sections["v1#1"]["metadata"] == {
+        "user_id": "user", "video_id": "v1", "knowledge_room_id": "room-id",
+        "start": 20.0, "end": 42.0, "section_index": 1, "chunk_count": 2
+    }
+    # The last section holds the remaining chunk
+    assert sections["v1#2"]["metadata"]["chunk_count"] == 1
+    assert sections["v1#2"]["values"] == pytest.approx(units[4].tolist())
+    # Section vectors cost no embedding requests
+    assert len(model.texts) == 5
+
+
+def test_coarse_to_fine_search_finds_the_flat_top_hit(tmp_path, monkeypatch):
+    """Chunks of a section share a topic, like consecutive chunks of a video."""
+    rng = np.random.default_rng(7)
+    topics = rng.normal(size=(6, DIMENSIONS))
+    chunk_embeddings = {f"v1 chunk {i}": (topics[i // 4] + 0.4 * rng.normal(size=DIMENSIONS)).tolist()
+                        for i in range(24)}
+
+    class TopicEmbeddings:
+        def embed_documents(self, texts):
+            return [chunk_embeddings[text] for text in texts]
+
+    store = NumpyStore(str(tmp_path), search="flat")
+    monkeypatch.setattr(pinecone_client, "EMBEDDING_MODEL", TopicEmbeddings())
+    monkeypatch.setattr(pinecone_client, "EMBEDDING_CACHE", None)
+    monkeypatch.setattr(pinecone_client, "EMBEDDING_COMPRESSION", EmbeddingCompression())
+    monkeypatch.setattr(pinecone_client, "LEXICAL_STORAGE", None)
+    monkeypatch.setattr(pinecone_client, "VECTOR_STORE", store)
+    monkeypatch.setattr(pinecone_client, "EMBEDDING_SECTION_CHUNKS", 4)
+
+    embed_and_upsert([job("v1", 24)])
+
+    for query in np.asarray(list(chunk_embeddings.values())) + 0.2 * rng.normal(size=(24, DIMENSIONS)):
+        flat = store.query(query, top_k=1, namespace=NAMESPACE)
+        # Like the dense search of the chats service: the closest sections, then their chunks
+        sections = store.query(query, top_k=2, namespace=section_namespace(NAMESPACE))
+        coarse = store.query(query, top_k=1, namespace=NAMESPACE,
+                             where={"section_id": [section["id"] for section in sections] + [None]})
+
+        assert coarse[0]["id"] == flat[0]["id"]
@@ -14,7 +14,7 @@ import { useAtom } from 'jotai'
 import { useEffect, useRef, useState } from 'react'
 import VideoSource from './VideoSource'
 import ReactMarkdown from 'react-markdown'
-import { VideoObject } from '@/types'
+import { ChatMessage, VideoObject } from '@/types'
 import VideoPlayerDialog from '../VideoPlayer/VideoPlayer'
 
 export default function MessagesContainer() {
@@ -42,7 +42,17 @@ export default function MessagesContainer() {
     useEffect(() => {
         if (data?.listChatMessages) {
             console.log(data.listChatMessages)
-            setCurrentChatMessages(data.listChatMessages)
+            setCurrentChatMessages(
+                data.listChatMessages.map((message: ChatMessage) =>
+                    message.status === 'FAILED'
+                        ? {
+                              ...message,
+                              content:
+                                  'An error has occurred. Please try again.',
+                          }
+                        : message,
+                ),
+            )
         }
     }, [currentConversation, data, setCurrentChatMessages])
 
@@ -1,4 +1,10 @@
 import { SEND_CHAT_MESSAGE } from '@/graphql/mutations'
+import {
+    getStreamConnectionId,
+    relatedDocumentsOf,
+    stopChatAnswer,
+    streamChatAnswer,
+} from '@/helper/chatStream'
 import {
     currentChatMessagesAtom,
     currentConversationAtom,
@@ -75,6 +81,22 @@ export default function SendMessageContainer() {
             setCurrentChatMessages((prev) => [loadingMessage, ...prev])
         }, 400)
 
+        // Show the answer while it is generated, when connected to the chats WebSocket API
+        const streamConnectionId = await getStreamConnectionId()
+        let streamedAnswer = ''
+        const answer = streamConnectionId
+            ? streamChatAnswer(userMessage.id, (text) => {
+                  clearTimeout(timeout)
+                  streamedAnswer += text
+                  setCurrentChatMessages((prev) => [
+                      { ...loadingMessage, content: streamedAnswer },
+                      ...prev.filter((msg) => msg.id !== 'loading'),
+                  ])
+              })
+            : null
+        // Errors of the stream are handled when the answer is awaited
+        answer?.catch(() => {})
+
         try {
             const res = await client.mutate({
                 mutation: SEND_CHAT_MESSAGE,
@@ -82,19 +104,34 @@ export default function SendMessageContainer() {
                     input: {
                         id: userMessage.id,
                         content: userMessage.content,
+                        streamConnectionId,
                     },
                     knowledgeRoomId: currentKnowledgeRoom?.id,
                     conversationId: currentConversation?.id,
                 },
             })
 
+            let responseMessage: ChatMessage = res.data.sendChatMessage
+
+            // A streamed answer is returned empty and arrives over the connection
+            if (answer && !responseMessage.content) {
+                const final = await answer
+                responseMessage = {
+                    ...responseMessage,
+                    content: final.result?.answer || '',
+                    relatedDocuments: relatedDocumentsOf(final),
+                }
+            } else {
+                stopChatAnswer(userMessage.id)
+            }
+
             clearTimeout(timeout)
 
             setCurrentChatMessages((prev) => {
                 const withoutLoading = prev.filter(
                     (msg) => msg.id !== 'loading',
                 )
-                return [res.data.sendChatMessage, ...withoutLoading]
+                return [responseMessage, ...withoutLoading]
             })
         } catch (e) {
             const errorMessage: ChatMessage = {
@@ -107,6 +144,7 @@ export default function SendMessageContainer() {
                 ).toUTCString(),
             }
             console.error(e)
+            stopChatAnswer(userMessage.id)
             clearTimeout(timeout)
             setCurrentChatMessages((prev) => [
                 errorMessage,
@@ -53,6 +53,7 @@ export const LIST_CHAT_MESSAGES = gql`
                 start
                 end
             }
+            status
             createdAt
         }
     }
@@ -0,0 +1,118 @@
+import { getUserToken } from '@/helper/userToken'
+import { RelatedDocument } from '@/types'
+
+/**
+ * Event posted by the chats Lambda to the WebSocket connection while it
+ * answers the chat message requestId
+ */
+export interface ChatStreamEvent {
+    type: 'tool_start' | 'tool_end' | 'token' | 'final' | 'error'
+    requestId?: string
+    tool?: string
+    text?: string
+    message?: string
+    result?: {
+        answer: string
+        metadata?: { video_id: string; start: number; end: number }[]
+    }
+}
+
+type ChatStreamListener = (event: ChatStreamEvent) => void
+
+let connectionId: Promise<string | null> | null = null
+const listeners = new Map<string, ChatStreamListener>()
+
+/**
+ * Resolves to the id of the connection to the chats WebSocket API,
+ * connecting on first use and after the connection was closed.
+ * Resolves to null when streaming is not configured or the connection
+ * fails, the chat then waits for the complete answer.
+ */
+export function getStreamConnectionId(): Promise<string | null> {
+    const url = process.env.NEXT_PUBLIC_CHATS_WEBSOCKET_URL
+
+    // Check for SSR environment where WebSocket is not available
+    if (!url || typeof window === 'undefined') return Promise.resolve(null)
+    if (connectionId) return connectionId
+
+    connectionId = new Promise((resolve) => {
+        // Browsers cannot set the Authorization header of WebSocket requests,
+        // the authorizer of the $connect route reads the token parameter
+        const socket = new WebSocket(
+            `${url}?token=${encodeURIComponent(getUserToken())}`,
+        )
+
+        // The $default route replies to any message with the connection id
+        socket.onopen = () => {
+            socket.send(JSON.stringify({ action: 'connection' }))
+        }
+
+        socket.onmessage = (e) => {
+            const event = JSON.parse(e.data)
+            if (event.type === 'connection') {
+                resolve(event.connectionId)
+            } else if (event.requestId) {
+                listeners.get(event.requestId)?.(event)
+            }
+        }
+
+        socket.onerror = () => resolve(null)
+
+        // Answers still streaming to the closed connection never arrive
+        socket.onclose = () => {
+            resolve(null)
+            connectionId = null
+            listeners.forEach((listener) =>
+                listener({ type: 'error', message: 'Connection closed' }),
+            )
+            listeners.clear()
+        }
+    })
+
+    return connectionId
+}
+
+/**
+ * Calls onToken with the answer text of the chat message requestId while
+ * it is generated and resolves to the final event, or rejects with the
+ * error event
+ */
+export function streamChatAnswer(
+    requestId: string,
+    onToken: (text: string) => void,
+): Promise<ChatStreamEvent> {
+    return new Promise((resolve, reject) => {
+        listeners.set(requestId, (event) => {
+            if (event.type === 'token' && event.text) {
+                onToken(event.text)
+            } else if (event.type === 'final') {
+                listeners.delete(requestId)
+                resolve(event)
+            } else if (event.type === 'error') {
+                listeners.delete(requestId)
+                reject(new Error(event.message))
+            }
+        })
+    })
+}
+
+/**
+ * Video segments of the metadata of a final event, as the GraphQL API
+ * returns them with the answer
+ */
+export function relatedDocumentsOf(event: ChatStreamEvent): RelatedDocument[] {
+    return (
+        event.result?.metadata?.map((m) => ({
+            videoId: m.video_id,
+            start: m.start,
+            end: m.end,
+        })) || []
+    )
+}
+
+/**
+ * Stops listening to the answer of the chat message requestId
+ */
+export function stopChatAnswer(requestId: string) {
+    listeners.delete(requestId)
+}
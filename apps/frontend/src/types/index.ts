@@ -56,5 +56,7 @@ export interface ChatMessage {
     content: string
     isUserMessage: boolean
     relatedDocuments: RelatedDocument[]
+    // PENDING while a streamed answer is generated, FAILED when it was not
+    status?: string
     createdAt: string
 }
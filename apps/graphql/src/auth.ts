@@ -2,12 +2,9 @@ import { APIGatewayEvent } from 'aws-lambda'
 import { GraphQLError } from 'graphql'
 
 // This is not a real authentication function and should only indicate it.
-export function authenticateUser(event: APIGatewayEvent): {
+export function authenticateToken(token: string | undefined): {
     userId: string
 } {
-    const token =
-        event?.headers?.['Authorization'] || event?.headers?.authorization
-
     if (!token) {
         throw new GraphQLError('Unauthorized: Access denied', {
             extensions: {
@@ -23,3 +20,14 @@ export function authenticateUser(event: APIGatewayEvent): {
         userId: token,
     }
 }
+
+/**
+ * Authenticates requests to the GraphQL API by their Authorization header
+ */
+export function authenticateUser(event: APIGatewayEvent): {
+    userId: string
+} {
+    return authenticateToken(
+        event?.headers?.['Authorization'] || event?.headers?.authorization,
+    )
+}
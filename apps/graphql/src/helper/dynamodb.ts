@@ -1,5 +1,7 @@
 import {
+    DeleteItemCommand,
     DynamoDBClient,
+    GetItemCommand,
     PutItemCommand,
     PutItemCommandInput,
     QueryCommand,
@@ -142,6 +144,8 @@ export async function insertVideo(
 /**
  * Stores chat messages with semantic search references
  * RelatedDocuments contain video segments that were used to generate the response
+ * An answer generated asynchronously is stored PENDING, the chats Lambda
+ * sets its content and its final status COMPLETED or FAILED
  */
 export async function insertChatMessage(
     messageId: string,
@@ -151,6 +155,7 @@ export async function insertChatMessage(
     knowledgeRoomId: string,
     conversationId: string,
     userId: string,
+    status: string = 'COMPLETED',
 ): Promise<ChatMessage> {
     const createdAt = new Date().toUTCString()
 
@@ -165,6 +170,7 @@ export async function insertChatMessage(
                 M: {
                     content: { S: content },
                     isUserMessage: { BOOL: isUserMessage },
+                    status: { S: status },
                     relatedDocuments: {
                         L: relatedDocuments.map((doc) => ({
                             M: {
@@ -189,6 +195,7 @@ export async function insertChatMessage(
         content,
         isUserMessage,
         relatedDocuments,
+        status,
         createdAt,
     }
 }
@@ -332,9 +339,82 @@ export async function listChatMessagesByConversation(
                     start: parseInt(doc.M?.start.N || '0', 10),
                     end: parseInt(doc.M?.end.N || '0', 10),
                 })) || [],
+            // Messages stored before answers were streamed have no status
+            status: item.metadata?.M?.status?.S || 'COMPLETED',
             createdAt: item.createdAt.S!,
         })) || []
     )
 }
 
+// API Gateway closes WebSocket connections after two hours at the latest
+const STREAM_CONNECTION_TTL_SECONDS = 2 * 60 * 60
+
+/**
+ * Stores the user who opened a connection to the chats WebSocket API
+ * Uses PK: CONNECTION#{connectionId}, SK: METADATA, expiring with the connection
+ */
+export async function insertStreamConnection(
+    connectionId: string,
+    userId: string,
+) {
+    const createdAt = new Date()
+
+    const params: PutItemCommandInput = {
+        TableName: process.env.SEMANTIC_VIDEO_CHAT_TABLE_NAME,
+        Item: {
+            PK: { S: `CONNECTION#${connectionId}` },
+            SK: { S: 'METADATA' },
+            type: { S: 'StreamConnection' },
+            userId: { S: userId },
+            createdAt: { S: createdAt.toUTCString() },
+            // Removes connections whose disconnect was missed
+            expiresAt: {
+                N: (
+                    Math.floor(createdAt.getTime() / 1000) +
+                    STREAM_CONNECTION_TTL_SECONDS
+                ).toString(),
+            },
+        },
+    }
+
+    const command = new PutItemCommand(params)
+    await client.send(command)
+}
+
+/**
+ * Retrieves the user who opened a WebSocket connection
+ * Returns undefined for unknown and closed connections
+ */
+export async function getStreamConnectionUserId(
+    connectionId: string,
+): Promise<string | undefined> {
+    const command = new GetItemCommand({
+        TableName: process.env.SEMANTIC_VIDEO_CHAT_TABLE_NAME,
+        Key: {
+            PK: { S: `CONNECTION#${connectionId}` },
+            SK: { S: 'METADATA' },
+        },
+        ConsistentRead: true,
+    })
+
+    const result = await client.send(command)
+
+    return result.Item?.userId?.S
+}
+
+/**
+ * Removes a closed WebSocket connection
+ */
+export async function deleteStreamConnection(connectionId: string) {
+    const command = new DeleteItemCommand({
+        TableName: process.env.SEMANTIC_VIDEO_CHAT_TABLE_NAME,
+        Key: {
+            PK: { S: `CONNECTION#${connectionId}` },
+            SK: { S: 'METADATA' },
+        },
+    })
+
+    await client.send(command)
+}
+
 export default client
@@ -7,6 +7,9 @@ import { APIGatewayEvent, APIGatewayProxyResult, Context } from 'aws-lambda'
 
 dotenv.config()
 
+// Handlers of the chats WebSocket API, deployed as Lambda functions of their own
+export { authorizeStreamConnection, handleStreamConnection } from './stream'
+
 // GraphQL Yoga server configuration with custom context
 const yoga = createYoga({
     graphqlEndpoint: '/graphql',
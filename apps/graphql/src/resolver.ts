@@ -1,6 +1,7 @@
 import { nanoid } from 'nanoid'
 import { Context } from './context'
 import {
+    getStreamConnectionUserId,
     insertChatMessage,
     insertConversation,
     insertKnowledgeRoom,
@@ -227,6 +228,33 @@ const clientResolvers = {
             context: Context,
         ) => {
             try {
+                // Stream tool events and answer tokens, tagged with the message id,
+                // when the client is connected to the WebSocket API
+                const streamEndpoint = process.env.CHATS_STREAM_ENDPOINT
+                const stream = Boolean(
+                    input.streamConnectionId && streamEndpoint,
+                )
+
+                // Answers are posted only to connections the user opened
+                if (
+                    stream &&
+                    (await getStreamConnectionUserId(
+                        input.streamConnectionId,
+                    )) !== context.userId
+                ) {
+                    throw new GraphQLError(
+                        'Forbidden: Stream connection of another user',
+                        {
+                            extensions: {
+                                code: 'FORBIDDEN',
+                                http: {
+                                    status: 403,
+                                },
+                            },
+                        },
+                    )
+                }
+
                 // Retrieve conversation history for context
                 const history = await listChatMessagesByConversation(
                     knowledgeRoomId,
@@ -234,12 +262,15 @@ const clientResolvers = {
                     context.userId,
                 )
 
-                // Sort history by creation time for proper context ordering
-                const sortedHistory = history.sort(
-                    (a, b) =>
-                        new Date(b.createdAt).getTime() -
-                        new Date(a.createdAt).getTime(),
-                )
+                // Sort history by creation time for proper context ordering,
+                // leaving out answers still generated or failed
+                const sortedHistory = history
+                    .filter((m) => m.status === 'COMPLETED')
+                    .sort(
+                        (a, b) =>
+                            new Date(b.createdAt).getTime() -
+                            new Date(a.createdAt).getTime(),
+                    )
 
                 // Store user message first
                 const message = await insertChatMessage(
@@ -252,6 +283,45 @@ const clientResolvers = {
                     context.userId,
                 )
 
+                if (stream) {
+                    // The answer arrives over the connection, the mutation returns the
+                    // pending answer message right away and the chats Lambda stores
+                    // its content, or marks it FAILED
+                    const answer = await insertChatMessage(
+                        nanoid(),
+                        '',
+                        [],
+                        false,
+                        knowledgeRoomId,
+                        conversationId,
+                        context.userId,
+                        'PENDING',
+                    )
+                    await lambdaClient.send(
+                        new InvokeCommand({
+                            FunctionName: process.env.CHATS_LAMBDA_ARN,
+                            InvocationType: 'Event',
+                            Payload: Buffer.from(
+                                JSON.stringify({
+                                    userId: context.userId,
+                                    knowledgeRoomId: knowledgeRoomId,
+                                    conversationId: conversationId,
+                                    answerId: answer.id,
+                                    message: message.content,
+                                    history: sortedHistory,
+                                    stream: {
+                                        connectionId: input.streamConnectionId,
+                                        requestId: input.id,
+                                        endpoint: streamEndpoint,
+                                    },
+                                }),
+                            ),
+                        }),
+                    )
+
+                    return answer
+                }
+
                 // Invoke AI processing Lambda with conversation context
                 const command = new InvokeCommand({
                     FunctionName: process.env.CHATS_LAMBDA_ARN,
@@ -299,6 +369,7 @@ const clientResolvers = {
                 throw Error('No response message')
             } catch (e) {
                 console.error(e)
+                if (e instanceof GraphQLError) return Promise.reject(e)
                 return Promise.reject(
                     new GraphQLError('Cannot generate response message.'),
                 )
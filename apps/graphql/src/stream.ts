@@ -0,0 +1,66 @@
+import {
+    APIGatewayAuthorizerResult,
+    APIGatewayProxyEvent,
+    APIGatewayProxyResult,
+    APIGatewayRequestAuthorizerEvent,
+} from 'aws-lambda'
+import { authenticateToken } from './auth'
+import {
+    deleteStreamConnection,
+    insertStreamConnection,
+} from './helper/dynamodb'
+
+/**
+ * Lambda authorizer of the $connect route of the chats WebSocket API
+ * Browsers cannot set headers on WebSocket requests, so the token the
+ * GraphQL API reads from the Authorization header is a query parameter
+ */
+export async function authorizeStreamConnection(
+    event: APIGatewayRequestAuthorizerEvent,
+): Promise<APIGatewayAuthorizerResult> {
+    let userId: string
+    try {
+        userId = authenticateToken(event.queryStringParameters?.token).userId
+    } catch (e) {
+        // API Gateway rejects the connection with 401 Unauthorized
+        throw new Error('Unauthorized')
+    }
+
+    return {
+        principalId: userId,
+        policyDocument: {
+            Version: '2012-10-17',
+            Statement: [
+                {
+                    Action: 'execute-api:Invoke',
+                    Effect: 'Allow',
+                    Resource: event.methodArn,
+                },
+            ],
+        },
+        // Passed to the $connect integration as requestContext.authorizer
+        context: { userId },
+    }
+}
+
+/**
+ * Handles the $connect and $disconnect routes of the chats WebSocket API
+ * Stores the user of every connection, sendChatMessage streams answers only
+ * to connections of the user who sent the message
+ */
+export async function handleStreamConnection(
+    event: APIGatewayProxyEvent,
+): Promise<APIGatewayProxyResult> {
+    const { connectionId, eventType, authorizer } = event.requestContext
+
+    if (eventType === 'CONNECT') {
+        await insertStreamConnection(connectionId!, authorizer!.userId)
+    } else if (eventType === 'DISCONNECT') {
+        await deleteStreamConnection(connectionId!)
+    }
+
+    return {
+        statusCode: 200,
+        body: '',
+    }
+}
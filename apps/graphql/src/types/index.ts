@@ -33,5 +33,6 @@ export interface ChatMessage {
     content: string
     isUserMessage: boolean
     relatedDocuments: RelatedDocuments[]
+    status: string
     createdAt: string
 }
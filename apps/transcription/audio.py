@@ -0,0 +1,207 @@
+"""
+Audio analysis module for the transcription service.
+
+This module works directly on the raw 16 kHz mono s16le PCM written by
+extract_audio, so audio analysis does not need additional ffmpeg passes.
+"""
+import hashlib
+import logging
+import math
+import os
+from bisect import bisect_left, bisect_right
+from typing import Optional
+
+import numpy as np  # pylint: disable=import-error
+
+logger = logging.getLogger()
+
+SAMPLE_RATE = 16000
+SAMPLE_WIDTH = 2
+FULL_SCALE = 32768.0
+
+# Chunks are encoded as constant bitrate mp3 for the Whisper upload
+CHUNK_BITRATE_KBPS = 64
+CHUNK_BYTES_PER_SECOND = CHUNK_BITRATE_KBPS * 1000 // 8
+
+# Whisper rejects uploads above 25 MB, keep some headroom for container overhead
+WHISPER_MAX_UPLOAD_BYTES = 24 * 1024 * 1024
+
+# Number of frames analysed per block, keeps the float working set small
+# (about one minute of audio at 20ms frames).
+FRAMES_PER_BLOCK = 3000
+
+
+def load_pcm(pcm_path: str) -> np.ndarray:
+    """
+    Memory-maps a raw 16 kHz mono s16le PCM file as an int16 array.
+    """
+    if os.path.getsize(pcm_path) < SAMPLE_WIDTH:
+        return np.zeros(0, dtype=np.int16)
+
+    return np.memmap(pcm_path, dtype="<i2", mode="r")
+
+
+def hash_pcm(pcm_path: str, start: float = 0.0, end: Optional[float] = None) -> str:
+    """
+    Returns the SHA-256 hex digest of the PCM samples between start and end
+    (in seconds, the whole file by default).
+    """
+    samples = load_pcm(pcm_path)
+    first = min(len(samples), int(round(start * SAMPLE_RATE)))
+    last = len(samples) if end is None else min(len(samples), int(round(end * SAMPLE_RATE)))
+
+    digest = hashlib.sha256()
+    block = SAMPLE_RATE * 60
+
+    for offset in range(first, last, block):
+        digest.update(memoryview(np.ascontiguousarray(samples[offset:min(offset + block, last)])))
+
+    return digest.hexdigest()
+
+
+def frame_energy_db(samples: np.ndarray, frame_size: int) -> np.ndarray:
+    """
+    Computes the RMS energy of consecutive frames in dBFS.
+    A trailing partial frame is analysed as a frame of its own.
+    """
+    n_samples = len(samples)
+    n_frames = -(-n_samples // frame_size)
+    energy = np.empty(n_frames, dtype=np.float64)
+
+    for first in range(0, n_frames, FRAMES_PER_BLOCK):
+        last = min(first + FRAMES_PER_BLOCK, n_frames)
+        block = np.asarray(samples[first * frame_size:last * frame_size], dtype=np.float32)
+
+        pad = (last - first) * frame_size - len(block)
+        if pad:
+            block = np.pad(block, (0, pad))
+
+        frames = block.reshape(last - first, frame_size) / FULL_SCALE
+        energy[first:last] = np.sqrt(np.mean(frames * frames, axis=1, dtype=np.float64))
+
+    with np.errstate(divide="ignore"):
+        return 20.0 * np.log10(energy)
+
+
+def detect_speech_segments(pcm_path: str, silence_thresh: float = -40.0,
+                           min_silence_dur: float = 1.0, frame_ms: int = 20):
+    """
+    Detects speech and silence in a raw PCM file from its frame energy.
+
+    Frames quieter than silence_thresh (dBFS) form silence when they last at
+    least min_silence_dur seconds. Returns a tuple of
+    (speech_segments, silence_segments, total_duration), where both segment
+    lists hold (start, end) tuples in seconds and total_duration is derived
+    from the sample count.
+    """
+    samples = load_pcm(pcm_path)
+    total_duration = len(samples) / SAMPLE_RATE
+
+    if len(samples) == 0:
+        return [], [], 0.0
+
+    frame_size = SAMPLE_RATE * frame_ms // 1000
+    frame_dur = frame_size / SAMPLE_RATE
+
+    silent = frame_energy_db(samples, frame_size) < silence_thresh
+
+    # Run boundaries of silent frames: +1 where a run starts, -1 after it ends
+    edges = np.diff(np.concatenate(([0], silent.astype(np.int8), [0])))
+    run_starts = np.flatnonzero(edges == 1)
+    run_ends = np.flatnonzero(edges == -1)
+
+    min_frames = max(1, int(np.ceil(min_silence_dur / frame_dur)))
+    keep = (run_ends - run_starts) >= min_frames
+
+    silence_segments = [
+        (float(start * frame_dur), float(min(end * frame_dur, total_duration)))
+        for start, end in zip(run_starts[keep], run_ends[keep])
+    ]
+
+    speech_segments = []
+    last_end = 0.0
+
+    for start, end in silence_segments:
+        if start > last_end:
+            speech_segments.append((last_end, start))
+        last_end = end
+
+    if last_end < total_duration:
+        speech_segments.append((last_end, total_duration))
+
+    logger.info(
+        "Detected %d speech and %d silence segments in %.2fs of audio",
+        len(speech_segments), len(silence_segments), total_duration
+    )
+
+    return speech_segments, silence_segments, total_duration
+
+
+def plan_chunks(speech_segments: list, total_duration: float, parallelism: int = 10,
+                max_chunk_duration: float = 900.0,
+                max_chunk_bytes: int = WHISPER_MAX_UPLOAD_BYTES,
+                bytes_per_second: int = CHUNK_BYTES_PER_SECOND,
+                min_chunk_duration: float = 30.0) -> list:
+    """
+    Plans contiguous chunks of roughly equal duration covering the audio.
+
+    Chunks are cut in the middle of the silences between speech segments.
+    The chunk count aims for parallelism, but is raised so that no chunk
+    exceeds max_chunk_duration or max_chunk_bytes (at bytes_per_second), and
+    lowered so chunks do not drop below min_chunk_duration. When a stretch of
+    speech offers no silence within the ceiling, the chunk is cut hard at the
+    ceiling.
+
+    Returns a list of (start, end) tuples in seconds.
+    """
+    if total_duration <= 0:
+        return []
+
+    ceiling = min(max_chunk_duration, max_chunk_bytes / bytes_per_second)
+    if ceiling <= 0:
+        raise ValueError("Chunk duration and byte ceilings must be positive")
+
+    n_chunks = max(
+        math.ceil(total_duration / ceiling),
+        min(max(1, parallelism), max(1, math.floor(total_duration / min_chunk_duration)))
+    )
+
+    # Candidate cut points: the middle of every silence between speech segments
+    cuts = [
+        (prev_end + next_start) / 2
+        for (_, prev_end), (next_start, _) in zip(speech_segments, speech_segments[1:])
+        if next_start > prev_end
+    ]
+
+    plan = []
+    start = 0.0
+    remaining = n_chunks
+
+    while remaining > 1 and total_duration - start > 0:
+        ideal = start + (total_duration - start) / remaining
+        limit = start + ceiling
+
+        lo = bisect_right(cuts, start)
+        hi = bisect_right(cuts, limit)
+        pos = min(max(bisect_left(cuts, ideal, lo, hi), lo), hi)
+
+        neighbours = [cuts[i] for i in (pos - 1, pos) if lo <= i < hi]
+        cut = min(neighbours, key=lambda c: abs(c - ideal)) if neighbours else min(ideal, limit)
+
+        plan.append((start, cut))
+        start = cut
+        remaining -= 1
+
+        # A cut placed early by the silence layout may leave too much for the rest
+        if remaining == 1 and total_duration - start > ceiling:
+            remaining += 1
+
+    if total_duration - start > 0:
+        plan.append((start, total_duration))
+
+    logger.info(
+        "Planned %d chunks (target %d, ceiling %.1fs) over %.2fs of audio",
+        len(plan), n_chunks, ceiling, total_duration
+    )
+
+    return plan
@@ -0,0 +1,112 @@
+"""
+Transcription checkpoints for resuming jobs across Lambda retries.
+
+The chunk plan of a video and the partial transcript of every finished chunk
+are written to S3 while the job runs. A redelivered SQS message loads them and
+only transcribes the chunks that are still missing.
+"""
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from botocore.exceptions import ClientError
+
+from s3_objects import delete_keys, get_json, put_json
+
+logger = logging.getLogger()
+
+
+class TranscriptionCheckpoint:
+    """
+    S3-backed checkpoint of a single video transcription job.
+
+    Attributes:
+        bucket (str): S3 bucket holding the checkpoints
+        prefix (str): Key prefix of the checkpoints of this video
+        manifest (dict | None): Loaded manifest with "audioHash" and "chunks"
+        completed (dict): Partial transcripts of finished chunks by chunk index
+    """
+
+    def __init__(self, bucket: str, prefix: str, video_id: str):
+        self.bucket = bucket
+        self.prefix = f"{prefix.strip('/')}/{video_id}"
+        self.manifest = None
+        self.completed = {}
+
+    def _manifest_key(self) -> str:
+        return f"{self.prefix}/manifest.json"
+
+    def _chunk_key(self, chunk_index: int) -> str:
+        # Chunk results belong to the plan of one audio hash and never leak into another plan
+        return f"{self.prefix}/{self.manifest['audioHash']}/chunk_{chunk_index:03}.json"
+
+    def _put(self, key: str, data: dict) -> None:
+        # A lost checkpoint only costs work on a retry, it must not fail the job
+        try:
+            put_json(self.bucket, key, data)
+        except ClientError as e:
+            logger.warning("Failed to store checkpoint s3://%s/%s: %s", self.bucket, key, e)
+
+    def load(self) -> None:
+        """
+        Loads the manifest and the partial transcripts of all finished chunks.
+        """
+        self.manifest = get_json(self.bucket, self._manifest_key())
+        self.completed = {}
+
+        if self.manifest is None:
+            return
+
+        indices = [chunk["index"] for chunk in self.manifest["chunks"]]
+
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            partials = executor.map(lambda i: get_json(self.bucket, self._chunk_key(i)), indices)
+
+            self.completed = {
+                index: partial
+                for index, partial in zip(indices, partials)
+                if partial is not None
+            }
+
+        logger.info("Loaded checkpoint of s3://%s/%s: %d of %d chunks done",
+                    self.bucket, self.prefix, len(self.completed), len(indices))
+
+    def is_complete(self) -> bool:
+        """Returns True when every planned chunk has a partial transcript."""
+        return self.manifest is not None and all(
+            chunk["index"] in self.completed for chunk in self.manifest["chunks"]
+        )
+
+    def matches(self, audio_hash: str) -> bool:
+        """Returns True when the loaded manifest was planned for this audio."""
+        return self.manifest is not None and self.manifest["audioHash"] == audio_hash
+
+    def save_manifest(self, audio_hash: str, chunks: list) -> None:
+        """Stores the chunk plan of the audio and discards older chunk results."""
+        self.manifest = {
+            "audioHash": audio_hash,
+            "chunks": [
+                {"index": c["index"], "start": c["start"], "duration": c["duration"]}
+                for c in chunks
+            ]
+        }
+        self.completed = {}
+        self._put(self._manifest_key(), self.manifest)
+
+    def save_chunk(self, chunk_index: int, partial: dict) -> None:
+        """Stores the partial transcript of a finished chunk."""
+        self._put(self._chunk_key(chunk_index), partial)
+        self.completed[chunk_index] = partial
+
+    def clear(self) -> None:
+        """Deletes the checkpoint once the job finished."""
+        if self.manifest is None:
+            return
+
+        keys = [self._manifest_key()] + [
+            self._chunk_key(chunk["index"]) for chunk in self.manifest["chunks"]
+        ]
+
+        try:
+            delete_keys(self.bucket, keys)
+        except ClientError as e:
+            logger.warning("Failed to delete checkpoint s3://%s/%s: %s", self.bucket, self.prefix, e)
@@ -7,97 +7,245 @@ of audio segments, and coordination with other services via SQS.
 import json
 import logging
 import os
+import shutil
+from audio import hash_pcm
+from bootstrap import load_and_set_api_keys
+from openai_scheduler import get_scheduler
 from helper import (
-    download_from_s3, extract_audio, replace_extension, send_to_sqs,
-    success_response, error_response, transcribe_audio, update_video_status,
-    split_audio_on_silence_ffmpeg, upload_json_to_s3
+    get_transcription_backend, download_from_s3, extract_audio, extract_audio_from_s3,
+    replace_extension, send_to_sqs, transcribe_audio, merge_transcripts,
+    update_video_status, plan_audio_chunks, upload_json_to_s3,
+    upload_compact_transcript_to_s3
 )
+from pipeline import run_transcription_pipeline
+from progress import ProgressReporter, create_progress_reporter
+from sqs_batch import batch_item_failures, process_sqs_records
+from checkpoint import TranscriptionCheckpoint
+from transcript_cache import TranscriptCache
 
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
 S3_BUCKET_NAME = os.environ.get("S3_VIDEO_BUCKET_NAME")
+# Number of SQS records of a batch processed concurrently, the event source
+# mapping delivers one record per batch so videos do not share a timeout
+TRANSCRIPTION_RECORD_WORKERS = int(os.environ.get("TRANSCRIPTION_RECORD_WORKERS", "2"))
+TRANSCRIPTION_MAX_WORKERS = int(os.environ.get("TRANSCRIPTION_MAX_WORKERS", "4"))
+# Encoded chunks allowed on disk at once, defaults to one more than the workers
+TRANSCRIPTION_MAX_PENDING_CHUNKS = int(os.environ.get("TRANSCRIPTION_MAX_PENDING_CHUNKS", "0")) or None
+TRANSCRIPTION_CHUNK_PARALLELISM = int(os.environ.get("TRANSCRIPTION_CHUNK_PARALLELISM", "10"))
+TRANSCRIPTION_MAX_CHUNK_SECONDS = float(os.environ.get("TRANSCRIPTION_MAX_CHUNK_SECONDS", "900"))
+TRANSCRIPTION_MAX_CHUNK_BYTES = int(os.environ.get("TRANSCRIPTION_MAX_CHUNK_BYTES", str(24 * 1024 * 1024)))
+# Shared S3 prefix of the content-addressed transcript cache, empty disables it
+TRANSCRIPT_CACHE_PREFIX = os.environ.get("TRANSCRIPT_CACHE_PREFIX", "transcript-cache")
+# S3 prefix of the per-video checkpoints used to resume retried jobs
+TRANSCRIPTION_CHECKPOINT_PREFIX = os.environ.get(
+    "TRANSCRIPTION_CHECKPOINT_PREFIX", "transcription-checkpoints"
+)
+# "json" writes the plain JSON transcript ({video}_transcript.json), "compact" the binary
+# format of transcript_format.py ({video}_transcript.svt), read by the embeddings service only
+TRANSCRIPT_FORMAT = os.environ.get("TRANSCRIPT_FORMAT", "json")
+# "download" stages the video in /tmp, "stream" pipes ranged S3 GETs into ffmpeg
+TRANSCRIPTION_INGEST_MODE = os.environ.get("TRANSCRIPTION_INGEST_MODE", "download")
 
 
-def lambda_handler(event, _context=None):
+def ingest_audio(s3_key: str, input_path: str, pcm_path: str) -> None:
     """
-    AWS Lambda handler to process video-to-audio extraction from S3 objects.
+    Extracts the audio of the video at s3_key, either by streaming the video
+    into ffmpeg or by downloading it to input_path first. Streaming falls back
+    to the download path for inputs ffmpeg cannot read from a pipe.
     """
-    logger.info("Received event: %s", json.dumps(event))
-
-    for record in event.get("Records", []):
+    if TRANSCRIPTION_INGEST_MODE == "stream":
         try:
-            body = json.loads(record["body"])
-            video_id = body["id"]
-            knowledge_room_id = body["knowledgeRoomId"]
-            video_key = body["videoKey"]
-            user_id = body["userId"]
-
-            s3_key = f"{user_id}/{video_key}"
+            extract_audio_from_s3(S3_BUCKET_NAME, s3_key, pcm_path)
+            return
+        except RuntimeError as e:
+            logger.warning("Streaming ingest failed, falling back to download: %s", e)
 
-            base_tmp_path = f"/tmp/{video_id}"
-            os.makedirs(base_tmp_path, exist_ok=True)
+    # Download video file from s3 to tmp directory
+    download_from_s3(S3_BUCKET_NAME, s3_key, input_path)
 
-            input_path = f"{base_tmp_path}/{os.path.basename(s3_key)}"
-            output_path = replace_extension(input_path, ".mp3")
+    # Extract the audio of the video and store it as file
+    extract_audio(input_path, pcm_path)
 
-            # 1. Download video file from s3 to tmp directory
-            download_from_s3(S3_BUCKET_NAME, s3_key, input_path)
 
-            # 2. Extract the audio of the video and store it as file
-            extract_audio(input_path, output_path)
-
-            # 3. Split audio files in smaller chunks
-            chunks = split_audio_on_silence_ffmpeg(output_path, video_id)
-
-            # 4. Transcribe each segment and collect
-            all_segments = []
-            full_text = ""
-
-            for chunk in chunks:
-                path = chunk["path"]
-                offset = chunk["start"]
+def transcribe_audio_file(video_id: str, pcm_path: str, checkpoint: TranscriptionCheckpoint,
+                          progress: ProgressReporter) -> dict:
+    """
+    Transcribes the extracted audio of a video.
 
-                partial = transcribe_audio(path)
+    The merged transcript and the partial transcripts of every chunk are
+    looked up in the content-addressed transcript cache first. Only the
+    chunks missing from the cache are sent to Whisper, streamed through the
+    encode/transcribe pipeline, and the fresh results are merged with the
+    cached ones in chunk order.
 
-                for seg in partial["segments"]:
-                    all_segments.append({
-                        "start": int(seg["start"] + offset),
-                        "end": int(seg["end"] + offset),
-                        "text": seg["text"]
-                    })
+    The chunk plan and every finished chunk are checkpointed. When a retried
+    job finds a checkpoint for the same audio, it keeps the checkpointed plan
+    and transcribes only the chunks that did not finish.
 
-                full_text += partial["text"].strip() + " "
+    Progress counts chunks transcribed out of the planned chunks, chunks
+    taken from the checkpoint or the cache count as transcribed.
+    """
+    cache = None
+    if TRANSCRIPT_CACHE_PREFIX:
+        cache = TranscriptCache(
+            S3_BUCKET_NAME, TRANSCRIPT_CACHE_PREFIX, get_transcription_backend().name
+        )
+
+    audio_hash = hash_pcm(pcm_path)
+
+    if cache is not None:
+        transcript = cache.get_transcript(audio_hash)
+        if transcript is not None:
+            logger.info("Reusing cached transcript for audio %s", audio_hash)
+            cache.log_stats()
+            return transcript
+
+    if checkpoint.matches(audio_hash):
+        # Resume with the checkpointed plan so the merge matches an uninterrupted run
+        chunks = checkpoint.manifest["chunks"]
+        logger.info("Resuming transcription of video %s: %d of %d chunks done",
+                    video_id, len(checkpoint.completed), len(chunks))
+    else:
+        # Plan the chunks of the audio based on silence
+        chunks = plan_audio_chunks(
+            pcm_path,
+            parallelism=TRANSCRIPTION_CHUNK_PARALLELISM,
+            max_chunk_duration=TRANSCRIPTION_MAX_CHUNK_SECONDS,
+            max_chunk_bytes=TRANSCRIPTION_MAX_CHUNK_BYTES
+        )
+        checkpoint.save_manifest(audio_hash, chunks)
+
+    partials = [checkpoint.completed.get(chunk["index"]) for chunk in chunks]
+    chunk_hashes = {}
+
+    if cache is not None:
+        for chunk in chunks:
+            if partials[chunk["index"]] is not None:
+                continue
+            chunk_hash = hash_pcm(pcm_path, chunk["start"], chunk["start"] + chunk["duration"])
+            chunk_hashes[chunk["index"]] = chunk_hash
+            partials[chunk["index"]] = cache.get_chunk(chunk_hash)
+
+    missing = [chunk for chunk in chunks if partials[chunk["index"]] is None]
+
+    progress.set_total(len(chunks))
+    progress.advance("chunksTranscribed", len(chunks) - len(missing))
+
+    def _store(chunk: dict, partial: dict) -> None:
+        partials[chunk["index"]] = partial
+        checkpoint.save_chunk(chunk["index"], partial)
+        if cache is not None:
+            cache.put_chunk(chunk_hashes[chunk["index"]], partial)
+        progress.advance("chunksTranscribed")
+
+    if missing:
+        # Encode the missing chunks and transcribe each one as soon as it is encoded
+        run_transcription_pipeline(
+            pcm_path, video_id, chunks, {chunk["index"] for chunk in missing}, transcribe_audio,
+            on_result=_store, max_workers=TRANSCRIPTION_MAX_WORKERS,
+            max_pending=TRANSCRIPTION_MAX_PENDING_CHUNKS
+        )
+
+    progress.flush()
+
+    # Merge cached and fresh partial transcripts in chunk order
+    transcript = merge_transcripts(chunks, partials)
+
+    if cache is not None:
+        cache.put_transcript(audio_hash, transcript)
+        cache.log_stats()
+
+    return transcript
+
+
+def process_record(record: dict) -> None:
+    """
+    Transcribes the video of a single SQS record and hands the transcript
+    over to the embeddings queue.
+    """
+    body = json.loads(record["body"])
+    video_id = body["id"]
+    knowledge_room_id = body["knowledgeRoomId"]
+    video_key = body["videoKey"]
+    user_id = body["userId"]
+
+    s3_key = f"{user_id}/{video_key}"
+
+    base_tmp_path = f"/tmp/{video_id}"
+    os.makedirs(base_tmp_path, exist_ok=True)
+
+    input_path = f"{base_tmp_path}/{os.path.basename(s3_key)}"
+    pcm_path = replace_extension(input_path, ".pcm")
+
+    try:
+        checkpoint = TranscriptionCheckpoint(
+            S3_BUCKET_NAME, TRANSCRIPTION_CHECKPOINT_PREFIX, video_id
+        )
+        checkpoint.load()
+
+        if checkpoint.is_complete():
+            # A previous attempt transcribed every chunk, only the merge is left
+            manifest_chunks = checkpoint.manifest["chunks"]
+            transcript = merge_transcripts(
+                manifest_chunks,
+                [checkpoint.completed[chunk["index"]] for chunk in manifest_chunks]
+            )
+        else:
+            # 1-2. Download the video and extract its audio
+            ingest_audio(s3_key, input_path, pcm_path)
+
+            # 3-4. Split the audio in chunks, transcribe and merge them
+            progress = create_progress_reporter(knowledge_room_id, video_id, "transcription")
+            transcript = transcribe_audio_file(video_id, pcm_path, checkpoint, progress)
+
+        # 5. Save transcript to S3
+        transcript_base = f"{user_id}/{os.path.splitext(video_key)[0]}_transcript"
+        if TRANSCRIPT_FORMAT == "compact":
+            transcript_key = f"{transcript_base}.svt"
+            upload_compact_transcript_to_s3(S3_BUCKET_NAME, transcript_key, transcript)
+        else:
+            transcript_key = f"{transcript_base}.json"
+            upload_json_to_s3(S3_BUCKET_NAME, transcript_key, transcript)
 
-            transcript = {
-                "text": full_text.strip(),
-                "segments": all_segments
-            }
+        # 6. Update the video status in the databae
+        update_video_status(
+            knowledge_room_id=knowledge_room_id,
+            video_id=video_id,
+            new_status="EMBEDDINGS_CREATING"
+        )
+
+        # 7. Send SQS event to queue for further processing
+        message_id = send_to_sqs({
+            "userId": user_id,
+            "videoId": video_id,
+            "videoKey": video_key,
+            "knowledgeRoomId": knowledge_room_id,
+            "transcriptKey": transcript_key
+        })
+        logger.info("Sent transcript of video %s to SQS: %s", video_id, message_id)
+
+        checkpoint.clear()
+    finally:
+        # Records of a batch share the ephemeral storage of the container
+        shutil.rmtree(base_tmp_path, ignore_errors=True)
 
-            # 5. Save transcript to S3
-            transcript_key = f"{user_id}/{os.path.splitext(video_key)[0]}_transcript.json"
-            upload_json_to_s3(S3_BUCKET_NAME, transcript_key, transcript)
 
-            # 6. Update the video status in the databae
-            update_video_status(
-                knowledge_room_id=knowledge_room_id,
-                video_id=video_id,
-                new_status="EMBEDDINGS_CREATING"
-            )
+def lambda_handler(event, _context=None):
+    """
+    AWS Lambda handler to process video-to-audio extraction from S3 objects.
 
-            # 7. Send SQS event to queue for further processing
-            message_id = send_to_sqs({
-                "userId": user_id,
-                "videoId": video_id,
-                "videoKey": video_key,
-                "knowledgeRoomId": knowledge_room_id,
-                "transcriptKey": transcript_key
-            })
+    All records of the batch are processed concurrently. Failed records are
+    reported as batchItemFailures so SQS only redelivers those messages.
+    """
+    logger.info("Received event: %s", json.dumps(event))
 
-            return success_response({'messageId': message_id})
+    load_and_set_api_keys(OPENAI_API_KEY="OPENAI_SECRET_ARN")
 
-        except Exception as e:
-            logger.error("Error processing record: %s", str(e))
-            return error_response(str(e))
+    failed_message_ids = process_sqs_records(
+        event.get("Records", []), process_record, max_workers=TRANSCRIPTION_RECORD_WORKERS
+    )
+    get_scheduler().log_stats()
 
-    return success_response({'message': 'No records processed'})
+    return batch_item_failures(failed_message_ids)
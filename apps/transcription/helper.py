@@ -6,14 +6,28 @@ and AWS service interactions.
 """
 import json
 import logging
-import math
 import os
 import subprocess
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
 from pathlib import Path
+from typing import Iterator
 
 import boto3
 from botocore.exceptions import ClientError
-from openai import OpenAI
+
+from audio import (
+    WHISPER_MAX_UPLOAD_BYTES, detect_speech_segments, plan_chunks
+)
+from bootstrap import get_openai_client
+from openai_scheduler import get_scheduler
+from transcript_format import encode_compact_transcript
+from transcription_backends import (
+    OpenAIWhisperBackend, TranscriptionBackend, create_local_backend_from_env
+)
 
 # Initialize logger and AWS clients
 logger = logging.getLogger()
@@ -21,24 +35,12 @@ s3 = boto3.client("s3")
 sqs = boto3.client("sqs")
 dynamodb = boto3.client("dynamodb")
 
-
-def get_openai_api_key(secret_arn: str) -> str:
-    """
-    Retrieves the OpenAI API key from AWS Secrets Manager.
-    """
-    client = boto3.client("secretsmanager")
-    response = client.get_secret_value(SecretId=secret_arn)
-
-    if "SecretString" in response:
-        return response["SecretString"]
-
-    raise ValueError("Secret not found or invalid format")
-
-
 # Environment setup
-api_key = get_openai_api_key(os.environ["OPENAI_SECRET_ARN"])
-openai_client = OpenAI(api_key=api_key)
 SQS_QUEUE_URL = os.environ["EMBEDDINGS_SQS_QUEUE_URL"]
+WHISPER_MODEL = "whisper-1"
+TRANSCRIPTION_BACKEND_NAME = os.environ.get("TRANSCRIPTION_BACKEND", "openai")
+TRANSCRIPTION_BACKEND = None
+_BACKEND_LOCK = threading.Lock()
 DDB_TABLE_NAME = os.environ["SEMANTIC_VIDEO_CHAT_TABLE_NAME"]
 
 
@@ -57,61 +59,141 @@ def download_from_s3(bucket: str, key: str, local_path: str) -> None:
         raise
 
 
-def extract_audio(input_path: str, output_path: str) -> None:
+def _extract_audio_command(input_path: str, pcm_path: str) -> list:
     """
-    Extracts audio from a video file using ffmpeg.
+    Builds the ffmpeg command that decodes the audio of input_path into raw
+    16 kHz mono s16le PCM at pcm_path.
     """
-
-    command = [
+    return [
         "/opt/bin/ffmpeg",
         "-nostdin",
+        "-y",
         "-threads", "0",
         "-i", input_path,
+        "-vn",
         "-f", "s16le",
         "-ac", "1",
         "-acodec", "pcm_s16le",
         "-ar", "16000",
-        "-",
-        output_path
+        pcm_path
     ]
 
-    logger.info("Extracting audio from %s to %s", input_path, output_path)
-    result = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=True)
 
-    if result.returncode != 0:
-        raise RuntimeError(f"ffmpeg failed: {result.stderr.decode()}")
-
-    size_bytes = os.path.getsize(output_path)
+def _log_audio_size(pcm_path: str) -> None:
+    size_bytes = os.path.getsize(pcm_path)
     size_mb = size_bytes / (1024 * 1024)
 
     logger.info("Extracted audio file size: %.2f MB", size_mb)
 
 
-def replace_extension(filename: str, new_ext: str) -> str:
+def extract_audio(input_path: str, pcm_path: str) -> None:
     """
-    Replaces the file extension.
+    Extracts audio from a video file using ffmpeg.
+    The audio is decoded once into raw 16 kHz mono s16le PCM at pcm_path,
+    which is used for audio analysis and as the source of all chunks.
     """
-    return str(Path(filename).with_suffix(new_ext))
+    command = _extract_audio_command(input_path, pcm_path)
+
+    logger.info("Extracting audio from %s to %s", input_path, pcm_path)
+    result = subprocess.run(command, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, check=False)
 
+    if result.returncode != 0:
+        raise RuntimeError(f"ffmpeg failed: {result.stderr.decode()}")
 
-def success_response(body_dict: dict) -> dict:
+    _log_audio_size(pcm_path)
+
+
+def iter_s3_object(bucket: str, key: str, part_size: int = 8 * 1024 * 1024,
+                   max_workers: int = 4) -> Iterator[bytes]:
     """
-    Returns a standard 200 success HTTP response.
+    Yields the bytes of an S3 object in order.
+    The object is fetched as ranged GETs on a thread pool. At most
+    2 * max_workers parts are in flight, which bounds the memory in use.
     """
-    return {
-        "statusCode": 200,
-        "body": json.dumps(body_dict)
-    }
+    size = s3.head_object(Bucket=bucket, Key=key)["ContentLength"]
+    ranges = iter(
+        (start, min(start + part_size, size) - 1)
+        for start in range(0, size, part_size)
+    )
+
+    def _fetch(byte_range: tuple) -> bytes:
+        response = s3.get_object(Bucket=bucket, Key=key, Range=f"bytes={byte_range[0]}-{byte_range[1]}")
+        return response["Body"].read()
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        pending = deque(executor.submit(_fetch, r) for r in islice(ranges, 2 * max_workers))
+
+        try:
+            while pending:
+                data = pending.popleft().result()
+
+                next_range = next(ranges, None)
+                if next_range is not None:
+                    pending.append(executor.submit(_fetch, next_range))
+
+                yield data
+        finally:
+            for future in pending:
+                future.cancel()
 
 
-def error_response(error_message: str) -> dict:
+def extract_audio_from_s3(bucket: str, key: str, pcm_path: str,
+                          part_size: int = 8 * 1024 * 1024, max_workers: int = 4) -> None:
     """
-    Returns a standard 500 error HTTP response.
+    Extracts audio from a video in S3 without staging the video on disk.
+    Parallel ranged GETs are reassembled in order and piped into ffmpeg's
+    stdin, so extraction overlaps the download and only the extracted PCM
+    uses ephemeral storage.
+
+    Containers that need to seek in the input (e.g. MP4 without faststart)
+    cannot be read from a pipe; ffmpeg fails on them with a RuntimeError.
     """
-    return {
-        "statusCode": 500,
-        "body": json.dumps({"error": error_message})
-    }
+    command = _extract_audio_command("pipe:0", pcm_path)
+
+    logger.info("Streaming s3://%s/%s into ffmpeg", bucket, key)
+    started = time.perf_counter()
+
+    process = subprocess.Popen(command, stdin=subprocess.PIPE, stdout=subprocess.DEVNULL,
+                               stderr=subprocess.PIPE)
+
+    # Drain stderr concurrently, a full pipe would stall ffmpeg and this writer
+    stderr_chunks = []
+    stderr_reader = threading.Thread(target=lambda: stderr_chunks.append(process.stderr.read()))
+    stderr_reader.start()
+
+    streamed_bytes = 0
+    parts = iter_s3_object(bucket, key, part_size=part_size, max_workers=max_workers)
+
+    try:
+        for data in parts:
+            try:
+                process.stdin.write(data)
+            except BrokenPipeError:
+                break
+            streamed_bytes += len(data)
+    finally:
+        parts.close()
+        try:
+            process.stdin.close()
+        except BrokenPipeError:
+            pass
+        process.wait()
+        stderr_reader.join()
+
+    if process.returncode != 0:
+        raise RuntimeError(f"ffmpeg failed: {b''.join(stderr_chunks).decode(errors='replace')}")
+
+    elapsed = time.perf_counter() - started
+    logger.info("Streamed %.2f MB into ffmpeg in %.2fs", streamed_bytes / (1024 * 1024), elapsed)
+
+    _log_audio_size(pcm_path)
+
+
+def replace_extension(filename: str, new_ext: str) -> str:
+    """
+    Replaces the file extension.
+    """
+    return str(Path(filename).with_suffix(new_ext))
 
 
 def send_to_sqs(message_body: dict) -> dict:
@@ -126,33 +208,64 @@ def send_to_sqs(message_body: dict) -> dict:
     )
 
 
-def transcribe_audio(audio_file_path: str) -> dict:
+def get_transcription_backend() -> TranscriptionBackend:
     """
-    Transcribes audio using OpenAI Whisper model.
+    Returns the speech-to-text backend selected by TRANSCRIPTION_BACKEND
+    ("openai" by default, or "local").
     """
-    logger.info("Transcribing audio: %s", audio_file_path)
+    global TRANSCRIPTION_BACKEND
 
-    with open(audio_file_path, "rb") as f:
-        transcript = openai_client.audio.transcriptions.create(
-            model="whisper-1",
-            file=f,
-            response_format="verbose_json"
-        )
+    with _BACKEND_LOCK:
+        if TRANSCRIPTION_BACKEND is None:
+            if TRANSCRIPTION_BACKEND_NAME == "local":
+                TRANSCRIPTION_BACKEND = create_local_backend_from_env()
+            elif TRANSCRIPTION_BACKEND_NAME == "openai":
+                TRANSCRIPTION_BACKEND = OpenAIWhisperBackend(
+                    get_openai_client, WHISPER_MODEL, scheduler=get_scheduler()
+                )
+            else:
+                raise ValueError(f"Unknown transcription backend: {TRANSCRIPTION_BACKEND_NAME}")
 
-    segments = [
-        {
-            "start": seg.start,
-            "end": seg.end,
-            "text": seg.text.strip()
-        }
-        for seg in transcript.segments
-    ]
+    return TRANSCRIPTION_BACKEND
+
+
+def transcribe_audio(audio_file_path: str) -> dict:
+    """
+    Transcribes audio with the configured speech-to-text backend.
+    """
+    backend = get_transcription_backend()
+    logger.info("Transcribing audio with %s: %s", backend.name, audio_file_path)
+
+    transcript = backend.transcribe(audio_file_path)
 
     logger.info("Transcription done!")
 
+    return transcript
+
+
+def merge_transcripts(chunks: list, partials: list) -> dict:
+    """
+    Merges partial chunk transcripts into one transcript, shifting segment
+    timestamps by the start offset of their chunk.
+    """
+    all_segments = []
+    texts = []
+
+    for chunk, partial in zip(chunks, partials):
+        offset = chunk["start"]
+
+        for seg in partial["segments"]:
+            all_segments.append({
+                "start": int(seg["start"] + offset),
+                "end": int(seg["end"] + offset),
+                "text": seg["text"]
+            })
+
+        texts.append(partial["text"].strip())
+
     return {
-        "text": transcript.text.strip(),
-        "segments": segments
+        "text": " ".join(texts).strip(),
+        "segments": all_segments
     }
 
 
@@ -176,113 +289,35 @@ def update_video_status(knowledge_room_id: str, video_id: str, new_status: str)
         raise
 
 
-def split_audio_on_silence_ffmpeg(input_path, video_id, silence_thresh="-40dB",
-                                 min_silence_dur=1.0, max_chunks=10):
+def plan_audio_chunks(pcm_path, silence_thresh=-40.0, min_silence_dur=1.0, parallelism=10,
+                      max_chunk_duration=900.0, max_chunk_bytes=WHISPER_MAX_UPLOAD_BYTES):
     """
-    Splits an audio file into chunks based on silence using ffmpeg.
-    Reduces number of chunks to max_chunks by grouping.
-    Returns a list of dicts: [{path, start, duration}]
+    Plans the transcription chunks of an audio file based on silence.
+    Silence is detected in-process on the raw PCM at pcm_path.
+    Chunks are balanced by duration around the parallelism target and kept
+    below the duration and byte ceilings (see audio.plan_chunks).
+    Returns a list of dicts: [{index, start, duration}]
     """
-    logger.info("Splitting audio file: %s", input_path)
+    logger.info("Planning chunks for audio file: %s", pcm_path)
 
-    # Step 1: Detect silence
-    command = [
-        "/opt/bin/ffmpeg",
-        "-i", input_path,
-        "-af", f"silencedetect=noise={silence_thresh}:d={min_silence_dur},ametadata=mode=print",
-        "-f", "null",
-        "-"
-    ]
-    result = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
-    
-    if result.returncode != 0:
-        raise RuntimeError(f"ffmpeg silencedetect failed: {result.stderr.strip()}")
-
-    # Step 2: Parse silence times
-    lines = result.stderr.splitlines()
-    silence_times = []
-
-    for line in lines:
-        if "silence_start:" in line:
-            silence_times.append(("start", float(line.split("silence_start:")[1].strip())))
-        elif "silence_end:" in line:
-            parts = line.split("silence_end:")[1].strip().split(" | ")
-            silence_times.append(("end", float(parts[0])))
-
-    # Step 3: Create speech segments (between silence)
-    speech_segments = []
-    last_end = 0.0
-
-    for i in range(0, len(silence_times), 2):
-        if i + 1 >= len(silence_times):
-            break
-        _, start = silence_times[i]
-        _, end = silence_times[i + 1]
-        speech_segments.append((last_end, start))
-        last_end = end
-
-    # Add final speech segment
-    # Use ffmpeg to get total duration (since no ffprobe)
-    duration_cmd = [
-        "/opt/bin/ffmpeg",
-        "-i", input_path
-    ]
-    dur_result = subprocess.run(duration_cmd, stderr=subprocess.PIPE, stdout=subprocess.PIPE, text=True)
-    dur_lines = dur_result.stderr.splitlines()
-    total_duration = None
-
-    for line in dur_lines:
-        if "Duration:" in line:
-            dur_text = line.split("Duration:")[1].split(",")[0].strip()
-            h, m, s = dur_text.split(":")
-            total_duration = int(h) * 3600 + int(m) * 60 + float(s)
-            break
-
-    if total_duration is None:
+    # Step 1: Detect speech segments (between silence) and the exact duration
+    speech_segments, _, total_duration = detect_speech_segments(
+        pcm_path, silence_thresh=silence_thresh, min_silence_dur=min_silence_dur
+    )
+
+    if total_duration <= 0:
         raise RuntimeError("Could not determine total audio duration.")
 
-    if last_end < total_duration:
-        speech_segments.append((last_end, total_duration))
-
-    # Step 4: Group segments to max_chunks
-    if len(speech_segments) <= max_chunks:
-        grouped = speech_segments
-    else:
-        group_size = math.ceil(len(speech_segments) / max_chunks)
-        grouped = []
-        for i in range(0, len(speech_segments), group_size):
-            group = speech_segments[i:i + group_size]
-            start = group[0][0]
-            end = group[-1][1]
-            grouped.append((start, end))
-
-    # Step 5: Export grouped segments
-    chunk_infos = []
-    for chunk_index, (start, end) in enumerate(grouped):
-        duration = end - start
-        output_path = f"/tmp/{video_id}/chunk_{chunk_index:03}.mp3"
-        logger.info("Creating chunk %d: %.2fs to %.2fs", chunk_index, start, end)
-
-        export_cmd = [
-            "/opt/bin/ffmpeg",
-            "-ss", str(start),
-            "-t", str(duration),
-            "-i", input_path,
-            "-acodec", "libmp3lame",
-            "-ar", "16000",
-            "-ac", "1",
-            output_path
-        ]
-        subprocess.run(export_cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
-                      check=True)
-
-        chunk_infos.append({
-            "path": output_path,
-            "start": start,
-            "duration": duration
-        })
-
-    return chunk_infos
+    # Step 2: Plan balanced chunks cut at silence
+    grouped = plan_chunks(
+        speech_segments, total_duration, parallelism=parallelism,
+        max_chunk_duration=max_chunk_duration, max_chunk_bytes=max_chunk_bytes
+    )
+
+    return [
+        {"index": chunk_index, "start": start, "duration": end - start}
+        for chunk_index, (start, end) in enumerate(grouped)
+    ]
 
 
 def upload_json_to_s3(bucket: str, key: str, data: dict) -> None:
@@ -292,3 +327,12 @@ def upload_json_to_s3(bucket: str, key: str, data: dict) -> None:
     json_bytes = json.dumps(data, indent=2).encode("utf-8")
     s3.put_object(Bucket=bucket, Key=key, Body=json_bytes, ContentType="application/json")
     logger.info("Uploaded JSON to s3://%s/%s", bucket, key)
+
+
+def upload_compact_transcript_to_s3(bucket: str, key: str, transcript: dict) -> None:
+    """
+    Uploads a transcript in the compact binary format to S3.
+    """
+    data = encode_compact_transcript(transcript)
+    s3.put_object(Bucket=bucket, Key=key, Body=data, ContentType="application/octet-stream")
+    logger.info("Uploaded compact transcript (%.1f KB) to s3://%s/%s", len(data) / 1024, bucket, key)
@@ -0,0 +1,283 @@
+"""
+Streaming chunk pipeline for the transcription service.
+
+A producer feeds the raw PCM into an ffmpeg segment muxer process and hands
+every chunk to the transcription workers as soon as ffmpeg finished encoding
+it, which ffmpeg reports by listing the closed segment file on stdout. Encoding and transcription overlap, and a semaphore bounds the number of
+encoded chunks that sit on disk: the producer only starts feeding the next
+chunk when a slot is free, and a slot is released once a chunk was
+transcribed and its file removed.
+
+Only the chunks still to transcribe are encoded. Every contiguous run of
+them gets its own muxer process, fed from the start of the run, so a resumed
+job does not re-encode the chunks that already finished.
+"""
+import logging
+import os
+import subprocess
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Iterator, Optional
+
+import numpy as np  # pylint: disable=import-error
+
+from audio import CHUNK_BITRATE_KBPS, SAMPLE_RATE, load_pcm
+
+logger = logging.getLogger()
+
+# Samples written to ffmpeg per write call (10 seconds of audio)
+FEED_BLOCK_SAMPLES = SAMPLE_RATE * 10
+POLL_INTERVAL_SECONDS = 0.05
+
+
+class PipelineStats:
+    """
+    Stage-level timings of a pipeline run.
+
+    Attributes:
+        wall_seconds (float): Wall-clock time of the whole run
+        encode_seconds (float): Time the encoder ran, without backpressure waits
+        backpressure_seconds (float): Time the producer waited for a free slot
+        transcribe_seconds (float): Summed busy time of all transcription workers
+        workers (int): Number of transcription workers
+    """
+
+    def __init__(self, workers: int):
+        self.wall_seconds = 0.0
+        self.encode_seconds = 0.0
+        self.backpressure_seconds = 0.0
+        self.transcribe_seconds = 0.0
+        self.workers = workers
+        self._lock = threading.Lock()
+
+    def add_transcribe_time(self, seconds: float) -> None:
+        with self._lock:
+            self.transcribe_seconds += seconds
+
+    def log(self, n_chunks: int) -> None:
+        """
+        Logs stage utilization and the time saved against transcribing the
+        chunks one after another, i.e. the summed transcription time. The
+        encoding a sequential loop also waits for is left out, so the saving
+        is a lower bound.
+        """
+        wall = max(self.wall_seconds, 1e-9)
+
+        logger.info(
+            "Pipeline processed %d chunks in %.2fs: encode stage %.0f%% busy (%.2fs, %.2fs blocked "
+            "by backpressure), transcribe stage %.0f%% busy (%.2f worker-seconds on %d workers), "
+            "saved %.2fs against sequential transcription",
+            n_chunks, self.wall_seconds,
+            100 * self.encode_seconds / wall, self.encode_seconds, self.backpressure_seconds,
+            100 * self.transcribe_seconds / (wall * self.workers), self.transcribe_seconds,
+            self.workers, self.saved_seconds()
+        )
+
+    def saved_seconds(self) -> float:
+        """Time saved against transcribing the chunks sequentially, 0 if the run was slower."""
+        return max(0.0, self.transcribe_seconds - self.wall_seconds)
+
+
+class ChunkEncoder:
+    """
+    Encodes a run of planned chunks of a raw PCM file into mp3 files with
+    one ffmpeg segment muxer process, fed through stdin with backpressure.
+
+    chunks must be contiguous in the plan, but may start anywhere: the PCM
+    is fed from the start of the first chunk and the cut points are relative
+    to it. Every chunk takes one of slots before its samples are fed; the
+    consumer must release a slot for each chunk yielded by completed_chunks().
+    """
+
+    def __init__(self, pcm_path: str, video_id: str, chunks: list, slots: threading.Semaphore):
+        self.pcm_path = pcm_path
+        self.base_path = f"/tmp/{video_id}"
+        self.chunks = chunks
+        self.slots = slots
+        self.stop = threading.Event()
+        self.backpressure_seconds = 0.0
+        self.encode_seconds = 0.0
+        self._process = None
+        self._stderr = []
+        self._feed_error = None
+
+    def chunk_path(self, position: int) -> str:
+        """Path of the mp3 file of the chunk at position in the run."""
+        return f"{self.base_path}/chunk_{self.chunks[position]['index']:03}.mp3"
+
+    def _command(self) -> list:
+        # ffmpeg timestamps start at 0 with the first fed sample
+        offset = self.chunks[0]["start"]
+        segment_times = ",".join(f"{chunk['start'] - offset:.3f}" for chunk in self.chunks[1:])
+
+        return [
+            "/opt/bin/ffmpeg",
+            "-nostdin",
+            "-y",
+            "-f", "s16le",
+            "-ar", str(SAMPLE_RATE),
+            "-ac", "1",
+            "-i", "pipe:0",
+            "-acodec", "libmp3lame",
+            "-b:a", f"{CHUNK_BITRATE_KBPS}k",
+            "-f", "segment",
+            "-reset_timestamps", "1",
+            "-segment_start_number", str(self.chunks[0]["index"]),
+            *(["-segment_times", segment_times] if segment_times else []),
+            # One "file,start,end" line per segment, written once its file is closed
+            "-segment_list", "pipe:1",
+            "-segment_list_type", "csv",
+            f"{self.base_path}/chunk_%03d.mp3"
+        ]
+
+    def _acquire_slot(self) -> bool:
+        started = time.perf_counter()
+        try:
+            while not self.stop.is_set():
+                if self.slots.acquire(timeout=POLL_INTERVAL_SECONDS):
+                    return True
+            return False
+        finally:
+            self.backpressure_seconds += time.perf_counter() - started
+
+    def _feed(self) -> None:
+        samples = load_pcm(self.pcm_path)
+        last = self.chunks[-1]
+        bounds = [int(round(chunk["start"] * SAMPLE_RATE)) for chunk in self.chunks]
+        bounds.append(min(len(samples), int(round((last["start"] + last["duration"]) * SAMPLE_RATE))))
+
+        try:
+            for position in range(len(self.chunks)):
+                if not self._acquire_slot():
+                    break
+
+                for offset in range(bounds[position], bounds[position + 1], FEED_BLOCK_SAMPLES):
+                    block = samples[offset:min(offset + FEED_BLOCK_SAMPLES, bounds[position + 1])]
+                    self._process.stdin.write(memoryview(np.ascontiguousarray(block)))
+        except (BrokenPipeError, OSError) as e:
+            self._feed_error = e
+        finally:
+            try:
+                self._process.stdin.close()
+            except (BrokenPipeError, OSError):
+                pass
+
+    def completed_chunks(self) -> Iterator[tuple]:
+        """
+        Starts the encoder and yields (position, path) of every chunk as soon
+        as ffmpeg closed its file.
+
+        Raises:
+            RuntimeError: If ffmpeg fails or exits before all chunks were encoded.
+        """
+        started = time.perf_counter()
+        completed = 0
+
+        self._process = subprocess.Popen(self._command(), stdin=subprocess.PIPE,
+                                         stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        stderr_reader = threading.Thread(target=lambda: self._stderr.append(self._process.stderr.read()))
+        feeder = threading.Thread(target=self._feed)
+        stderr_reader.start()
+        feeder.start()
+
+        try:
+            # A segment that is still written, or cut short by an exiting ffmpeg, is never listed
+            for line in self._process.stdout:
+                name = line.decode(errors="replace").strip().split(",", 1)[0]
+                if completed == len(self.chunks) or name != os.path.basename(self.chunk_path(completed)):
+                    raise RuntimeError(f"ffmpeg listed unexpected chunk file {name!r}")
+
+                yield completed, self.chunk_path(completed)
+                completed += 1
+
+            self._process.wait()
+        finally:
+            self.stop.set()
+            if self._process.poll() is None:
+                self._process.kill()
+            self._process.wait()
+            feeder.join()
+            stderr_reader.join()
+            self.encode_seconds = time.perf_counter() - started - self.backpressure_seconds
+
+        if self._process.returncode != 0 or completed < len(self.chunks):
+            stderr = b"".join(self._stderr).decode(errors="replace")
+            raise RuntimeError(f"ffmpeg chunk encoding failed after {completed} of {len(self.chunks)} "
+                               f"chunks: {stderr or self._feed_error}")
+
+
+def wanted_runs(chunks: list, wanted: set) -> list:
+    """Splits the wanted chunks of the plan into runs of consecutive chunks."""
+    runs = []
+    previous = None
+
+    for position, chunk in enumerate(chunks):
+        if chunk["index"] not in wanted:
+            continue
+        if previous == position - 1:
+            runs[-1].append(chunk)
+        else:
+            runs.append([chunk])
+        previous = position
+
+    return runs
+
+
+def run_transcription_pipeline(pcm_path: str, video_id: str, chunks: list, wanted: set,
+                               transcribe: Callable[[str], dict],
+                               on_result: Optional[Callable[[dict, dict], None]] = None,
+                               max_workers: int = 4, max_pending: Optional[int] = None) -> dict:
+    """
+    Encodes and transcribes the chunks whose index is in wanted, overlapping
+    both stages.
+
+    chunks is the whole plan; the chunks that are not wanted are neither fed
+    to ffmpeg nor encoded. At most max_pending encoded chunks (max_workers + 1
+    by default) sit on disk at any time.
+    on_result is called from the worker with (chunk, partial) as soon as a
+    chunk was transcribed. Every failed chunk is logged on its own and a
+    single RuntimeError naming all of them is raised once the pipeline drained.
+
+    Returns the partial transcripts by chunk index.
+    """
+    max_workers = max(1, max_workers)
+    max_pending = max_pending if max_pending is not None else max_workers + 1
+    # A chunk is only finished once ffmpeg sees samples of the next one
+    slots = threading.Semaphore(max(2, max_pending))
+    stats = PipelineStats(max_workers)
+    results = {}
+    errors = {}
+
+    def _work(chunk: dict, path: str) -> None:
+        started = time.perf_counter()
+        try:
+            results[chunk["index"]] = transcribe(path)
+            if on_result is not None:
+                on_result(chunk, results[chunk["index"]])
+        except Exception as e:  # pylint: disable=broad-except
+            logger.error("Transcription of chunk %d (%s) failed: %s", chunk["index"], path, e)
+            errors[chunk["index"]] = str(e)
+        finally:
+            stats.add_transcribe_time(time.perf_counter() - started)
+            os.remove(path)
+            slots.release()
+
+    started = time.perf_counter()
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for run in wanted_runs(chunks, wanted):
+            encoder = ChunkEncoder(pcm_path, video_id, run, slots)
+            for position, path in encoder.completed_chunks():
+                executor.submit(_work, run[position], path)
+            stats.encode_seconds += encoder.encode_seconds
+            stats.backpressure_seconds += encoder.backpressure_seconds
+
+    stats.wall_seconds = time.perf_counter() - started
+    stats.log(len(wanted))
+
+    if errors:
+        failed = ", ".join(f"chunk {index}: {error}" for index, error in sorted(errors.items()))
+        raise RuntimeError(f"Transcription failed for {len(errors)} of {len(wanted)} chunks ({failed})")
+
+    return results
@@ -0,0 +1,63 @@
+"""
+Stand-in for the ffmpeg segment muxer of the chunk pipeline: splits the s16le
+PCM read from stdin at -segment_times into chunk_%03d files numbered from
+-segment_start_number, without encoding. Like ffmpeg, it opens the next file
+only once samples past a cut point arrive, and lists every closed file on
+stdout for -segment_list pipe:1. Every run appends
+"<start number> <samples read>" to the file named by FAKE_FFMPEG_LOG.
+With FAKE_FFMPEG_FAIL_AFTER=n it exits with an error after closing n files,
+leaving the next one half-written.
+"""
+import os
+import sys
+
+SAMPLE_WIDTH = 2
+
+
+def main(args: list) -> None:
+    options = dict(zip(args[:-1], args[1:]))
+    sample_rate = int(options["-ar"])
+    number = int(options.get("-segment_start_number", 0))
+    times = options.get("-segment_times")
+    cuts = [int(round(float(t) * sample_rate)) for t in times.split(",")] if times else []
+    pattern = args[-1]
+    listed = options.get("-segment_list") == "pipe:1"
+    fail_after = int(os.environ.get("FAKE_FFMPEG_FAIL_AFTER", "-1"))
+    closed = 0
+
+    read = 0
+    output = None
+    while True:
+        data = sys.stdin.buffer.read(SAMPLE_WIDTH * 4096)
+        if not data:
+            break
+        data_samples = len(data) // SAMPLE_WIDTH
+        while data_samples:
+            if output is None:
+                output = open(pattern % number, "wb")
+            limit = cuts[0] - read if cuts else data_samples
+            take = min(data_samples, limit)
+            output.write(data[:take * SAMPLE_WIDTH])
+            data, data_samples, read = data[take * SAMPLE_WIDTH:], data_samples - take, read + take
+            if closed == fail_after:
+                output.close()
+                sys.exit(1)
+            if cuts and read == cuts[0]:
+                cuts.pop(0)
+                output.close()
+                output = None
+                closed += 1
+                if listed:
+                    print(f"{os.path.basename(pattern % number)},0,0", flush=True)
+                number += 1
+    if output is not None:
+        output.close()
+        if listed:
+            print(f"{os.path.basename(pattern % number)},0,0", flush=True)
+
+    with open(os.environ["FAKE_FFMPEG_LOG"], "a", encoding="utf-8") as log:
+        log.write(f"{options.get('-segment_start_number', 0)} {read}\n")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
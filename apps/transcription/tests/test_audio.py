@@ -0,0 +1,167 @@
+"""
+Tests of silence detection and chunk planning on synthetic speech/silence maps.
+"""
+import numpy as np
+import pytest
+
+from audio import SAMPLE_RATE, detect_speech_segments, plan_chunks
+
+FRAME_SECONDS = 0.02
+
+
+def write_pcm(path, segments) -> str:
+    """Writes a PCM file of (kind, seconds) segments, a 440 Hz tone for speech and zeros for silence."""
+    parts = []
+    for kind, seconds in segments:
+        n_samples = int(round(seconds * SAMPLE_RATE))
+        if kind == "speech":
+            t = np.arange(n_samples) / SAMPLE_RATE
+            parts.append((8000 * np.sin(2 * np.pi * 440 * t)).astype("<i2"))
+        else:
+            parts.append(np.zeros(n_samples, dtype="<i2"))
+    np.concatenate(parts).tofile(path)
+    return str(path)
+
+
+def speech_map(speech_seconds: float, silence_seconds: float, count: int) -> tuple:
+    """Speech segments separated by silences, with the total duration."""
+    segments = []
+    start = 0.0
+    for _ in range(count):
+        segments.append((start, start + speech_seconds))
+        start += speech_seconds + silence_seconds
+    return segments, segments[-1][1]
+
+
+def assert_covers(plan: list, total_duration: float) -> None:
+    assert plan[0][0] == 0.0
+    assert plan[-1][1] == pytest.approx(total_duration)
+    for (_, end), (start, _) in zip(plan, plan[1:]):
+        assert start == end
+    assert all(end > start for start, end in plan)
+
+
+def test_detects_silence_map(tmp_path):
+    pcm = write_pcm(tmp_path / "audio.pcm", [
+        ("speech", 5), ("silence", 2), ("speech", 3), ("silence", 0.5), ("speech", 4), ("silence", 1.5)
+    ])
+
+    speech, silence, total = detect_speech_segments(pcm, min_silence_dur=1.0)
+
+    assert total == pytest.approx(16.0)
+    # The 0.5 s pause is shorter than min_silence_dur and stays inside speech
+    assert silence == pytest.approx([(5.0, 7.0), (14.5, 16.0)], abs=FRAME_SECONDS)
+    assert speech == pytest.approx([(0.0, 5.0), (7.0, 14.5)], abs=FRAME_SECONDS)
+
+
+def test_detects_speech_without_silence(tmp_path):
+    pcm = write_pcm(tmp_path / "audio.pcm", [("speech", 3.01)])
+
+    speech, silence, total = detect_speech_segments(pcm)
+
+    assert silence == []
+    assert speech == [(0.0, total)]
+
+
+def test_empty_audio(tmp_path):
+    pcm = tmp_path / "audio.pcm"
+    pcm.write_bytes(b"")
+
+    assert detect_speech_segments(str(pcm)) == ([], [], 0.0)
+    assert plan_chunks([], 0.0) == []
+
+
+def test_chunks_are_balanced_and_cut_in_silences():
+    speech, total = speech_map(speech_seconds=58, silence_seconds=2, count=100)
+
+    plan = plan_chunks(speech, total, parallelism=10)
+
+    assert_covers(plan, total)
+    assert len(plan) == 10
+    durations = [end - start for start, end in plan]
+    # Silences are 60 s apart, a cut moves at most 30 s from the ideal point
+    assert max(durations) - min(durations) <= 60
+    silences = [(end, next_start) for (_, end), (next_start, _) in zip(speech, speech[1:])]
+    for _, cut in plan[:-1]:
+        assert any(start < cut < end for start, end in silences)
+
+
+def test_duration_ceiling_raises_chunk_count():
+    speech, total = speech_map(speech_seconds=28, silence_seconds=2, count=200)
+
+    plan = plan_chunks(speech, total, parallelism=2, max_chunk_duration=600)
+
+    assert_covers(plan, total)
+    assert len(plan) >= total / 600
+    assert all(end - start <= 600 for start, end in plan)
+
+
+def test_byte_ceiling_raises_chunk_count():
+    speech, total = speech_map(speech_seconds=28, silence_seconds=2, count=200)
+
+    # 1000 bytes per second and 300 kB per chunk: a 300 s ceiling below the duration ceiling
+    plan = plan_chunks(speech, total, parallelism=1, max_chunk_duration=900,
+                       max_chunk_bytes=300_000, bytes_per_second=1000)
+
+    assert_covers(plan, total)
+    assert all((end - start) * 1000 <= 300_000 for start, end in plan)
+
+
+def test_hard_cuts_without_silence():
+    total = 3000.0
+
+    plan = plan_chunks([(0.0, total)], total, parallelism=1, max_chunk_duration=900)
+
+    assert_covers(plan, total)
+    assert len(plan) == 4
+    assert all(end - start <= 900 for start, end in plan)
+    assert [end - start for start, end in plan] == pytest.approx([750.0] * 4)
+
+
+def test_hard_cut_inside_long_speech_run():
+    # Silences only at the start and end, the speech between exceeds the ceiling
+    speech = [(0.0, 10.0), (12.0, 1500.0), (1502.0, 1510.0)]
+
+    plan = plan_chunks(speech, 1510.0, parallelism=1, max_chunk_duration=600)
+
+    assert_covers(plan, 1510.0)
+    assert all(end - start <= 600 for start, end in plan)
+
+
+def test_min_chunk_duration_merges_short_audio():
+    speech, total = speech_map(speech_seconds=9, silence_seconds=1, count=9)
+
+    plan = plan_chunks(speech, total, parallelism=10, min_chunk_duration=30)
+
+    assert_covers(plan, total)
+    # 89 s of audio fit two chunks of at least about 30 s, not ten
+    assert len(plan) == 2
+
+
+def test_audio_below_min_chunk_duration_is_one_chunk():
+    plan = plan_chunks([(0.0, 12.0)], 12.0, parallelism=10, min_chunk_duration=30)
+
+    assert plan == [(0.0, 12.0)]
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_random_maps_are_covered_within_ceiling(seed):
+    rng = np.random.default_rng(seed)
+    speech = []
+    start = 0.0
+    for _ in range(rng.integers(1, 300)):
+        end = start + float(rng.uniform(1, 120))
+        speech.append((start, end))
+        start = end + float(rng.uniform(0, 3))
+    total = speech[-1][1]
+
+    plan = plan_chunks(speech, total, parallelism=int(rng.integers(1, 16)), max_chunk_duration=300,
+                       min_chunk_duration=float(rng.uniform(5, 60)))
+
+    assert_covers(plan, total)
+    assert all(end - start <= 300 + 1e-9 for start, end in plan)
+
+
+def test_invalid_ceiling():
+    with pytest.raises(ValueError):
+        plan_chunks([(0.0, 10.0)], 10.0, max_chunk_bytes=0)
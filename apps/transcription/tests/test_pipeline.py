@@ -0,0 +1,112 @@
+"""
+Tests of the chunk pipeline with a fake ffmpeg that splits the fed PCM at
+the requested cut points, so the samples of every encoded chunk can be
+checked against the plan.
+"""
+import os
+import shutil
+import sys
+import uuid
+
+import numpy as np
+import pytest
+
+import pipeline
+from audio import SAMPLE_RATE
+
+FAKE_FFMPEG = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fake_ffmpeg.py")
+
+# Chunk starts and durations in seconds, the chunks cover 4.6 s of audio
+PLAN = [
+    {"index": 0, "start": 0.0, "duration": 1.0},
+    {"index": 1, "start": 1.0, "duration": 1.25},
+    {"index": 2, "start": 2.25, "duration": 1.25},
+    {"index": 3, "start": 3.5, "duration": 1.1},
+]
+
+
+@pytest.fixture(name="encoder_run")
+def fixture_encoder_run(tmp_path, monkeypatch):
+    """Runs the pipeline on a PCM of counting samples with the fake ffmpeg, returns (results, muxer runs)."""
+    samples = (np.arange(int(4.6 * SAMPLE_RATE)) % 30000).astype("<i2")
+    pcm_path = str(tmp_path / "audio.pcm")
+    samples.tofile(pcm_path)
+    log_path = tmp_path / "ffmpeg.log"
+
+    original_command = pipeline.ChunkEncoder._command  # pylint: disable=protected-access
+    monkeypatch.setattr(pipeline.ChunkEncoder, "_command",
+                        lambda self: [sys.executable, FAKE_FFMPEG, *original_command(self)[1:]])
+    monkeypatch.setenv("FAKE_FFMPEG_LOG", str(log_path))
+
+    video_id = f"pipeline-test-{uuid.uuid4().hex}"
+    os.makedirs(f"/tmp/{video_id}")
+
+    def transcribe(path: str) -> dict:
+        chunk_samples = np.fromfile(path, dtype="<i2")
+        return {"first": int(chunk_samples[0]), "count": len(chunk_samples)}
+
+    def run(wanted: set, **kwargs) -> tuple:
+        results = pipeline.run_transcription_pipeline(pcm_path, video_id, PLAN, wanted, transcribe, **kwargs)
+        # Every chunk file is removed once transcribed
+        assert not os.listdir(f"/tmp/{video_id}")
+        runs = [tuple(map(int, line.split())) for line in log_path.read_text().splitlines()]
+        return results, runs
+
+    yield run
+    shutil.rmtree(f"/tmp/{video_id}", ignore_errors=True)
+
+
+def chunk_samples(chunk: dict) -> dict:
+    first = int(round(chunk["start"] * SAMPLE_RATE))
+    last = int(round((chunk["start"] + chunk["duration"]) * SAMPLE_RATE))
+    return {"first": first % 30000, "count": last - first}
+
+
+def test_encodes_the_whole_plan_in_one_run(encoder_run):
+    results, runs = encoder_run({0, 1, 2, 3})
+
+    assert results == {chunk["index"]: chunk_samples(chunk) for chunk in PLAN}
+    assert runs == [(0, int(4.6 * SAMPLE_RATE))]
+
+
+def test_resume_does_not_reencode_completed_chunks(encoder_run):
+    # Chunks 0 and 1 finished before the retry
+    results, runs = encoder_run({2, 3})
+
+    assert results == {2: chunk_samples(PLAN[2]), 3: chunk_samples(PLAN[3])}
+    # A single muxer fed from the start of chunk 2 on
+    assert runs == [(2, chunk_samples(PLAN[2])["count"] + chunk_samples(PLAN[3])["count"])]
+
+
+def test_skips_completed_chunks_between_missing_ones(encoder_run):
+    results, runs = encoder_run({0, 2}, max_workers=1, max_pending=2)
+
+    assert results == {0: chunk_samples(PLAN[0]), 2: chunk_samples(PLAN[2])}
+    assert runs == [(0, chunk_samples(PLAN[0])["count"]), (2, chunk_samples(PLAN[2])["count"])]
+
+
+def test_wanted_runs():
+    assert pipeline.wanted_runs(PLAN, {0, 1, 3}) == [PLAN[0:2], PLAN[3:4]]
+    assert pipeline.wanted_runs(PLAN, set()) == []
+
+
+def test_time_saved_against_sequential_transcription():
+    stats = pipeline.PipelineStats(workers=4)
+    stats.wall_seconds = 3.0
+    stats.encode_seconds = 1.0
+    stats.transcribe_seconds = 10.0
+    assert stats.saved_seconds() == 7.0
+
+    stats.wall_seconds = 12.0
+    assert stats.saved_seconds() == 0.0
+
+
+def test_ffmpeg_exiting_early_fails_without_the_partial_chunk(encoder_run, monkeypatch):
+    monkeypatch.setenv("FAKE_FFMPEG_FAIL_AFTER", "1")
+    transcribed = []
+
+    with pytest.raises(RuntimeError, match="after 1 of 4 chunks"):
+        encoder_run({0, 1, 2, 3}, on_result=lambda chunk, _partial: transcribed.append(chunk["index"]))
+
+    # The half-written chunk 1 is never handed to the workers
+    assert transcribed == [0]
@@ -0,0 +1,90 @@
+"""
+Content-addressed transcript cache for the transcription service.
+
+Transcripts are stored in S3 under a shared prefix, keyed by the SHA-256 of
+the extracted PCM audio. Partial chunk transcripts are cached the same way,
+keyed by the hash of the PCM samples of the chunk, so re-uploads of the same
+media skip ffmpeg and Whisper completely or partially.
+"""
+import logging
+import threading
+from typing import Optional
+
+from botocore.exceptions import ClientError
+
+from s3_objects import get_json, put_json
+
+logger = logging.getLogger()
+
+
+class TranscriptCache:
+    """
+    S3-backed cache for full and per-chunk transcripts.
+
+    Entries are namespaced by the transcription model, so switching models
+    never returns transcripts of another model. Cache failures are logged and
+    treated as misses, they never fail a transcription job.
+
+    Attributes:
+        bucket (str): S3 bucket holding the cache
+        prefix (str): Shared key prefix of all cache entries
+        namespace (str): Model namespace below the prefix
+        hits (int): Number of cache hits since creation
+        misses (int): Number of cache misses since creation
+    """
+
+    def __init__(self, bucket: str, prefix: str, namespace: str):
+        self.bucket = bucket
+        self.prefix = prefix.strip("/")
+        self.namespace = namespace
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def _key(self, kind: str, content_hash: str) -> str:
+        return f"{self.prefix}/{self.namespace}/{kind}/{content_hash}.json"
+
+    def _get(self, key: str) -> Optional[dict]:
+        try:
+            entry = get_json(self.bucket, key)
+        except ClientError as e:
+            logger.warning("Transcript cache lookup of %s failed: %s", key, e)
+            entry = None
+
+        with self._lock:
+            if entry is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+
+        return entry
+
+    def _put(self, key: str, entry: dict) -> None:
+        try:
+            put_json(self.bucket, key, entry)
+        except ClientError as e:
+            logger.warning("Transcript cache store of %s failed: %s", key, e)
+
+    def get_transcript(self, audio_hash: str) -> Optional[dict]:
+        """Returns the cached transcript of the audio, or None on a miss."""
+        return self._get(self._key("audio", audio_hash))
+
+    def put_transcript(self, audio_hash: str, transcript: dict) -> None:
+        """Stores the merged transcript of the audio."""
+        self._put(self._key("audio", audio_hash), transcript)
+
+    def get_chunk(self, chunk_hash: str) -> Optional[dict]:
+        """Returns the cached partial transcript of a chunk, or None on a miss."""
+        return self._get(self._key("chunks", chunk_hash))
+
+    def put_chunk(self, chunk_hash: str, partial: dict) -> None:
+        """Stores the partial transcript of a chunk, relative to the chunk start."""
+        self._put(self._key("chunks", chunk_hash), partial)
+
+    def log_stats(self) -> None:
+        """Logs the hit and miss counters."""
+        total = self.hits + self.misses
+        hit_rate = self.hits / total if total else 0.0
+
+        logger.info("Transcript cache: %d hits, %d misses (hit rate %.0f%%)",
+                    self.hits, self.misses, hit_rate * 100)
@@ -0,0 +1,167 @@
+"""
+Speech-to-text backends for the transcription service.
+
+Every backend transcribes a single audio file and returns the same shape:
+{"text": str, "segments": [{"start": float, "end": float, "text": str}]}
+with timestamps relative to the start of the file.
+"""
+import logging
+import os
+import threading
+from typing import Callable
+
+logger = logging.getLogger()
+
+
+class TranscriptionBackend:
+    """
+    Interface of a speech-to-text backend.
+
+    Attributes:
+        name (str): Identifier of the backend and model, used to namespace
+            cached transcripts of different engines
+    """
+
+    name = "base"
+
+    def transcribe(self, audio_file_path: str) -> dict:
+        """Transcribes an audio file into {"text", "segments"}."""
+        raise NotImplementedError
+
+
+class OpenAIWhisperBackend(TranscriptionBackend):
+    """
+    Transcribes audio with the hosted OpenAI Whisper API.
+    get_client returns the OpenAI client and is called per request, so the
+    client is only created once the backend is actually used. Requests go
+    through the scheduler when one is given (see openai_scheduler).
+    """
+
+    def __init__(self, get_client: Callable, model: str = "whisper-1", scheduler=None):
+        self.get_client = get_client
+        self.model = model
+        self.name = model
+        self.scheduler = scheduler
+
+    def _create(self, audio_file_path: str):
+        # Reopened per attempt, a failed upload leaves the file position at an arbitrary offset
+        with open(audio_file_path, "rb") as f:
+            return self.get_client().audio.transcriptions.create(
+                model=self.model,
+                file=f,
+                response_format="verbose_json"
+            )
+
+    def transcribe(self, audio_file_path: str) -> dict:
+        if self.scheduler is not None:
+            # Whisper is limited by requests only, audio does not count against the token budget.
+            # Chunks are constant bitrate, so their size measures the audio duration.
+            transcript = self.scheduler.call(self._create, audio_file_path,
+                                             work=os.path.getsize(audio_file_path))
+        else:
+            transcript = self._create(audio_file_path)
+
+        segments = [
+            {
+                "start": seg.start,
+                "end": seg.end,
+                "text": seg.text.strip()
+            }
+            for seg in transcript.segments
+        ]
+
+        return {
+            "text": transcript.text.strip(),
+            "segments": segments
+        }
+
+
+class LocalWhisperBackend(TranscriptionBackend):
+    """
+    Transcribes audio on the local CPU with a quantized Whisper-family model.
+
+    Uses faster-whisper (CTranslate2). The package is not part of the Lambda
+    bundle, it has to be provided by the runtime (e.g. a container image or a
+    layer) when this backend is selected. The model is loaded on first use.
+    """
+
+    def __init__(self, model_size: str = "small", compute_type: str = "int8",
+                 cpu_threads: int = 0, num_workers: int = 1, batch_size: int = 8,
+                 download_root: str = "/tmp/whisper-models"):
+        self.model_size = model_size
+        self.compute_type = compute_type
+        self.cpu_threads = cpu_threads
+        self.num_workers = num_workers
+        self.batch_size = batch_size
+        self.download_root = download_root
+        self.name = f"faster-whisper-{model_size}-{compute_type}"
+        self._pipeline = None
+        self._batched = False
+        self._lock = threading.Lock()
+
+    def _get_pipeline(self):
+        with self._lock:
+            if self._pipeline is None:
+                # pylint: disable=import-error,import-outside-toplevel
+                from faster_whisper import WhisperModel
+                # pylint: enable=import-error,import-outside-toplevel
+
+                logger.info("Loading local Whisper model %s (%s)", self.model_size, self.compute_type)
+
+                model = WhisperModel(
+                    self.model_size,
+                    device="cpu",
+                    compute_type=self.compute_type,
+                    cpu_threads=self.cpu_threads,
+                    num_workers=self.num_workers,
+                    download_root=self.download_root
+                )
+
+                try:
+                    # pylint: disable=import-error,import-outside-toplevel
+                    from faster_whisper import BatchedInferencePipeline
+                    # pylint: enable=import-error,import-outside-toplevel
+                    self._pipeline = BatchedInferencePipeline(model=model)
+                    self._batched = True
+                except ImportError:
+                    logger.warning("faster-whisper without batched inference, using sequential decoding")
+                    self._pipeline = model
+
+        return self._pipeline
+
+    def transcribe(self, audio_file_path: str) -> dict:
+        pipeline = self._get_pipeline()
+
+        options = {}
+        if self._batched and self.batch_size > 1:
+            options["batch_size"] = self.batch_size
+
+        raw_segments, _ = pipeline.transcribe(audio_file_path, **options)
+
+        segments = [
+            {
+                "start": seg.start,
+                "end": seg.end,
+                "text": seg.text.strip()
+            }
+            for seg in raw_segments
+        ]
+
+        return {
+            "text": " ".join(seg["text"] for seg in segments).strip(),
+            "segments": segments
+        }
+
+
+def create_local_backend_from_env() -> LocalWhisperBackend:
+    """
+    Creates the local backend configured by the LOCAL_WHISPER_* environment variables.
+    """
+    return LocalWhisperBackend(
+        model_size=os.environ.get("LOCAL_WHISPER_MODEL", "small"),
+        compute_type=os.environ.get("LOCAL_WHISPER_COMPUTE_TYPE", "int8"),
+        cpu_threads=int(os.environ.get("LOCAL_WHISPER_CPU_THREADS", "0")),
+        num_workers=int(os.environ.get("LOCAL_WHISPER_NUM_WORKERS", "1")),
+        batch_size=int(os.environ.get("LOCAL_WHISPER_BATCH_SIZE", "8")),
+        download_root=os.environ.get("LOCAL_WHISPER_MODEL_DIR", "/tmp/whisper-models")
+    )
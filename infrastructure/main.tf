@@ -60,33 +60,40 @@ module "embeddings" {
 }
 
 module "chats" {
-  source               = "./modules/lambdas/chats"
-  aws_region           = var.region
-  application_name     = var.application_name
-  environment          = local.environment
-  domain_name          = local.domain_name
-  openai_secret_arn    = module.secrets.openai_secret_arn
-  pinecone_secret_arn  = module.secrets.pinecone_secret_arn
-  langsmith_secret_arn = module.secrets.langsmith_secret_arn
-  pinecone_index_name  = local.pinecone_index_name
-  langchain_layer_arn  = module.layers.langchain_layer_arn
-  tags                 = local.tags
+  source                 = "./modules/lambdas/chats"
+  aws_region             = var.region
+  application_name       = var.application_name
+  environment            = local.environment
+  domain_name            = local.domain_name
+  dynamodb_table_arn     = module.database.dynamodb_table_arn
+  dynamodb_table_name    = module.database.dynamodb_table_name
+  openai_secret_arn      = module.secrets.openai_secret_arn
+  pinecone_secret_arn    = module.secrets.pinecone_secret_arn
+  langsmith_secret_arn   = module.secrets.langsmith_secret_arn
+  s3_video_bucket_arn    = module.storage.s3_video_bucket_arn
+  s3_video_bucket_name   = module.storage.s3_video_bucket_name
+  pinecone_index_name    = local.pinecone_index_name
+  langchain_layer_arn    = module.layers.langchain_layer_arn
+  stream_endpoint        = module.websocket.websocket_management_endpoint
+  stream_connections_arn = module.websocket.websocket_connections_arn
+  tags                   = local.tags
 }
 
 module "graphql" {
-  source               = "./modules/lambdas/graphql"
-  aws_region           = var.region
-  application_name     = var.application_name
-  environment          = local.environment
-  domain_name          = local.domain_name
-  sqs_output           = module.sqs.sqs_transcription_queue_arn
-  sqs_output_url       = module.sqs.sqs_transcription_queue_url
-  dynamodb_table_arn   = module.database.dynamodb_table_arn
-  dynamodb_table_name  = module.database.dynamodb_table_name
-  s3_video_bucket_arn  = module.storage.s3_video_bucket_arn
-  s3_video_bucket_name = module.storage.s3_video_bucket_name
-  chats_lambda_arn     = module.chats.chats_lambda_arn
-  tags                 = local.tags
+  source                = "./modules/lambdas/graphql"
+  aws_region            = var.region
+  application_name      = var.application_name
+  environment           = local.environment
+  domain_name           = local.domain_name
+  sqs_output            = module.sqs.sqs_transcription_queue_arn
+  sqs_output_url        = module.sqs.sqs_transcription_queue_url
+  dynamodb_table_arn    = module.database.dynamodb_table_arn
+  dynamodb_table_name   = module.database.dynamodb_table_name
+  s3_video_bucket_arn   = module.storage.s3_video_bucket_arn
+  s3_video_bucket_name  = module.storage.s3_video_bucket_name
+  chats_lambda_arn      = module.chats.chats_lambda_arn
+  chats_stream_endpoint = module.websocket.websocket_management_endpoint
+  tags                  = local.tags
 }
 
 module "layers" {
@@ -122,6 +129,18 @@ module "api" {
   tags                      = local.tags
 }
 
+module "websocket" {
+  source                       = "./modules/websocket"
+  aws_region                   = var.region
+  application_name             = var.application_name
+  environment                  = local.environment
+  authorizer_lambda_invoke_uri = module.graphql.stream_authorizer_lambda_invoke_uri
+  authorizer_lambda_arn        = module.graphql.stream_authorizer_lambda_arn
+  connection_lambda_invoke_uri = module.graphql.stream_connection_lambda_invoke_uri
+  connection_lambda_arn        = module.graphql.stream_connection_lambda_arn
+  tags                         = local.tags
+}
+
 module "sqs" {
   source           = "./modules/sqs"
   application_name = var.application_name
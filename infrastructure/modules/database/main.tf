@@ -19,6 +19,12 @@ resource "aws_dynamodb_table" "knowledge_table" {
     type = "S"
   }
 
+  # Connections to the chats WebSocket API expire with the connection
+  ttl {
+    attribute_name = "expiresAt"
+    enabled        = true
+  }
+
   global_secondary_index {
     name            = "UserIdIndex"
     hash_key        = "userId"
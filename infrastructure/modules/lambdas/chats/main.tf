@@ -26,16 +26,27 @@ resource "aws_lambda_function" "chats-function" {
 
   environment {
     variables = {
-      ENVIRONMENT         = var.environment
-      OPENAI_SECRET_ARN   = var.openai_secret_arn
-      PINECONE_SECRET_ARN = var.pinecone_secret_arn
-      PINECONE_INDEX_NAME = var.pinecone_index_name
+      ENVIRONMENT                    = var.environment
+      OPENAI_SECRET_ARN              = var.openai_secret_arn
+      PINECONE_SECRET_ARN            = var.pinecone_secret_arn
+      PINECONE_INDEX_NAME            = var.pinecone_index_name
+      S3_VIDEO_BUCKET_NAME           = var.s3_video_bucket_name
+      LEXICAL_INDEX_S3_PREFIX        = "lexical-index"
+      SEMANTIC_VIDEO_CHAT_TABLE_NAME = var.dynamodb_table_name
+      CHATS_STREAM_ENDPOINT          = var.stream_endpoint
     }
   }
 
   tags = var.tags
 }
 
+# Streamed answers are invoked asynchronously, a failed run already sent its
+# error event to the client and is not run again
+resource "aws_lambda_function_event_invoke_config" "chats-function" {
+  function_name          = aws_lambda_function.chats-function.function_name
+  maximum_retry_attempts = 0
+}
+
 resource "aws_iam_role" "function_role" {
   name = "${local.function_name}-function-role"
 
@@ -77,6 +88,39 @@ resource "aws_iam_role_policy" "function_policy" {
           var.pinecone_secret_arn,
           var.langsmith_secret_arn
         ]
+      },
+      {
+        Effect : "Allow",
+        Action : [
+          "s3:GetObject",
+        ],
+        Resource : "${var.s3_video_bucket_arn}/lexical-index/*"
+      },
+      {
+        Effect : "Allow",
+        Action : [
+          "s3:ListBucket",
+        ],
+        Resource : var.s3_video_bucket_arn,
+        Condition : {
+          StringLike : {
+            "s3:prefix" : ["lexical-index/*"]
+          }
+        }
+      },
+      {
+        Effect : "Allow",
+        Action : [
+          "dynamodb:UpdateItem",
+        ],
+        Resource : var.dynamodb_table_arn
+      },
+      {
+        Effect : "Allow",
+        Action : [
+          "execute-api:ManageConnections",
+        ],
+        Resource : var.stream_connections_arn
       }
     ]
   })
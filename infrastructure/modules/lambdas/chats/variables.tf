@@ -46,4 +46,34 @@ variable "pinecone_index_name" {
 variable "langchain_layer_arn" {
   description = "LangChain layer arn"
   default     = ""
-}
\ No newline at end of file
+}
+
+variable "s3_video_bucket_arn" {
+  description = "Arn for the s3 storage bucket"
+  default     = ""
+}
+
+variable "s3_video_bucket_name" {
+  description = "Name for the s3 storage bucket"
+  default     = ""
+}
+
+variable "dynamodb_table_arn" {
+  description = "The ARN of the DynamoDB"
+  default     = ""
+}
+
+variable "dynamodb_table_name" {
+  description = "The name of the DynamoDB"
+  default     = ""
+}
+
+variable "stream_endpoint" {
+  description = "The management endpoint of the WebSocket API the answers are streamed to"
+  default     = ""
+}
+
+variable "stream_connections_arn" {
+  description = "The ARN of posting to the connections of the WebSocket API"
+  default     = ""
+}
@@ -32,6 +32,8 @@ resource "aws_lambda_function" "embeddings-function" {
       SEMANTIC_VIDEO_CHAT_TABLE_NAME = var.dynamodb_table_name
       PINECONE_INDEX_NAME            = var.pinecone_index_name
       S3_VIDEO_BUCKET_NAME           = var.s3_video_bucket_name
+      EMBEDDING_CACHE_S3_PREFIX      = "embedding-cache"
+      LEXICAL_INDEX_S3_PREFIX        = "lexical-index"
     }
   }
 
@@ -41,6 +43,9 @@ resource "aws_lambda_function" "embeddings-function" {
 resource "aws_lambda_event_source_mapping" "embeddings_mapping" {
   event_source_arn = var.sqs_trigger
   function_name    = aws_lambda_function.embeddings-function.arn
+  batch_size       = 10
+
+  function_response_types = ["ReportBatchItemFailures"]
 }
 
 resource "aws_iam_role" "function_role" {
@@ -88,6 +93,7 @@ resource "aws_iam_role_policy" "function_policy" {
         Action : [
           "dynamodb:GetItem",
           "dynamodb:UpdateItem",
+          "dynamodb:Query",
         ],
         Resource : var.dynamodb_table_arn
       },
@@ -108,6 +114,32 @@ resource "aws_iam_role_policy" "function_policy" {
           "s3:GetObject",
         ],
         Resource : "${var.s3_video_bucket_arn}/*"
+      },
+      {
+        Effect : "Allow",
+        Action : [
+          "s3:PutObject",
+        ],
+        Resource : [
+          "${var.s3_video_bucket_arn}/embedding-cache/*",
+          "${var.s3_video_bucket_arn}/lexical-index/*"
+        ]
+      },
+      {
+        # Deletes the lexical documents of deleted videos
+        Effect : "Allow",
+        Action : [
+          "s3:DeleteObject",
+        ],
+        Resource : "${var.s3_video_bucket_arn}/lexical-index/*"
+      },
+      {
+        # Lets cache lookups of missing keys fail with 404 instead of 403
+        Effect : "Allow",
+        Action : [
+          "s3:ListBucket",
+        ],
+        Resource : var.s3_video_bucket_arn
       }
     ]
   })
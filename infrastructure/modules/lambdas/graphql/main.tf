@@ -29,6 +29,54 @@ resource "aws_lambda_function" "graphql-function" {
       CHATS_LAMBDA_ARN               = var.chats_lambda_arn
       SEMANTIC_VIDEO_CHAT_TABLE_NAME = var.dynamodb_table_name
       S3_VIDEO_BUCKET_NAME           = var.s3_video_bucket_name
+      CHATS_STREAM_ENDPOINT          = var.chats_stream_endpoint
+    }
+  }
+
+  tags = var.tags
+}
+
+# Authorizer and $connect/$disconnect handler of the chats WebSocket API,
+# deployed from the bundle of the GraphQL API to share its authentication
+resource "aws_lambda_function" "stream-authorizer-function" {
+  function_name = "${local.function_name}-stream-authorizer"
+  handler       = "index.authorizeStreamConnection"
+  runtime       = local.function_runtime
+  timeout       = 10
+
+  filename         = local.function_zip
+  source_code_hash = filebase64sha256(local.function_zip)
+
+  role = aws_iam_role.function_role.arn
+
+  memory_size = 256
+
+  environment {
+    variables = {
+      ENVIRONMENT = var.environment
+    }
+  }
+
+  tags = var.tags
+}
+
+resource "aws_lambda_function" "stream-connection-function" {
+  function_name = "${local.function_name}-stream-connection"
+  handler       = "index.handleStreamConnection"
+  runtime       = local.function_runtime
+  timeout       = 10
+
+  filename         = local.function_zip
+  source_code_hash = filebase64sha256(local.function_zip)
+
+  role = aws_iam_role.function_role.arn
+
+  memory_size = 256
+
+  environment {
+    variables = {
+      ENVIRONMENT                    = var.environment
+      SEMANTIC_VIDEO_CHAT_TABLE_NAME = var.dynamodb_table_name
     }
   }
 
@@ -5,3 +5,19 @@ output "graphql_lambda_invoke_uri" {
 output "graphql_lambda_arn" {
   value = aws_lambda_function.graphql-function.arn
 }
+
+output "stream_authorizer_lambda_invoke_uri" {
+  value = aws_lambda_function.stream-authorizer-function.invoke_arn
+}
+
+output "stream_authorizer_lambda_arn" {
+  value = aws_lambda_function.stream-authorizer-function.arn
+}
+
+output "stream_connection_lambda_invoke_uri" {
+  value = aws_lambda_function.stream-connection-function.invoke_arn
+}
+
+output "stream_connection_lambda_arn" {
+  value = aws_lambda_function.stream-connection-function.arn
+}
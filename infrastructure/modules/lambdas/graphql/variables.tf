@@ -57,3 +57,8 @@ variable "chats_lambda_arn" {
   description = "Arn for the chat lambda to invoke"
   default     = ""
 }
+
+variable "chats_stream_endpoint" {
+  description = "The management endpoint of the WebSocket API the chat answers are streamed to"
+  default     = ""
+}
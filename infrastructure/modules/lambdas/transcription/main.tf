@@ -44,6 +44,11 @@ resource "aws_lambda_function" "transcription-function" {
 resource "aws_lambda_event_source_mapping" "transcription_mapping" {
   event_source_arn = var.sqs_trigger
   function_name    = aws_lambda_function.transcription-function.arn
+  # One video per invocation: a long video gets the whole 900 s timeout and /tmp,
+  # and cannot time out another video of the same batch
+  batch_size       = 1
+
+  function_response_types = ["ReportBatchItemFailures"]
 }
 
 resource "aws_iam_role" "function_role" {
@@ -115,9 +120,17 @@ resource "aws_iam_role_policy" "function_policy" {
         Effect : "Allow",
         Action : [
           "s3:GetObject",
-          "s3:PutObject"
+          "s3:PutObject",
+          "s3:DeleteObject"
         ],
         Resource : "${var.s3_video_bucket_arn}/*"
+      },
+      {
+        Effect : "Allow",
+        Action : [
+          "s3:ListBucket"
+        ],
+        Resource : var.s3_video_bucket_arn
       }
     ]
   })
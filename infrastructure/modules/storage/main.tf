@@ -55,4 +55,20 @@ resource "aws_s3_bucket_versioning" "app-hosting-bucket-versioning" {
   versioning_configuration {
     status = "Disabled"
   }
-}
\ No newline at end of file
+}
+resource "aws_s3_bucket_lifecycle_configuration" "app-data-lifecycle" {
+  bucket = aws_s3_bucket.app-data.id
+
+  rule {
+    id     = "expire-transcription-checkpoints"
+    status = "Enabled"
+
+    filter {
+      prefix = "transcription-checkpoints/"
+    }
+
+    expiration {
+      days = 7
+    }
+  }
+}
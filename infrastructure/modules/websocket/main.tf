@@ -0,0 +1,111 @@
+# WebSocket API the chats Lambda streams answers to. Connections are
+# authorized with the user token of the GraphQL API, and the user of every
+# connection is stored. Clients send any message to learn their connection
+# id, pass it to sendChatMessage and receive the events posted to it.
+resource "aws_apigatewayv2_api" "chats_websocket_api" {
+  name                       = "${var.application_name}-chats-stream-${var.environment}"
+  description                = "WebSocket API streaming chat answers for ${var.application_name}-${var.environment}"
+  protocol_type              = "WEBSOCKET"
+  route_selection_expression = "$request.body.action"
+
+  tags = var.tags
+}
+
+# Authorizes $connect requests by their token query parameter, browsers
+# cannot set the Authorization header of WebSocket requests
+resource "aws_apigatewayv2_authorizer" "connect" {
+  api_id           = aws_apigatewayv2_api.chats_websocket_api.id
+  name             = "${var.application_name}-chats-stream-authorizer-${var.environment}"
+  authorizer_type  = "REQUEST"
+  authorizer_uri   = var.authorizer_lambda_invoke_uri
+  identity_sources = ["route.request.querystring.token"]
+}
+
+resource "aws_lambda_permission" "authorizer" {
+  statement_id  = "AllowExecutionFromWebSocketAPI"
+  action        = "lambda:InvokeFunction"
+  function_name = var.authorizer_lambda_arn
+  principal     = "apigateway.amazonaws.com"
+
+  source_arn = "${aws_apigatewayv2_api.chats_websocket_api.execution_arn}/authorizers/${aws_apigatewayv2_authorizer.connect.id}"
+}
+
+# Stores the user of a connection on $connect and removes it on $disconnect
+resource "aws_apigatewayv2_integration" "connect" {
+  api_id             = aws_apigatewayv2_api.chats_websocket_api.id
+  integration_type   = "AWS_PROXY"
+  integration_method = "POST"
+  integration_uri    = var.connection_lambda_invoke_uri
+}
+
+resource "aws_lambda_permission" "connect" {
+  statement_id  = "AllowExecutionFromWebSocketAPI"
+  action        = "lambda:InvokeFunction"
+  function_name = var.connection_lambda_arn
+  principal     = "apigateway.amazonaws.com"
+
+  source_arn = "${aws_apigatewayv2_api.chats_websocket_api.execution_arn}/*/*"
+}
+
+resource "aws_apigatewayv2_route" "connect" {
+  api_id             = aws_apigatewayv2_api.chats_websocket_api.id
+  route_key          = "$connect"
+  authorization_type = "CUSTOM"
+  authorizer_id      = aws_apigatewayv2_authorizer.connect.id
+  target             = "integrations/${aws_apigatewayv2_integration.connect.id}"
+}
+
+resource "aws_apigatewayv2_route" "disconnect" {
+  api_id    = aws_apigatewayv2_api.chats_websocket_api.id
+  route_key = "$disconnect"
+  target    = "integrations/${aws_apigatewayv2_integration.connect.id}"
+}
+
+# Replies to every client message with the connection id of the client
+resource "aws_apigatewayv2_integration" "connection_id" {
+  api_id                        = aws_apigatewayv2_api.chats_websocket_api.id
+  integration_type              = "MOCK"
+  template_selection_expression = "\\$default"
+
+  request_templates = {
+    "$default" = "{\"statusCode\": 200}"
+  }
+}
+
+resource "aws_apigatewayv2_integration_response" "connection_id" {
+  api_id                        = aws_apigatewayv2_api.chats_websocket_api.id
+  integration_id                = aws_apigatewayv2_integration.connection_id.id
+  integration_response_key      = "$default"
+  template_selection_expression = "\\$default"
+
+  response_templates = {
+    "$default" = "{\"type\": \"connection\", \"connectionId\": \"$context.connectionId\"}"
+  }
+}
+
+resource "aws_apigatewayv2_route" "default" {
+  api_id                              = aws_apigatewayv2_api.chats_websocket_api.id
+  route_key                           = "$default"
+  target                              = "integrations/${aws_apigatewayv2_integration.connection_id.id}"
+  route_response_selection_expression = "$default"
+}
+
+resource "aws_apigatewayv2_route_response" "default" {
+  api_id             = aws_apigatewayv2_api.chats_websocket_api.id
+  route_id           = aws_apigatewayv2_route.default.id
+  route_response_key = "$default"
+}
+
+resource "aws_apigatewayv2_stage" "chats_websocket_stage" {
+  api_id      = aws_apigatewayv2_api.chats_websocket_api.id
+  name        = var.environment
+  auto_deploy = true
+
+  tags = var.tags
+
+  depends_on = [
+    aws_apigatewayv2_route.connect,
+    aws_apigatewayv2_route.disconnect,
+    aws_apigatewayv2_route.default
+  ]
+}
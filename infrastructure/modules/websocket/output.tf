@@ -0,0 +1,14 @@
+output "websocket_url" {
+  value       = aws_apigatewayv2_stage.chats_websocket_stage.invoke_url
+  description = "The wss:// URL clients connect to"
+}
+
+output "websocket_management_endpoint" {
+  value       = "https://${aws_apigatewayv2_api.chats_websocket_api.id}.execute-api.${var.aws_region}.amazonaws.com/${aws_apigatewayv2_stage.chats_websocket_stage.name}"
+  description = "The endpoint events are posted to connections with"
+}
+
+output "websocket_connections_arn" {
+  value       = "${aws_apigatewayv2_api.chats_websocket_api.execution_arn}/${aws_apigatewayv2_stage.chats_websocket_stage.name}/POST/@connections/*"
+  description = "The ARN of posting to the connections of the stage"
+}
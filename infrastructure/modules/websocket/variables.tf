@@ -0,0 +1,39 @@
+variable "aws_region" {
+  description = "The aws region"
+  default     = "eu-central-1"
+}
+
+variable "environment" {
+  description = "The environment to deploy to"
+  default     = "dev"
+}
+
+variable "application_name" {
+  description = "The name of the application"
+  default     = ""
+}
+
+variable "authorizer_lambda_invoke_uri" {
+  description = "The invoke ARN of the Lambda authorizing connections"
+  default     = ""
+}
+
+variable "authorizer_lambda_arn" {
+  description = "The ARN of the Lambda authorizing connections"
+  default     = ""
+}
+
+variable "connection_lambda_invoke_uri" {
+  description = "The invoke ARN of the Lambda storing the user of every connection"
+  default     = ""
+}
+
+variable "connection_lambda_arn" {
+  description = "The ARN of the Lambda storing the user of every connection"
+  default     = ""
+}
+
+variable "tags" {
+  description = "A map of tags to add to all resources"
+  type        = map(string)
+}
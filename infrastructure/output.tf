@@ -9,3 +9,7 @@ output "NEXT_PUBLIC_VIDEO_UPLOAD_BUCKET_ARN" {
 output "NEXT_PUBLIC_STATIC_HOSTING_BUCKET_NAME" {
   value = module.hosting.s3_hosting_bucket_name
 }
+
+output "NEXT_PUBLIC_CHATS_WEBSOCKET_URL" {
+  value = module.websocket.websocket_url
+}
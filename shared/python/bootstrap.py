@@ -0,0 +1,136 @@
+"""
+Shared bootstrap for the Python Lambdas.
+
+Secrets are fetched from AWS Secrets Manager in parallel and cached in the
+process with a TTL, so warm containers skip the Secrets Manager round trips.
+Clients are created lazily on first use. load_and_set_api_keys logs whether
+it ran as a cold or warm start and how long it took.
+
+This module lives in shared/python and is bundled into every Lambda zip by
+the service Makefiles.
+"""
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict
+
+import boto3
+
+logger = logging.getLogger()
+
+SECRETS_TTL_SECONDS = float(os.environ.get("SECRETS_TTL_SECONDS", "300"))
+
+_SECRETS_MANAGER = None
+_SECRET_CACHE: Dict[str, tuple] = {}
+_OPENAI_CLIENT = None
+_OPENAI_CLIENT_KEY = None
+_LOCK = threading.Lock()
+_COLD_START = True
+
+
+def _secretsmanager():
+    global _SECRETS_MANAGER
+
+    if _SECRETS_MANAGER is None:
+        _SECRETS_MANAGER = boto3.client("secretsmanager")
+
+    return _SECRETS_MANAGER
+
+
+def _fetch_secret(secret_arn: str) -> str:
+    response = _secretsmanager().get_secret_value(SecretId=secret_arn)
+
+    if "SecretString" in response:
+        return response["SecretString"]
+
+    raise ValueError("Secret not found or invalid format")
+
+
+def get_secrets(*secret_arns: str) -> Dict[str, str]:
+    """
+    Returns the secret strings of the given ARNs.
+
+    Cached values younger than SECRETS_TTL_SECONDS are reused, all other
+    secrets are fetched from Secrets Manager in parallel.
+
+    Raises:
+        ValueError: If any secret is not found or invalid.
+        botocore.exceptions.ClientError: If there's an AWS API error.
+    """
+    now = time.monotonic()
+
+    with _LOCK:
+        expired = [
+            arn for arn in dict.fromkeys(secret_arns)
+            if arn not in _SECRET_CACHE or now - _SECRET_CACHE[arn][1] > SECRETS_TTL_SECONDS
+        ]
+
+        if expired:
+            # Create the client before the threads share it
+            _secretsmanager()
+            with ThreadPoolExecutor(max_workers=len(expired)) as executor:
+                values = list(executor.map(_fetch_secret, expired))
+
+            for arn, value in zip(expired, values):
+                _SECRET_CACHE[arn] = (value, now)
+
+        return {arn: _SECRET_CACHE[arn][0] for arn in secret_arns}
+
+
+def get_secret(secret_arn: str) -> str:
+    """Returns a single secret string, see get_secrets."""
+    return get_secrets(secret_arn)[secret_arn]
+
+
+def load_and_set_api_keys(**env_to_secret_env: str) -> None:
+    """
+    Loads API keys from Secrets Manager into environment variables.
+
+    Each keyword maps the environment variable to set to the environment
+    variable holding the secret ARN, e.g.
+    load_and_set_api_keys(OPENAI_API_KEY="OPENAI_SECRET_ARN").
+    Logs the time spent, separately for the cold start and warm starts.
+
+    Raises:
+        KeyError: If an environment variable holding a secret ARN is not set.
+        ValueError: If any secret is not found or invalid.
+    """
+    global _COLD_START
+
+    started = time.perf_counter()
+
+    arns = {env_name: os.environ[arn_env] for env_name, arn_env in env_to_secret_env.items()}
+    secrets = get_secrets(*arns.values())
+
+    for env_name, arn in arns.items():
+        os.environ[env_name] = secrets[arn]
+
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    logger.info("Bootstrap %s start: secrets loaded in %.1f ms",
+                "cold" if _COLD_START else "warm", elapsed_ms)
+    _COLD_START = False
+
+
+def get_openai_client():
+    """
+    Returns an OpenAI client for the key in the OPENAI_API_KEY environment
+    variable (see load_and_set_api_keys). The client is created on first use
+    and recreated when the key rotates. Its built-in retries are disabled,
+    retries are left to openai_scheduler.
+    """
+    global _OPENAI_CLIENT, _OPENAI_CLIENT_KEY
+
+    api_key = os.environ["OPENAI_API_KEY"]
+
+    with _LOCK:
+        if _OPENAI_CLIENT is None or api_key != _OPENAI_CLIENT_KEY:
+            # pylint: disable=import-error,import-outside-toplevel
+            from openai import OpenAI
+            # pylint: enable=import-error,import-outside-toplevel
+
+            _OPENAI_CLIENT = OpenAI(api_key=api_key, max_retries=0)
+            _OPENAI_CLIENT_KEY = api_key
+
+    return _OPENAI_CLIENT
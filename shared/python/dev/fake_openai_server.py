@@ -0,0 +1,169 @@
+"""
+Local fake of the OpenAI endpoints used by the services, for exercising
+openai_scheduler.py under rate limits without calling the real API.
+
+Serves /v1/embeddings, /v1/chat/completions and /v1/audio/transcriptions
+with canned responses. Requests above --rpm within a sliding minute get a
+429 with a Retry-After header, --error-rate answers a share of the
+requests with a 500 and --latency delays every response.
+
+Usage:
+    python shared/python/dev/fake_openai_server.py --port 8089 --rpm 60
+    OPENAI_BASE_URL=http://127.0.0.1:8089/v1 OPENAI_API_BASE=http://127.0.0.1:8089/v1 ...
+
+This file lives in a subdirectory, so it is not bundled into the Lambdas.
+"""
+import argparse
+import json
+import random
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class FakeOpenAIState:
+    """Sliding-window request counter and response counters."""
+
+    def __init__(self, rpm: int, error_rate: float, latency: float, dimensions: int):
+        self.rpm = rpm
+        self.error_rate = error_rate
+        self.latency = latency
+        self.dimensions = dimensions
+        self.requests = deque()
+        self.counts = {"ok": 0, "rate_limited": 0, "error": 0}
+        self.lock = threading.Lock()
+
+    def admit(self) -> tuple:
+        """Returns (status, retry_after) for a new request."""
+        now = time.monotonic()
+
+        with self.lock:
+            while self.requests and now - self.requests[0] > 60:
+                self.requests.popleft()
+
+            if self.rpm and len(self.requests) >= self.rpm:
+                self.counts["rate_limited"] += 1
+                return 429, 60 - (now - self.requests[0])
+
+            self.requests.append(now)
+
+            if random.random() < self.error_rate:
+                self.counts["error"] += 1
+                return 500, None
+
+            self.counts["ok"] += 1
+            return 200, None
+
+
+def _embeddings(state: FakeOpenAIState, body: dict) -> dict:
+    inputs = body.get("input", [])
+    if isinstance(inputs, str) or (inputs and isinstance(inputs[0], int)):
+        inputs = [inputs]
+
+    data = []
+    for index, text in enumerate(inputs):
+        rng = random.Random(str(text))
+        data.append({
+            "object": "embedding",
+            "index": index,
+            "embedding": [rng.uniform(-1, 1) for _ in range(body.get("dimensions", state.dimensions))]
+        })
+
+    return {"object": "list", "data": data, "model": body.get("model", "fake"),
+            "usage": {"prompt_tokens": len(inputs), "total_tokens": len(inputs)}}
+
+
+def _chat_completion(body: dict) -> dict:
+    message = {"role": "assistant", "content": "This is a fake answer."}
+
+    if body.get("tools"):
+        message["content"] = None
+        message["tool_calls"] = [{
+            "id": f"call_{random.randrange(1 << 32):08x}",
+            "type": "function",
+            "function": {"name": "final_answer",
+                         "arguments": json.dumps({"answer": "This is a fake answer.", "metadata": []})}
+        }]
+
+    return {
+        "id": "chatcmpl-fake", "object": "chat.completion", "created": int(time.time()),
+        "model": body.get("model", "fake"),
+        "choices": [{"index": 0, "message": message, "finish_reason": "stop"}],
+        "usage": {"prompt_tokens": 1, "completion_tokens": 1, "total_tokens": 2}
+    }
+
+
+def _transcription() -> dict:
+    return {
+        "task": "transcribe", "language": "english", "duration": 2.0,
+        "text": "This is a fake transcript.",
+        "segments": [{"id": 0, "seek": 0, "start": 0.0, "end": 2.0, "text": " This is a fake transcript.",
+                      "tokens": [], "temperature": 0.0, "avg_logprob": 0.0,
+                      "compression_ratio": 1.0, "no_speech_prob": 0.0}]
+    }
+
+
+def make_handler(state: FakeOpenAIState):
+    class Handler(BaseHTTPRequestHandler):
+        def _send(self, status: int, payload: dict, headers: dict = None) -> None:
+            body = json.dumps(payload).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_POST(self):  # pylint: disable=invalid-name
+            raw = self.rfile.read(int(self.headers.get("Content-Length", "0")))
+            time.sleep(state.latency)
+
+            status, retry_after = state.admit()
+            if status == 429:
+                self._send(429, {"error": {"message": "Rate limit reached", "type": "requests"}},
+                           {"retry-after": f"{retry_after:.1f}"})
+                return
+            if status != 200:
+                self._send(status, {"error": {"message": "Fake server error", "type": "server_error"}})
+                return
+
+            if self.path.endswith("/embeddings"):
+                self._send(200, _embeddings(state, json.loads(raw or b"{}")))
+            elif self.path.endswith("/chat/completions"):
+                self._send(200, _chat_completion(json.loads(raw or b"{}")))
+            elif self.path.endswith("/audio/transcriptions"):
+                self._send(200, _transcription())
+            else:
+                self._send(404, {"error": {"message": f"Unknown path {self.path}"}})
+
+        def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+            pass
+
+    return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--rpm", type=int, default=60, help="requests per minute before 429s, 0 = unlimited")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of requests answered with 500")
+    parser.add_argument("--latency", type=float, default=0.05, help="seconds added to every response")
+    parser.add_argument("--dimensions", type=int, default=1536, help="embedding dimensions")
+    args = parser.parse_args()
+
+    state = FakeOpenAIState(args.rpm, args.error_rate, args.latency, args.dimensions)
+    server = ThreadingHTTPServer(("127.0.0.1", args.port), make_handler(state))
+    print(f"Fake OpenAI server on http://127.0.0.1:{args.port}/v1")
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        print(f"Responses: {state.counts}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+"""
+Reduced-dimension and quantized embeddings.
+
+The embeddings service applies the compression before vectors are upserted
+and the chats service applies it to query embeddings, so both sides must run
+with the same configuration and the vector index must have the reduced
+dimension:
+
+- EMBEDDING_DIMENSIONS: dimension of the stored vectors, 0 keeps the full
+  size of the model.
+- EMBEDDING_REDUCTION: "api" requests EMBEDDING_DIMENSIONS from the API
+  (text-embedding-3 models only), "truncate" keeps the leading dimensions of
+  the full embedding locally and renormalizes them. For text-embedding-3
+  models both give the same vectors.
+- EMBEDDING_QUANTIZATION: "int8" rounds every vector to 8-bit codes with a
+  per-vector scale, "none" keeps float32. Pinecone stores float32 values, so
+  there it only reproduces the precision of an int8 store; stores that keep
+  the codes use quantize_int8 directly.
+"""
+import logging
+import os
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np  # pylint: disable=import-error
+
+logger = logging.getLogger()
+
+REDUCTIONS = ("api", "truncate")
+QUANTIZATIONS = ("none", "int8")
+
+_COMPRESSION = None
+
+
+def normalize(vectors: np.ndarray) -> np.ndarray:
+    """Scales every row to unit L2 norm, zero rows are left as they are."""
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.where(norms == 0, 1, norms)
+
+
+def quantize_int8(vectors: Sequence[Sequence[float]]) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Quantizes every vector symmetrically to int8 codes. Returns the codes and
+    the float32 scale of every vector, values are codes * scale.
+    """
+    vectors = np.asarray(vectors, dtype=np.float32)
+    scales = np.abs(vectors).max(axis=1) / 127
+    scales[scales == 0] = 1
+    codes = np.clip(np.rint(vectors / scales[:, None]), -127, 127).astype(np.int8)
+    return codes, scales.astype(np.float32)
+
+
+def dequantize_int8(codes: np.ndarray, scales: np.ndarray) -> np.ndarray:
+    return codes.astype(np.float32) * scales[:, None]
+
+
+class EmbeddingCompression:
+    """
+    Compression applied to embeddings before they are stored or queried.
+
+    Attributes:
+        dimensions (int): Dimension of the compressed vectors, 0 for the model size
+        reduction (str): "api" or "truncate", see the module docstring
+        quantization (str): "none" or "int8"
+    """
+
+    def __init__(self, dimensions: int = 0, reduction: str = "api", quantization: str = "none"):
+        if reduction not in REDUCTIONS:
+            raise ValueError(f"Unknown embedding reduction {reduction!r}, expected one of {REDUCTIONS}")
+        if quantization not in QUANTIZATIONS:
+            raise ValueError(f"Unknown embedding quantization {quantization!r}, expected one of {QUANTIZATIONS}")
+
+        self.dimensions = dimensions
+        self.reduction = reduction
+        self.quantization = quantization
+
+    @property
+    def api_dimensions(self) -> Optional[int]:
+        """The dimensions argument of the embeddings request, None for the model size."""
+        if self.dimensions and self.reduction == "api":
+            return self.dimensions
+        return None
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.dimensions and self.reduction == "truncate") or self.quantization != "none"
+
+    def cache_model(self, model: str) -> str:
+        """
+        Model name under which embeddings of the API are cached. Local
+        compression runs after the cache, so only API dimensions change it.
+        """
+        if self.api_dimensions:
+            return f"{model}@{self.api_dimensions}"
+        return model
+
+    def apply(self, vectors: Sequence[Sequence[float]]) -> List[List[float]]:
+        """Returns the compressed vectors as they are stored."""
+        if not self.enabled or not len(vectors):
+            return [list(values) for values in vectors]
+
+        array = np.asarray(vectors, dtype=np.float32)
+
+        if self.dimensions and self.reduction == "truncate" and array.shape[1] > self.dimensions:
+            array = normalize(array[:, :self.dimensions])
+
+        if self.quantization == "int8":
+            array = dequantize_int8(*quantize_int8(array))
+
+        return array.tolist()
+
+    def __repr__(self) -> str:
+        return (f"EmbeddingCompression(dimensions={self.dimensions}, reduction={self.reduction!r}, "
+                f"quantization={self.quantization!r})")
+
+
+def get_compression() -> EmbeddingCompression:
+    """Returns the embedding compression configured by the environment."""
+    global _COMPRESSION
+
+    if _COMPRESSION is None:
+        _COMPRESSION = EmbeddingCompression(
+            dimensions=int(os.environ.get("EMBEDDING_DIMENSIONS", "0")),
+            reduction=os.environ.get("EMBEDDING_REDUCTION", "api"),
+            quantization=os.environ.get("EMBEDDING_QUANTIZATION", "none")
+        )
+        logger.info("Embedding compression: %r", _COMPRESSION)
+
+    return _COMPRESSION
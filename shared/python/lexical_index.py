@@ -0,0 +1,368 @@
+"""
+Sparse lexical (BM25) index of the chunks of a namespace.
+
+The embeddings service writes one document per video next to its vectors,
+with the term frequencies of every chunk in columnar form:
+
+    {"ids": [...], "metadata": [...], "lengths": [...],
+     "terms": [...], "postings": {"chunk": [...], "term": [...], "tf": [...]}}
+
+stored gzipped as {namespace}/{video_id}.json.gz in S3 (LEXICAL_INDEX_S3_PREFIX
+of S3_VIDEO_BUCKET_NAME) or in a local directory (LEXICAL_INDEX_PATH, e.g. next
+to the NumPy vector store). The chats service loads the documents of a
+namespace into one inverted index in memory and reloads only the documents
+whose version changed.
+
+Every put and delete rewrites the small change marker {namespace}/_changed
+after the document. A refresh reads only the version of the marker (one
+HEAD request in S3) and lists the documents of the namespace only when the
+marker changed, or when it does not exist yet for namespaces written
+before the marker was introduced.
+
+Terms are NFKC-normalized, case-folded words, numbers and dotted or hyphenated
+tokens (gpt-4o, 3.5, u.s), without stemming, so exact names, acronyms and
+numbers match. Common English stop words are left out.
+"""
+import gzip
+import json
+import logging
+import math
+import os
+import re
+import threading
+import time
+import unicodedata
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Sequence
+
+import boto3
+from botocore.exceptions import ClientError
+
+import numpy as np  # pylint: disable=import-error
+
+from s3_objects import is_missing_key
+
+logger = logging.getLogger()
+
+_TOKEN = re.compile(r"\w+(?:[.\-']\w+)*")
+STOP_WORDS = frozenset("""
+a about above after again all also am an and any are as at be because been before being below between both but
+by can could did do does doing down during each few for from further had has have having he her here hers him
+his how i if in into is it its itself just me more most my no nor not now of off on once only or other our ours
+out over own same she should so some such than that the their theirs them then there these they this those
+through to too under until up very was we were what when where which while who whom why will with would you
+your yours yeah okay um uh like
+""".split())
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+CHANGE_MARKER = "_changed"
+
+
+def tokenize(text: str) -> List[str]:
+    """Lexical terms of a text, in order."""
+    return [token for token in _TOKEN.findall(unicodedata.normalize("NFKC", text).casefold())
+            if token not in STOP_WORDS]
+
+
+class LexicalDocument:
+    """Term statistics of the chunks of one video, built while the chunks are embedded."""
+
+    def __init__(self):
+        self.ids = []
+        self.metadata = []
+        self.lengths = []
+        self.terms = {}
+        self.chunk = []
+        self.term = []
+        self.tf = []
+        self._lock = threading.Lock()
+
+    def add(self, vector_id: str, text: str, metadata: Dict[str, Any]) -> None:
+        counts = {}
+        tokens = tokenize(text)
+        for token in tokens:
+            counts[token] = counts.get(token, 0) + 1
+
+        with self._lock:
+            row = len(self.ids)
+            self.ids.append(vector_id)
+            self.metadata.append(dict(metadata, text=text))
+            self.lengths.append(len(tokens))
+            for token, count in counts.items():
+                self.chunk.append(row)
+                self.term.append(self.terms.setdefault(token, len(self.terms)))
+                self.tf.append(count)
+
+    def to_bytes(self) -> bytes:
+        with self._lock:
+            return gzip.compress(json.dumps({
+                "ids": self.ids,
+                "metadata": self.metadata,
+                "lengths": self.lengths,
+                "terms": list(self.terms),
+                "postings": {"chunk": self.chunk, "term": self.term, "tf": self.tf}
+            }).encode("utf-8"))
+
+
+class LexicalStorage:
+    """
+    Lexical documents by namespace and video, in a local directory when
+    directory is set, in S3 otherwise.
+    """
+
+    def __init__(self, directory: Optional[str] = None, bucket: Optional[str] = None, prefix: str = ""):
+        self.directory = directory
+        self.bucket = bucket
+        self.prefix = prefix.strip("/")
+        self._s3 = None if directory else boto3.client("s3")
+
+    def _key(self, namespace: str, video_id: str = "") -> str:
+        return f"{self.prefix}/{namespace}/{video_id}.json.gz" if video_id else f"{self.prefix}/{namespace}/"
+
+    def _path(self, namespace: str, video_id: str) -> str:
+        return os.path.join(self.directory, namespace, f"{video_id}.json.gz")
+
+    def marker(self, namespace: str) -> Optional[str]:
+        """Version of the change marker of a namespace, None when it does not exist or is not readable."""
+        if self.directory:
+            try:
+                stat = os.stat(os.path.join(self.directory, namespace, CHANGE_MARKER))
+            except FileNotFoundError:
+                return None
+            return f"{stat.st_mtime_ns}-{stat.st_size}"
+
+        try:
+            return self._s3.head_object(Bucket=self.bucket, Key=f"{self._key(namespace)}{CHANGE_MARKER}")["ETag"]
+        except ClientError as e:
+            if not is_missing_key(e):
+                logger.warning("Change marker of lexical namespace %s not readable: %s", namespace, e)
+            return None
+
+    def _touch(self, namespace: str) -> None:
+        # Unique content, so the version changes even for writes within the same mtime tick
+        data = f"{time.time_ns()}-{uuid.uuid4().hex}".encode("utf-8")
+        if self.directory:
+            path = os.path.join(self.directory, namespace, CHANGE_MARKER)
+            temporary_path = f"{path}.{threading.get_ident()}.tmp"
+            with open(temporary_path, "wb") as f:
+                f.write(data)
+            os.replace(temporary_path, path)
+        else:
+            self._s3.put_object(Bucket=self.bucket, Key=f"{self._key(namespace)}{CHANGE_MARKER}", Body=data)
+
+    def versions(self, namespace: str) -> Dict[str, str]:
+        """Version (ETag or modification time) of every document of a namespace by video id."""
+        if self.directory:
+            directory = os.path.join(self.directory, namespace)
+            if not os.path.isdir(directory):
+                return {}
+            versions = {}
+            for file_name in os.listdir(directory):
+                if file_name.endswith(".json.gz"):
+                    stat = os.stat(os.path.join(directory, file_name))
+                    versions[file_name[:-len(".json.gz")]] = f"{stat.st_mtime_ns}-{stat.st_size}"
+            return versions
+
+        versions = {}
+        paginator = self._s3.get_paginator("list_objects_v2")
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=self._key(namespace)):
+            for item in page.get("Contents", []):
+                name = item["Key"].rsplit("/", 1)[-1]
+                if name.endswith(".json.gz"):
+                    versions[name[:-len(".json.gz")]] = item["ETag"]
+        return versions
+
+    def get(self, namespace: str, video_id: str) -> Optional[dict]:
+        try:
+            if self.directory:
+                with open(self._path(namespace, video_id), "rb") as f:
+                    data = f.read()
+            else:
+                data = self._s3.get_object(Bucket=self.bucket, Key=self._key(namespace, video_id))["Body"].read()
+        except (OSError, ClientError) as e:
+            logger.warning("Lexical document %s/%s not readable: %s", namespace, video_id, e)
+            return None
+        return json.loads(gzip.decompress(data))
+
+    def put(self, namespace: str, video_id: str, document: LexicalDocument) -> None:
+        data = document.to_bytes()
+        if self.directory:
+            path = self._path(namespace, video_id)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            temporary_path = f"{path}.{threading.get_ident()}.tmp"
+            with open(temporary_path, "wb") as f:
+                f.write(data)
+            os.replace(temporary_path, path)
+        else:
+            self._s3.put_object(Bucket=self.bucket, Key=self._key(namespace, video_id), Body=data)
+        self._touch(namespace)
+
+    def delete(self, namespace: str, video_id: str) -> None:
+        if self.directory:
+            try:
+                os.remove(self._path(namespace, video_id))
+            except FileNotFoundError:
+                return
+        else:
+            self._s3.delete_object(Bucket=self.bucket, Key=self._key(namespace, video_id))
+        self._touch(namespace)
+
+
+class LexicalIndex:
+    """
+    In-memory BM25 index over the lexical documents of one namespace.
+
+    Postings are kept as CSR arrays sorted by term: the chunks and term
+    frequencies of term t are chunks[offsets[t]:offsets[t + 1]].
+    """
+
+    def __init__(self, storage: LexicalStorage, namespace: str, refresh_seconds: float = 30.0):
+        self.storage = storage
+        self.namespace = namespace
+        self.refresh_seconds = refresh_seconds
+        self.refreshed_at = None
+        self.marker = None
+        self.documents = {}
+        self.vocabulary = {}
+        self.ids = []
+        self.metadata = []
+        self.lengths = np.zeros(0, dtype=np.float32)
+        self.offsets = np.zeros(1, dtype=np.int64)
+        self.chunks = np.zeros(0, dtype=np.int64)
+        self.tf = np.zeros(0, dtype=np.float32)
+        self._lock = threading.Lock()
+
+    def refresh(self, force: bool = False) -> None:
+        """
+        Reloads changed documents, at most every refresh_seconds unless
+        forced. The documents are only listed when the change marker of the
+        namespace changed since the last refresh, or does not exist.
+        """
+        with self._lock:
+            if not force and self.refreshed_at is not None \
+                    and time.monotonic() - self.refreshed_at < self.refresh_seconds:
+                return
+
+            # Read before the listing, so a write after it changes the marker again
+            marker = self.storage.marker(self.namespace)
+            if marker is not None and marker == self.marker and self.refreshed_at is not None:
+                self.refreshed_at = time.monotonic()
+                return
+
+            versions = self.storage.versions(self.namespace)
+            changed = [video_id for video_id, version in versions.items()
+                       if self.documents.get(video_id, (None,))[0] != version]
+            removed = [video_id for video_id in self.documents if video_id not in versions]
+
+            unreadable = False
+            if changed:
+                with ThreadPoolExecutor(max_workers=min(16, len(changed))) as executor:
+                    for video_id, document in zip(changed, executor.map(
+                            lambda video_id: self.storage.get(self.namespace, video_id), changed)):
+                        if document is not None:
+                            self.documents[video_id] = (versions[video_id], document)
+                        else:
+                            unreadable = True
+            for video_id in removed:
+                del self.documents[video_id]
+
+            if changed or removed:
+                self._build()
+            # Unreadable documents are retried by the next refresh
+            self.marker = None if unreadable else marker
+            self.refreshed_at = time.monotonic()
+
+    def _build(self) -> None:
+        started = time.perf_counter()
+        vocabulary = {}
+        ids, metadata, lengths, chunks, terms, tfs = [], [], [], [], [], []
+
+        for _, document in self.documents.values():
+            postings = document["postings"]
+            term_map = np.asarray([vocabulary.setdefault(term, len(vocabulary)) for term in document["terms"]],
+                                  dtype=np.int64)
+            chunks.append(np.asarray(postings["chunk"], dtype=np.int64) + len(ids))
+            terms.append(term_map[np.asarray(postings["term"], dtype=np.int64)] if len(term_map) else
+                         np.zeros(0, dtype=np.int64))
+            tfs.append(np.asarray(postings["tf"], dtype=np.float32))
+            ids.extend(document["ids"])
+            metadata.extend(document["metadata"])
+            lengths.extend(document["lengths"])
+
+        terms = np.concatenate(terms) if terms else np.zeros(0, dtype=np.int64)
+        order = np.argsort(terms, kind="stable")
+
+        self.vocabulary = vocabulary
+        self.ids = ids
+        self.metadata = metadata
+        self.lengths = np.asarray(lengths, dtype=np.float32)
+        self.chunks = (np.concatenate(chunks) if chunks else np.zeros(0, dtype=np.int64))[order]
+        self.tf = (np.concatenate(tfs) if tfs else np.zeros(0, dtype=np.float32))[order]
+        self.offsets = np.searchsorted(terms[order], np.arange(len(vocabulary) + 1))
+
+        logger.info("Built lexical index of %s: %d chunks, %d terms in %.1f ms", self.namespace, len(ids),
+                    len(vocabulary), 1000 * (time.perf_counter() - started))
+
+    def search(self, query: str, top_k: int) -> List[Dict[str, Any]]:
+        """Returns the top_k chunks by BM25 score as dicts with id, score and metadata."""
+        n = len(self.ids)
+        term_ids = {self.vocabulary[term] for term in tokenize(query) if term in self.vocabulary}
+        if not n or not term_ids:
+            return []
+
+        scores = np.zeros(n, dtype=np.float32)
+        average_length = max(float(self.lengths.mean()), 1.0)
+        for term in term_ids:
+            start, stop = self.offsets[term], self.offsets[term + 1]
+            chunks, tf = self.chunks[start:stop], self.tf[start:stop]
+            idf = math.log(1 + (n - len(chunks) + 0.5) / (len(chunks) + 0.5))
+            norm = BM25_K1 * (1 - BM25_B + BM25_B * self.lengths[chunks] / average_length)
+            scores[chunks] += idf * tf * (BM25_K1 + 1) / (tf + norm)
+
+        matched = np.flatnonzero(scores)
+        best = matched[np.argsort(-scores[matched])[:top_k]]
+        return [{"id": self.ids[row], "score": float(scores[row]), "metadata": self.metadata[row]} for row in best]
+
+
+def fuse(dense: Sequence[Dict[str, Any]], sparse: Sequence[Dict[str, Any]], method: str = "rrf",
+         dense_weight: float = 0.5, rrf_k: int = 60) -> List[Dict[str, Any]]:
+    """
+    Merges dense and sparse matches by id, best first. "rrf" sums
+    weighted reciprocal ranks 1 / (rrf_k + rank), "weighted" sums the dense
+    cosine score and the BM25 score divided by the best BM25 score, weighted
+    by dense_weight and 1 - dense_weight. Every fused match keeps the
+    dense_score and sparse_score it was found with.
+    """
+    fused = {}
+    best_sparse = max((match["score"] for match in sparse), default=0.0) or 1.0
+
+    for kind, matches, weight in (("dense", dense, dense_weight), ("sparse", sparse, 1 - dense_weight)):
+        for rank, match in enumerate(matches, start=1):
+            entry = fused.setdefault(match["id"], {
+                "id": match["id"], "metadata": match["metadata"], "score": 0.0,
+                "dense_score": None, "sparse_score": None
+            })
+            entry[f"{kind}_score"] = match["score"]
+            if method == "rrf":
+                entry["score"] += weight / (rrf_k + rank)
+            else:
+                entry["score"] += weight * (match["score"] / best_sparse if kind == "sparse" else match["score"])
+
+    return sorted(fused.values(), key=lambda entry: -entry["score"])
+
+
+def create_lexical_storage() -> Optional[LexicalStorage]:
+    """
+    Lexical storage configured by the environment: LEXICAL_INDEX_PATH for a
+    directory, LEXICAL_INDEX_S3_PREFIX for S3, None when both are empty.
+    """
+    directory = os.environ.get("LEXICAL_INDEX_PATH", "")
+    prefix = os.environ.get("LEXICAL_INDEX_S3_PREFIX", "")
+
+    if directory:
+        return LexicalStorage(directory=directory)
+    if prefix:
+        return LexicalStorage(bucket=os.environ.get("S3_VIDEO_BUCKET_NAME"), prefix=prefix)
+    return None
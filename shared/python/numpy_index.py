@@ -0,0 +1,493 @@
+"""
+Memory-mapped NumPy vector index of one namespace.
+
+The index is a directory of immutable segment files and versioned manifests:
+
+    manifest-00000042.json     segments and deleted rows of version 42, the highest version is current
+    seg-<name>.vectors.npy     unit vectors as float32, or int8 codes
+    seg-<name>.scales.npy      per-vector scales of int8 segments
+    seg-<name>.ivf.npz         IVF centroids and list offsets, rows are ordered by list
+    seg-<name>.meta.json       ids and metadata of the rows
+
+Segment files are written once and memory-mapped for search, so the
+directory can live on EFS or be mirrored to S3 file by file. Appends write
+a new segment, deletes and overwritten ids only mark rows as deleted in
+the next manifest. A new manifest is created with an exclusive hard link,
+so concurrent writers never overwrite each other: the loser reloads the
+current manifest and applies its change again. Compaction merges the live
+rows of all segments into one once there are too many segments or deleted
+rows.
+
+Vectors are scored by dot product of unit vectors (cosine similarity).
+Segments with at least ivf_min_vectors rows get an inverted file index
+(spherical k-means over sqrt(n) lists) and are searched approximately by
+scanning the nprobe closest lists, smaller segments are scanned exactly.
+"""
+import json
+import logging
+import os
+import re
+import threading
+import time
+import uuid
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+import numpy as np  # pylint: disable=import-error
+
+from embedding_compression import normalize, quantize_int8
+
+logger = logging.getLogger()
+
+MANIFEST_PATTERN = re.compile(r"^manifest-(\d+)\.json$")
+# Unreferenced files younger than this may belong to a commit in progress, longer
+# than the Lambda timeout
+GC_GRACE_SECONDS = 900
+KMEANS_ITERATIONS = 10
+KMEANS_SAMPLES_PER_LIST = 64
+
+
+def train_ivf(vectors: np.ndarray, n_lists: int, seed: int = 0) -> np.ndarray:
+    """Spherical k-means on a sample of unit vectors, returns the unit centroids."""
+    rng = np.random.default_rng(seed)
+    sample_size = min(len(vectors), n_lists * KMEANS_SAMPLES_PER_LIST)
+    sample = np.asarray(vectors[np.sort(rng.choice(len(vectors), sample_size, replace=False))],
+                        dtype=np.float32)
+    centroids = sample[rng.choice(sample_size, n_lists, replace=False)]
+
+    for _ in range(KMEANS_ITERATIONS):
+        assignments = np.argmax(sample @ centroids.T, axis=1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignments, sample)
+        counts = np.bincount(assignments, minlength=n_lists)
+        # Empty lists keep their centroid
+        centroids = np.where(counts[:, None] > 0, normalize(sums), centroids)
+
+    return centroids
+
+
+def assign_ivf(vectors: np.ndarray, centroids: np.ndarray, block_size: int = 65536) -> np.ndarray:
+    return np.concatenate([
+        np.argmax(vectors[start:start + block_size] @ centroids.T, axis=1)
+        for start in range(0, len(vectors), block_size)
+    ]) if len(vectors) else np.zeros(0, dtype=np.int64)
+
+
+class Segment:
+    """Read-only view of the files of one segment, loaded lazily."""
+
+    def __init__(self, directory: str, name: str):
+        self.path = os.path.join(directory, name)
+        self.name = name
+        self._vectors = None
+        self._scales = None
+        self._ivf = None
+        self._meta = None
+        self._rows_by_id = None
+        self._rows_by_value = {}
+
+    @property
+    def vectors(self) -> np.ndarray:
+        if self._vectors is None:
+            self._vectors = np.load(f"{self.path}.vectors.npy", mmap_mode="r")
+        return self._vectors
+
+    @property
+    def scales(self) -> Optional[np.ndarray]:
+        if self._scales is None and self.vectors.dtype == np.int8:
+            self._scales = np.load(f"{self.path}.scales.npy")
+        return self._scales
+
+    @property
+    def ivf(self) -> Optional[tuple]:
+        if self._ivf is None:
+            if os.path.exists(f"{self.path}.ivf.npz"):
+                with np.load(f"{self.path}.ivf.npz") as ivf:
+                    self._ivf = (ivf["centroids"], ivf["offsets"])
+            else:
+                self._ivf = ()
+        return self._ivf or None
+
+    @property
+    def meta(self) -> dict:
+        if self._meta is None:
+            with open(f"{self.path}.meta.json", encoding="utf-8") as f:
+                self._meta = json.load(f)
+        return self._meta
+
+    def rows_of_ids(self, ids) -> List[int]:
+        if self._rows_by_id is None:
+            self._rows_by_id = {vector_id: row for row, vector_id in enumerate(self.meta["ids"])}
+        return [self._rows_by_id[vector_id] for vector_id in ids if vector_id in self._rows_by_id]
+
+    def rows_of_value(self, key: str, value: Any) -> List[int]:
+        """Rows whose metadata value of key is value."""
+        if key not in self._rows_by_value:
+            rows_by_value = {}
+            for row, metadata in enumerate(self.meta["metadata"]):
+                rows_by_value.setdefault(metadata.get(key), []).append(row)
+            self._rows_by_value[key] = rows_by_value
+        return self._rows_by_value[key].get(value, [])
+
+    def rows_of_video(self, video_id: str) -> List[int]:
+        return self.rows_of_value("video_id", video_id)
+
+    def rows_where(self, where: Dict[str, Sequence[Any]]) -> np.ndarray:
+        """Sorted rows whose metadata value of every key is one of the given values, None matches a missing key."""
+        rows = None
+        for key, values in where.items():
+            matching = {row for value in values for row in self.rows_of_value(key, value)}
+            rows = matching if rows is None else rows & matching
+        return np.array(sorted(rows or ()), dtype=np.int64)
+
+    def scores(self, query: np.ndarray, start: int = 0, stop: Optional[int] = None) -> np.ndarray:
+        """Cosine similarity of the query with rows [start, stop)."""
+        block = self.vectors[start:stop]
+        if self.scales is None:
+            return block @ query
+        return (block @ query) * self.scales[start:stop]
+
+    def scores_of_rows(self, query: np.ndarray, rows: np.ndarray) -> np.ndarray:
+        """Cosine similarity of the query with the given sorted rows."""
+        block = self.vectors[rows]
+        if self.scales is None:
+            return block @ query
+        return (block @ query) * self.scales[rows]
+
+    def live_vectors(self, rows: np.ndarray) -> np.ndarray:
+        vectors = np.asarray(self.vectors[rows], dtype=np.float32)
+        if self.scales is not None:
+            vectors *= self.scales[rows][:, None]
+        return vectors
+
+
+class NumpyIndex:
+    """
+    Vector index of one namespace in a local or EFS directory.
+
+    Attributes:
+        directory (str): Directory of the index files
+        quantization (str): "none" stores float32 vectors, "int8" int8 codes with a scale
+        ivf_min_vectors (int): Rows from which a segment gets an IVF
+        max_segments (int): Segment count above which the index is compacted
+        max_deleted_ratio (float): Share of deleted rows above which the index is compacted
+        manifest (dict): Current manifest
+    """
+
+    def __init__(self, directory: str, quantization: str = "none", ivf_min_vectors: int = 4096,
+                 max_segments: int = 8, max_deleted_ratio: float = 0.3):
+        self.directory = directory
+        self.quantization = quantization
+        self.ivf_min_vectors = ivf_min_vectors
+        self.max_segments = max_segments
+        self.max_deleted_ratio = max_deleted_ratio
+        self.manifest = {"version": 0, "segments": []}
+        self.refreshed_at = 0.0
+        self._segments = {}
+        self._deleted = {}
+        self._lock = threading.RLock()
+
+        os.makedirs(directory, exist_ok=True)
+        self.refresh()
+
+    # Manifests
+
+    def _manifest_path(self, version: int) -> str:
+        return os.path.join(self.directory, f"manifest-{version:08d}.json")
+
+    def _manifest_versions(self) -> List[int]:
+        return sorted(int(match.group(1)) for match in map(MANIFEST_PATTERN.match, os.listdir(self.directory))
+                      if match)
+
+    def refresh(self) -> None:
+        """Loads the current manifest if another writer has committed a newer one."""
+        while True:
+            versions = self._manifest_versions()
+            with self._lock:
+                self.refreshed_at = time.monotonic()
+                if not versions or versions[-1] == self.manifest["version"]:
+                    return
+
+                try:
+                    with open(self._manifest_path(versions[-1]), encoding="utf-8") as f:
+                        manifest = json.load(f)
+                except FileNotFoundError:
+                    # Removed by the garbage collection of a newer version, list again
+                    continue
+
+                self.manifest = manifest
+                names = {segment["name"] for segment in manifest["segments"]}
+                self._segments = {name: segment for name, segment in self._segments.items() if name in names}
+                self._deleted = {
+                    segment["name"]: np.asarray(segment["deleted"], dtype=np.int64)
+                    for segment in manifest["segments"]
+                }
+                return
+
+    def _segment(self, name: str) -> Segment:
+        if name not in self._segments:
+            self._segments[name] = Segment(self.directory, name)
+        return self._segments[name]
+
+    def _commit(self, change: Callable[[dict], Optional[dict]]) -> dict:
+        """
+        Applies change(manifest) -> manifest to the current manifest and
+        stores the result as the next version, retrying on concurrent commits.
+        A change returning None leaves the index as it is.
+        """
+        while True:
+            with self._lock:
+                self.refresh()
+                base = self.manifest
+                manifest = change(json.loads(json.dumps(base)))
+                if manifest is None:
+                    return base
+                manifest["version"] = base["version"] + 1
+
+                temporary_path = os.path.join(self.directory, f".manifest-{uuid.uuid4().hex}.tmp")
+                with open(temporary_path, "w", encoding="utf-8") as f:
+                    json.dump(manifest, f)
+                try:
+                    # Fails if another writer created this version first
+                    os.link(temporary_path, self._manifest_path(manifest["version"]))
+                except FileExistsError:
+                    logger.info("Vector index %s changed concurrently, retrying", self.directory)
+                    continue
+                finally:
+                    os.remove(temporary_path)
+
+                self.refresh()
+
+            self._collect_garbage()
+            return manifest
+
+    def _collect_garbage(self) -> None:
+        """Removes manifests and segment files no longer referenced by the last versions."""
+        keep_versions = self._manifest_versions()[-3:]
+        if not keep_versions:
+            return
+        referenced = set()
+        for version in keep_versions:
+            try:
+                with open(self._manifest_path(version), encoding="utf-8") as f:
+                    referenced.update(segment["name"] for segment in json.load(f)["segments"])
+            except (OSError, ValueError):
+                return
+
+        now = time.time()
+        for file_name in os.listdir(self.directory):
+            path = os.path.join(self.directory, file_name)
+            match = MANIFEST_PATTERN.match(file_name)
+            try:
+                if match:
+                    # Versions committed since the listing are newer than all kept ones. Old
+                    # versions stay for the grace period, so a writer that read one of them
+                    # cannot create the next version again after it was removed
+                    stale = int(match.group(1)) < keep_versions[0]
+                elif file_name.startswith("seg-"):
+                    stale = file_name.split(".")[0] not in referenced
+                else:
+                    continue
+                if stale and now - os.path.getmtime(path) > GC_GRACE_SECONDS:
+                    os.remove(path)
+            except OSError:
+                pass
+
+    # Writes
+
+    def _write_segment(self, ids: List[str], vectors: np.ndarray, metadata: List[dict]) -> dict:
+        name = f"seg-{uuid.uuid4().hex}"
+        path = os.path.join(self.directory, name)
+        vectors = normalize(np.asarray(vectors, dtype=np.float32))
+
+        if len(vectors) >= self.ivf_min_vectors:
+            centroids = train_ivf(vectors, max(1, int(np.sqrt(len(vectors)))))
+            assignments = assign_ivf(vectors, centroids)
+            order = np.argsort(assignments, kind="stable")
+            vectors = vectors[order]
+            ids = [ids[row] for row in order]
+            metadata = [metadata[row] for row in order]
+            offsets = np.searchsorted(assignments[order], np.arange(len(centroids) + 1))
+            np.savez(f"{path}.ivf.npz", centroids=centroids, offsets=offsets)
+
+        if self.quantization == "int8":
+            codes, scales = quantize_int8(vectors)
+            np.save(f"{path}.vectors.npy", codes)
+            np.save(f"{path}.scales.npy", scales)
+        else:
+            np.save(f"{path}.vectors.npy", vectors)
+
+        with open(f"{path}.meta.json", "w", encoding="utf-8") as f:
+            json.dump({"ids": ids, "metadata": metadata}, f)
+
+        return {"name": name, "count": len(ids), "deleted": []}
+
+    @staticmethod
+    def _mark_deleted(manifest: dict, rows_by_segment: Dict[str, List[int]]) -> None:
+        for segment in manifest["segments"]:
+            rows = rows_by_segment.get(segment["name"])
+            if rows:
+                segment["deleted"] = sorted(set(segment["deleted"]) | set(rows))
+        manifest["segments"] = [segment for segment in manifest["segments"]
+                                if len(segment["deleted"]) < segment["count"]]
+
+    def upsert(self, ids: Sequence[str], vectors: Sequence[Sequence[float]],
+               metadata: Sequence[Dict[str, Any]]) -> None:
+        """Appends vectors as a new segment, replacing earlier vectors with the same ids."""
+        if not ids:
+            return
+
+        # The last occurrence of an id wins, like in consecutive upserts
+        rows = list({vector_id: row for row, vector_id in enumerate(ids)}.values())
+        ids = [ids[row] for row in rows]
+        new_segment = self._write_segment(ids, np.asarray(vectors, dtype=np.float32)[rows],
+                                          [metadata[row] for row in rows])
+
+        def _append(manifest: dict) -> dict:
+            self._mark_deleted(manifest, {
+                segment["name"]: self._segment(segment["name"]).rows_of_ids(ids)
+                for segment in manifest["segments"]
+            })
+            manifest["segments"].append(new_segment)
+            return manifest
+
+        self._commit(_append)
+        self._maybe_compact()
+
+    def delete_video(self, video_id: str, start: int = 0) -> int:
+        """
+        Deletes the vectors whose metadata video_id matches and whose id
+        {video_id}#{index} has an index of at least start, returns their count.
+        """
+        def _rows(segment: Segment) -> List[int]:
+            rows = segment.rows_of_video(video_id)
+            if start:
+                ids = segment.meta["ids"]
+                rows = [row for row in rows if int(ids[row].rsplit("#", 1)[1]) >= start]
+            return rows
+
+        deleted = 0
+
+        def _delete(manifest: dict) -> dict:
+            nonlocal deleted
+            rows_by_segment = {
+                segment["name"]: _rows(self._segment(segment["name"]))
+                for segment in manifest["segments"]
+            }
+            deleted = sum(len(set(rows_by_segment[segment["name"]]) - set(segment["deleted"]))
+                          for segment in manifest["segments"])
+            self._mark_deleted(manifest, rows_by_segment)
+            return manifest
+
+        if any(_rows(self._segment(segment["name"])) for segment in self.manifest["segments"]):
+            self._commit(_delete)
+        self._maybe_compact()
+        return deleted
+
+    def _maybe_compact(self) -> None:
+        segments = self.manifest["segments"]
+        total = sum(segment["count"] for segment in segments)
+        deleted = sum(len(segment["deleted"]) for segment in segments)
+        if len(segments) > self.max_segments or (total and deleted / total > self.max_deleted_ratio):
+            self.compact()
+
+    def compact(self) -> None:
+        """Merges the live rows of all segments into one segment."""
+        segments = list(self.manifest["segments"])
+        if not segments:
+            return
+
+        ids, vectors, metadata = [], [], []
+        for entry in segments:
+            segment = self._segment(entry["name"])
+            rows = np.setdiff1d(np.arange(entry["count"]), np.asarray(entry["deleted"], dtype=np.int64))
+            ids.extend(segment.meta["ids"][row] for row in rows)
+            metadata.extend(segment.meta["metadata"][row] for row in rows)
+            vectors.append(segment.live_vectors(rows))
+
+        merged = self._write_segment(ids, np.concatenate(vectors), metadata)
+        merged_names = {entry["name"] for entry in segments}
+        started = time.perf_counter()
+
+        def _replace(manifest: dict) -> Optional[dict]:
+            current = {segment["name"]: segment for segment in manifest["segments"]}
+            if not merged_names <= current.keys():
+                # Another writer compacted these segments first
+                return None
+
+            # Rows deleted and ids appended by other writers since the merge
+            # started supersede the merged rows
+            superseded = []
+            for entry in segments:
+                source_ids = self._segment(entry["name"]).meta["ids"]
+                newly_deleted = set(current[entry["name"]]["deleted"]) - set(entry["deleted"])
+                superseded.extend(source_ids[row] for row in newly_deleted)
+            kept = [segment for segment in manifest["segments"] if segment["name"] not in merged_names]
+            for segment in kept:
+                superseded.extend(self._segment(segment["name"]).meta["ids"])
+
+            manifest["segments"] = [dict(merged)] + kept
+            self._mark_deleted(manifest, {merged["name"]: self._segment(merged["name"]).rows_of_ids(superseded)})
+            return manifest
+
+        self._commit(_replace)
+        logger.info("Compacted %d segments of %s into %d vectors in %.2fs",
+                    len(segments), self.directory, len(ids), time.perf_counter() - started)
+
+    # Search
+
+    def count(self) -> int:
+        return sum(segment["count"] - len(segment["deleted"]) for segment in self.manifest["segments"])
+
+    def search(self, vector: Sequence[float], top_k: int, mode: str = "ivf", nprobe: int = 16,
+               where: Optional[Dict[str, Sequence[Any]]] = None) -> List[dict]:
+        """
+        Returns the top_k matches as dicts with id, score and metadata,
+        best first. "flat" scans every row, "ivf" scans the nprobe closest
+        lists of every segment with an IVF. With where, only the rows whose
+        metadata value of every key is one of the given values are scored,
+        exactly and without the IVF.
+        """
+        try:
+            return self._search(vector, top_k, mode, nprobe, where)
+        except FileNotFoundError:
+            # A segment of an outdated manifest was compacted away and removed
+            self.refresh()
+            return self._search(vector, top_k, mode, nprobe, where)
+
+    def _search(self, vector: Sequence[float], top_k: int, mode: str, nprobe: int,
+                where: Optional[Dict[str, Sequence[Any]]] = None) -> List[dict]:
+        query = normalize(np.asarray(vector, dtype=np.float32)[None, :])[0]
+        with self._lock:
+            entries = [(self._segment(segment["name"]), self._deleted.get(segment["name"]))
+                       for segment in self.manifest["segments"]]
+
+        candidates = []
+        for segment, deleted in entries:
+            ivf = segment.ivf if mode == "ivf" else None
+            if where:
+                rows = segment.rows_where(where)
+                scores = segment.scores_of_rows(query, rows)
+            elif ivf is None:
+                rows = np.arange(len(segment.vectors))
+                scores = segment.scores(query)
+            else:
+                centroids, offsets = ivf
+                lists = np.argsort(-(centroids @ query))[:nprobe]
+                rows = np.concatenate([np.arange(offsets[i], offsets[i + 1]) for i in lists])
+                scores = np.concatenate([segment.scores(query, offsets[i], offsets[i + 1]) for i in lists])
+
+            if deleted is not None and len(deleted):
+                live = ~np.isin(rows, deleted)
+                rows, scores = rows[live], scores[live]
+
+            if len(rows) > top_k:
+                best = np.argpartition(-scores, top_k)[:top_k]
+                rows, scores = rows[best], scores[best]
+
+            candidates.extend((float(score), segment, int(row)) for score, row in zip(scores, rows))
+
+        candidates.sort(key=lambda candidate: -candidate[0])
+        return [
+            {"id": segment.meta["ids"][row], "score": score, "metadata": segment.meta["metadata"][row]}
+            for score, segment, row in candidates[:top_k]
+        ]
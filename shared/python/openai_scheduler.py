@@ -0,0 +1,340 @@
+"""
+Client-side scheduler for OpenAI API calls.
+
+Every call passes through three stages:
+
+- Token buckets over requests per minute and tokens per minute, so a burst
+  of calls is spread out before it reaches the API limits.
+- An adaptive concurrency limit (AIMD): the limit grows by one slot per
+  window of successful calls and is halved on a 429 or when the latency of
+  a call per unit of work (tokens embedded, bytes of audio) spikes far above
+  its running average.
+- Retries with full-jitter exponential backoff for 429s, 5xx responses,
+  timeouts and connection errors. A Retry-After header is honoured, and a
+  429 empties the bucket of the exhausted limit (both when it is unknown).
+
+The scheduler coordinates all threads of one Lambda container. The limits
+come from OPENAI_* environment variables (see get_scheduler). Point the
+OpenAI SDK at another endpoint with OPENAI_BASE_URL (OPENAI_API_BASE for
+LangChain) to exercise it against the fake server in
+shared/python/dev/fake_openai_server.py.
+"""
+import logging
+import os
+import random
+import threading
+import time
+from typing import Callable, Optional
+
+logger = logging.getLogger()
+
+RETRYABLE_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504}
+RETRYABLE_ERROR_NAMES = {"APIConnectionError", "APITimeoutError", "Timeout", "ConnectError", "ReadTimeout"}
+
+
+class TokenBucket:
+    """
+    Token bucket refilled continuously at rate_per_minute, holding at most
+    capacity tokens (one minute worth by default). A rate of 0 disables it.
+    """
+
+    def __init__(self, rate_per_minute: float, capacity: Optional[float] = None):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = capacity if capacity is not None else rate_per_minute
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self, amount: float = 1.0) -> float:
+        """
+        Takes amount tokens, blocking until they are available. Requests
+        larger than the capacity are capped so they still pass eventually.
+        Returns the time waited in seconds.
+        """
+        if self.rate <= 0 or amount <= 0:
+            return 0.0
+
+        amount = min(amount, self.capacity)
+        waited = 0.0
+
+        while True:
+            with self._lock:
+                self._refill()
+                if self.tokens >= amount:
+                    self.tokens -= amount
+                    return waited
+                delay = (amount - self.tokens) / self.rate
+
+            time.sleep(delay)
+            waited += delay
+
+    def drain(self) -> None:
+        """Empties the bucket, used when the server reports the limit as exhausted."""
+        with self._lock:
+            self._refill()
+            self.tokens = min(self.tokens, 0.0)
+
+
+class AdaptiveConcurrencyLimit:
+    """
+    Concurrency limit adjusted by additive increase, multiplicative decrease.
+
+    A call counts as a latency spike when its latency per unit of work took
+    longer than spike_factor times the exponentially weighted average of the
+    earlier calls of the same kind. Latency grows with the size of a call
+    (a Whisper chunk, an embedding batch), so raw latencies of differently
+    sized calls are not compared. Calls without a work size, like chat
+    completions whose latency depends on the answer, never count as spikes.
+    """
+
+    def __init__(self, initial: int = 4, minimum: int = 1, maximum: int = 16,
+                 spike_factor: float = 3.0, smoothing: float = 0.2):
+        self.minimum = max(1, minimum)
+        self.maximum = max(self.minimum, maximum)
+        self.limit = float(min(max(initial, self.minimum), self.maximum))
+        self.spike_factor = spike_factor
+        self.smoothing = smoothing
+        self.in_flight = 0
+        self.average_latency = {}
+        self._condition = threading.Condition()
+
+    def acquire(self) -> None:
+        with self._condition:
+            while self.in_flight >= int(self.limit):
+                self._condition.wait()
+            self.in_flight += 1
+
+    def release(self) -> None:
+        with self._condition:
+            self.in_flight -= 1
+            self._condition.notify()
+
+    def _decrease(self, reason: str) -> None:
+        previous = int(self.limit)
+        self.limit = max(float(self.minimum), self.limit / 2)
+        if int(self.limit) != previous:
+            logger.warning("OpenAI concurrency limit %d -> %d (%s)", previous, int(self.limit), reason)
+
+    def on_success(self, latency: float, work: float = 0.0, kind: str = "") -> None:
+        """Records a successful call of kind that took latency seconds for work units of work."""
+        with self._condition:
+            unit_latency = latency / work if work > 0 else None
+            average = self.average_latency.get(kind) if unit_latency is not None else None
+
+            if average is not None and unit_latency > self.spike_factor * average:
+                self._decrease(f"latency spike {unit_latency:.3g}s per unit, average {average:.3g}s")
+            else:
+                previous = int(self.limit)
+                self.limit = min(float(self.maximum), self.limit + 1.0 / self.limit)
+                if int(self.limit) > previous:
+                    self._condition.notify()
+
+            if unit_latency is not None:
+                self.average_latency[kind] = unit_latency if average is None else (
+                    self.smoothing * unit_latency + (1 - self.smoothing) * average
+                )
+
+    def on_rate_limited(self) -> None:
+        with self._condition:
+            self._decrease("rate limited")
+
+
+def _status_code(error: Exception) -> Optional[int]:
+    status = getattr(error, "status_code", None)
+    if status is None:
+        status = getattr(getattr(error, "response", None), "status_code", None)
+    return status if isinstance(status, int) else None
+
+
+def _retry_after(error: Exception) -> Optional[float]:
+    headers = getattr(getattr(error, "response", None), "headers", None)
+    if not headers:
+        return None
+
+    value = headers.get("retry-after-ms")
+    if value is not None:
+        try:
+            return float(value) / 1000
+        except ValueError:
+            pass
+
+    value = headers.get("retry-after")
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
+
+
+def _rate_limit_kind(error: Exception) -> Optional[str]:
+    """
+    Returns "requests" or "tokens" for the limit a 429 reports as exhausted,
+    None when the error does not tell: OpenAI sets the error type and the
+    x-ratelimit-remaining-* headers, and names the limit in the message.
+    """
+    kind = getattr(error, "type", None)
+    if kind in ("requests", "tokens"):
+        return kind
+
+    headers = getattr(getattr(error, "response", None), "headers", None) or {}
+    for kind in ("requests", "tokens"):
+        if headers.get(f"x-ratelimit-remaining-{kind}") == "0":
+            return kind
+
+    message = str(error).lower()
+    if "tokens per min" in message or "(tpm)" in message:
+        return "tokens"
+    if "requests per min" in message or "(rpm)" in message:
+        return "requests"
+    return None
+
+
+def is_retryable(error: Exception) -> bool:
+    """Returns True for rate limits, server errors, timeouts and connection errors."""
+    status = _status_code(error)
+    if status is not None:
+        return status in RETRYABLE_STATUS_CODES
+
+    return isinstance(error, (ConnectionError, TimeoutError)) or any(
+        cls.__name__ in RETRYABLE_ERROR_NAMES for cls in type(error).__mro__
+    )
+
+
+def estimate_tokens(*texts: str) -> int:
+    """Rough token count of texts (about four characters per token)."""
+    return sum(len(text) for text in texts) // 4 + 1
+
+
+class OpenAIScheduler:
+    """
+    Rate-limit-aware scheduler shared by all OpenAI calls of a process.
+
+    Args:
+        requests_per_minute (float): Request budget, 0 disables the bucket
+        tokens_per_minute (float): Token budget, 0 disables the bucket
+        initial_concurrency, min_concurrency, max_concurrency (int): Bounds
+            of the adaptive concurrency limit
+        max_retries (int): Retries of a call after the first attempt
+        base_delay, max_delay (float): Backoff range in seconds
+    """
+
+    def __init__(self, requests_per_minute: float = 0, tokens_per_minute: float = 0,
+                 initial_concurrency: int = 4, min_concurrency: int = 1, max_concurrency: int = 16,
+                 max_retries: int = 6, base_delay: float = 0.5, max_delay: float = 30.0,
+                 spike_factor: float = 3.0):
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self.concurrency = AdaptiveConcurrencyLimit(
+            initial_concurrency, min_concurrency, max_concurrency, spike_factor
+        )
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.stats = {"calls": 0, "retries": 0, "rate_limited": 0, "failed": 0, "throttled_seconds": 0.0}
+        self._stats_lock = threading.Lock()
+
+    def _count(self, name: str, value: float = 1) -> None:
+        with self._stats_lock:
+            self.stats[name] += value
+
+    def backoff_delay(self, attempt: int, error: Optional[Exception] = None) -> float:
+        """Full-jitter exponential backoff, at least the server's Retry-After."""
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+        retry_after = _retry_after(error) if error is not None else None
+        if retry_after is not None:
+            delay = max(delay, min(retry_after, self.max_delay))
+        return delay
+
+    def call(self, fn: Callable, *args, requests: int = 1, tokens: int = 0, work: float = 0.0, **kwargs):
+        """
+        Calls fn(*args, **kwargs) within the rate limits, retrying retryable
+        errors. requests and tokens are the budget the call consumes from
+        the buckets (estimates are fine, see estimate_tokens). work is the
+        size the latency of the call grows with, e.g. tokens embedded or
+        bytes of audio; latency spikes are only detected for calls with work.
+
+        Raises:
+            Exception: The last error once retries are exhausted, or any
+                non-retryable error right away.
+        """
+        self._count("calls")
+        attempt = 0
+
+        while True:
+            throttled = self.requests.acquire(requests) + self.tokens.acquire(tokens)
+            if throttled:
+                self._count("throttled_seconds", throttled)
+
+            self.concurrency.acquire()
+            started = time.monotonic()
+            try:
+                result = fn(*args, **kwargs)
+            except Exception as e:  # pylint: disable=broad-except
+                error = e
+            else:
+                self.concurrency.on_success(time.monotonic() - started, work, getattr(fn, "__qualname__", ""))
+                return result
+            finally:
+                self.concurrency.release()
+
+            if _status_code(error) == 429:
+                self._count("rate_limited")
+                self.concurrency.on_rate_limited()
+                kind = _rate_limit_kind(error)
+                if kind != "tokens":
+                    self.requests.drain()
+                if kind != "requests":
+                    self.tokens.drain()
+
+            if attempt >= self.max_retries or not is_retryable(error):
+                self._count("failed")
+                raise error
+
+            delay = self.backoff_delay(attempt, error)
+            attempt += 1
+            self._count("retries")
+            logger.warning("OpenAI call failed (%s), retry %d/%d in %.2fs",
+                           error, attempt, self.max_retries, delay)
+            time.sleep(delay)
+
+    def log_stats(self) -> None:
+        with self._stats_lock:
+            stats = dict(self.stats)
+
+        logger.info(
+            "OpenAI scheduler: %d calls, %d retries, %d rate limited, %d failed, "
+            "%.2fs throttled, concurrency limit %d",
+            stats["calls"], stats["retries"], stats["rate_limited"], stats["failed"],
+            stats["throttled_seconds"], int(self.concurrency.limit)
+        )
+
+
+_SCHEDULER = None
+_SCHEDULER_LOCK = threading.Lock()
+
+
+def get_scheduler() -> OpenAIScheduler:
+    """
+    Returns the process-wide scheduler configured by the environment:
+    OPENAI_RPM_LIMIT, OPENAI_TPM_LIMIT (0 = unlimited),
+    OPENAI_INITIAL_CONCURRENCY, OPENAI_MIN_CONCURRENCY,
+    OPENAI_MAX_CONCURRENCY and OPENAI_MAX_RETRIES.
+    """
+    global _SCHEDULER
+
+    with _SCHEDULER_LOCK:
+        if _SCHEDULER is None:
+            _SCHEDULER = OpenAIScheduler(
+                requests_per_minute=float(os.environ.get("OPENAI_RPM_LIMIT", "0")),
+                tokens_per_minute=float(os.environ.get("OPENAI_TPM_LIMIT", "0")),
+                initial_concurrency=int(os.environ.get("OPENAI_INITIAL_CONCURRENCY", "4")),
+                min_concurrency=int(os.environ.get("OPENAI_MIN_CONCURRENCY", "1")),
+                max_concurrency=int(os.environ.get("OPENAI_MAX_CONCURRENCY", "16")),
+                max_retries=int(os.environ.get("OPENAI_MAX_RETRIES", "6"))
+            )
+
+    return _SCHEDULER
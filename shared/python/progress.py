@@ -0,0 +1,142 @@
+"""
+Fine-grained ingestion progress for videos.
+
+A ProgressReporter keeps the counters of one processing stage in memory
+(e.g. chunks transcribed, chunks embedded, vectors upserted) and writes
+them to the video item in DynamoDB at most once per min_interval seconds.
+Counter updates in between are coalesced into the next write, so a long
+video costs a handful of writes instead of one per chunk.
+
+Each write is a conditional update_item of metadata.<stage>Progress that
+only succeeds when it is newer than the stored value, so a late write of a
+slow thread or an earlier attempt never moves progress backwards. Progress
+is best effort: failed writes are logged and never fail the job.
+"""
+import logging
+import os
+import threading
+import time
+from typing import Optional
+
+import boto3
+from botocore.exceptions import ClientError
+
+logger = logging.getLogger()
+
+PROGRESS_MIN_INTERVAL_SECONDS = float(os.environ.get("PROGRESS_MIN_INTERVAL_SECONDS", "10"))
+# Table of the video items, set on the transcription and embeddings Lambdas
+PROGRESS_TABLE_NAME = os.environ.get("SEMANTIC_VIDEO_CHAT_TABLE_NAME", "")
+
+_DYNAMODB = None
+
+
+def _dynamodb():
+    global _DYNAMODB
+
+    if _DYNAMODB is None:
+        _DYNAMODB = boto3.client("dynamodb")
+
+    return _DYNAMODB
+
+
+class ProgressReporter:
+    """
+    Coalesced, rate-limited progress of one stage of a video.
+
+    The item attribute metadata.<stage>Progress holds the counters, total,
+    updatedAt (epoch seconds) and a sequence number used by the write
+    condition. Thread-safe.
+    """
+
+    def __init__(self, table_name: str, knowledge_room_id: str, video_id: str, stage: str,
+                 min_interval: Optional[float] = None):
+        self.table_name = table_name
+        self.key = {
+            "PK": {"S": f"ROOM#{knowledge_room_id}"},
+            "SK": {"S": f"VIDEO#{video_id}"}
+        }
+        self.attribute = f"{stage}Progress"
+        self.min_interval = PROGRESS_MIN_INTERVAL_SECONDS if min_interval is None else min_interval
+        self.counters = {}
+        self.total = None
+        self.writes = 0
+        self._dirty = False
+        self._last_write = 0.0
+        self._writing = False
+        self._lock = threading.Lock()
+
+    def set_total(self, total: int) -> None:
+        with self._lock:
+            self.total = total
+            self._dirty = True
+
+    def advance(self, counter: str, amount: int = 1) -> None:
+        """Adds amount to a counter and writes progress if the interval elapsed."""
+        with self._lock:
+            self.counters[counter] = self.counters.get(counter, 0) + amount
+            self._dirty = True
+
+        self.flush(force=False)
+
+    def flush(self, force: bool = True) -> None:
+        """
+        Writes pending progress. Without force the write is skipped while
+        another thread writes or when the last write is too recent.
+        """
+        with self._lock:
+            now = time.monotonic()
+            if not self._dirty or (not force and (
+                self._writing or now - self._last_write < self.min_interval
+            )):
+                return
+
+            self._writing = True
+            self._dirty = False
+            self._last_write = now
+            counters = dict(self.counters)
+            total = self.total
+
+        try:
+            self._write(counters, total)
+        finally:
+            with self._lock:
+                self._writing = False
+
+    def _write(self, counters: dict, total: Optional[int]) -> None:
+        # Wall-clock sequence so newer attempts of a retried job win as well
+        sequence = time.time_ns()
+
+        value = {
+            "counters": {"M": {name: {"N": str(count)} for name, count in counters.items()}},
+            "updatedAt": {"N": str(int(time.time()))},
+            "seq": {"N": str(sequence)}
+        }
+        if total is not None:
+            value["total"] = {"N": str(total)}
+
+        try:
+            _dynamodb().update_item(
+                TableName=self.table_name,
+                Key=self.key,
+                UpdateExpression="SET metadata.#progress = :progress",
+                ConditionExpression="attribute_exists(PK) AND "
+                                    "(attribute_not_exists(metadata.#progress.#seq) "
+                                    "OR metadata.#progress.#seq < :seq)",
+                ExpressionAttributeNames={"#progress": self.attribute, "#seq": "seq"},
+                ExpressionAttributeValues={":progress": {"M": value}, ":seq": {"N": str(sequence)}}
+            )
+            # A forced flush may write while another thread writes
+            with self._lock:
+                self.writes += 1
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") == "ConditionalCheckFailedException":
+                logger.debug("Skipped stale %s write", self.attribute)
+            else:
+                logger.warning("Failed to write %s: %s", self.attribute, e)
+
+
+def create_progress_reporter(knowledge_room_id: str, video_id: str, stage: str) -> ProgressReporter:
+    """
+    Creates the progress reporter of a processing stage of a video.
+    """
+    return ProgressReporter(PROGRESS_TABLE_NAME, knowledge_room_id, video_id, stage)
@@ -0,0 +1,56 @@
+"""
+Small S3 object helpers shared by the caches and checkpoints of the services.
+
+A missing key is returned as None, every other ClientError is raised, so the
+caller decides whether a failure is a miss, a warning or an error.
+"""
+import json
+from typing import Optional
+
+import boto3
+from botocore.exceptions import ClientError
+
+s3 = boto3.client("s3")
+
+MISSING_KEY_ERROR_CODES = {"NoSuchKey", "404", "NotFound"}
+
+
+def is_missing_key(error: ClientError) -> bool:
+    """Whether a ClientError reports a key that does not exist."""
+    return error.response.get("Error", {}).get("Code") in MISSING_KEY_ERROR_CODES
+
+
+def get_bytes(bucket: str, key: str) -> Optional[bytes]:
+    """Returns the content of an object, None when the key does not exist."""
+    try:
+        return s3.get_object(Bucket=bucket, Key=key)["Body"].read()
+    except ClientError as e:
+        if is_missing_key(e):
+            return None
+        raise
+
+
+def put_bytes(bucket: str, key: str, data: bytes, content_type: Optional[str] = None) -> None:
+    """Stores data as an object."""
+    kwargs = {"ContentType": content_type} if content_type else {}
+    s3.put_object(Bucket=bucket, Key=key, Body=data, **kwargs)
+
+
+def get_json(bucket: str, key: str) -> Optional[dict]:
+    """Returns the parsed JSON of an object, None when the key does not exist."""
+    data = get_bytes(bucket, key)
+    return None if data is None else json.loads(data)
+
+
+def put_json(bucket: str, key: str, data: dict) -> None:
+    """Stores data as a JSON object."""
+    put_bytes(bucket, key, json.dumps(data).encode("utf-8"), content_type="application/json")
+
+
+def delete_keys(bucket: str, keys: list) -> None:
+    """Deletes objects in batches of 1000 keys, missing keys are ignored."""
+    for first in range(0, len(keys), 1000):
+        s3.delete_objects(
+            Bucket=bucket,
+            Delete={"Objects": [{"Key": key} for key in keys[first:first + 1000]], "Quiet": True}
+        )
@@ -0,0 +1,47 @@
+"""
+LangChain embeddings routed through the OpenAI scheduler.
+
+Only the embeddings and chats Lambdas import this module, LangChain comes
+from their layer.
+"""
+import math
+
+# pylint: disable=import-error
+# These imports come from the Lambda layer and are not available during local development
+from langchain_core.embeddings import Embeddings
+# pylint: enable=import-error
+
+from embedding_compression import EmbeddingCompression
+from openai_scheduler import OpenAIScheduler, estimate_tokens, get_scheduler
+
+
+class ScheduledEmbeddings(Embeddings):
+    """
+    Wraps a LangChain embeddings model (e.g. OpenAIEmbeddings) so every
+    embedding request takes its share of the request and token budgets and
+    is retried by the scheduler. Build the wrapped model with max_retries=0
+    so retries are not stacked. With a compression the returned embeddings
+    are reduced and quantized the same way as the stored vectors.
+    """
+
+    def __init__(self, embeddings: Embeddings, scheduler: OpenAIScheduler = None,
+                 compression: EmbeddingCompression = None):
+        self.embeddings = embeddings
+        self.scheduler = scheduler or get_scheduler()
+        self.compression = compression
+        # OpenAIEmbeddings sends up to chunk_size texts per request
+        self.batch_size = getattr(embeddings, "chunk_size", 1000) or 1000
+
+    def embed_documents(self, texts: list) -> list:
+        tokens = estimate_tokens(*texts)
+        embeddings = self.scheduler.call(
+            self.embeddings.embed_documents, texts,
+            requests=max(1, math.ceil(len(texts) / self.batch_size)),
+            tokens=tokens, work=tokens
+        )
+        return self.compression.apply(embeddings) if self.compression else embeddings
+
+    def embed_query(self, text: str) -> list:
+        tokens = estimate_tokens(text)
+        embedding = self.scheduler.call(self.embeddings.embed_query, text, tokens=tokens, work=tokens)
+        return self.compression.apply([embedding])[0] if self.compression else embedding
@@ -0,0 +1,44 @@
+"""
+Partial batch processing of SQS events.
+
+The SQS triggers of the transcription and embeddings Lambdas enable
+ReportBatchItemFailures: every record of a batch is processed, and only the
+message ids of the failed records are returned for redelivery.
+"""
+import logging
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Callable, List
+
+logger = logging.getLogger()
+
+
+def process_sqs_records(records: list, process_record: Callable[[dict], None],
+                        max_workers: int = 1) -> List[str]:
+    """
+    Processes SQS records concurrently with a bounded worker pool.
+    Failures are logged per record and do not affect the other records.
+    Returns the message ids of the failed records.
+    """
+    failed_message_ids = []
+
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+        futures = {executor.submit(process_record, record): record for record in records}
+
+        for future in as_completed(futures):
+            record = futures[future]
+            try:
+                future.result()
+            except Exception as e:  # pylint: disable=broad-except
+                logger.error("Error processing record %s: %s", record.get("messageId"), e)
+                failed_message_ids.append(record["messageId"])
+
+    return failed_message_ids
+
+
+def batch_item_failures(failed_message_ids: List[str]) -> dict:
+    """Lambda response that makes SQS redeliver only the failed records."""
+    return {
+        "batchItemFailures": [
+            {"itemIdentifier": message_id} for message_id in failed_message_ids
+        ]
+    }
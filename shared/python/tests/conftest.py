@@ -0,0 +1,11 @@
+"""
+Test setup of the shared modules: they are importable flat, like in the
+Lambda packages of the services.
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# boto3 clients are created on import, the tests never reach AWS
+os.environ.setdefault("AWS_DEFAULT_REGION", "eu-central-1")
@@ -0,0 +1,169 @@
+"""Tests of the tokenizer, the BM25 ranking, the refresh and the fusion of the lexical index."""
+import pytest
+
+from lexical_index import LexicalDocument, LexicalIndex, LexicalStorage, fuse, tokenize
+
+NAMESPACE = "room"
+TEXTS = {
+    "v1": [
+        "The new GPT-4o model was announced in May and costs less than GPT-4 Turbo.",
+        "We talk about the weather, the weekend and what we had for lunch.",
+        "Pricing of the API is per token, input tokens are cheaper than output tokens.",
+    ],
+    "v2": [
+        "Kubernetes schedules pods on nodes, the kubelet runs them.",
+        "The model of the weekend was a small language model running on a laptop.",
+    ],
+}
+
+
+def document(video_id, texts):
+    lexical = LexicalDocument()
+    for i, text in enumerate(texts):
+        lexical.add(f"{video_id}#{i}", text, {"video_id": video_id, "chunk_index": i})
+    return lexical
+
+
+@pytest.fixture(name="storage")
+def fixture_storage(tmp_path):
+    storage = LexicalStorage(directory=str(tmp_path))
+    for video_id, texts in TEXTS.items():
+        storage.put(NAMESPACE, video_id, document(video_id, texts))
+    return storage
+
+
+@pytest.fixture(name="index")
+def fixture_index(storage):
+    index = LexicalIndex(storage, NAMESPACE)
+    index.refresh()
+    return index
+
+
+def ids(matches):
+    return [match["id"] for match in matches]
+
+
+def test_tokenize_keeps_names_numbers_and_acronyms():
+    assert tokenize("The GPT-4o model costs 3.5 cents in the U.S.") == [
+        "gpt-4o", "model", "costs", "3.5", "cents", "u.s"
+    ]
+    assert tokenize("ＧＰＴ") == ["gpt"]
+    assert tokenize("what is it about") == []
+
+
+def test_exact_keyword_ranks_first(index):
+    assert ids(index.search("GPT-4o", top_k=3)) == ["v1#0"]
+    assert ids(index.search("kubelet pods", top_k=3)) == ["v2#0"]
+
+
+def test_chunk_matching_more_query_terms_ranks_first(index):
+    matches = index.search("model pricing tokens", top_k=5)
+
+    assert set(ids(matches)) == {"v1#0", "v1#2", "v2#1"}
+    assert ids(matches)[0] == "v1#2"
+    assert [match["score"] for match in matches] == sorted((match["score"] for match in matches), reverse=True)
+
+
+def test_rare_terms_outweigh_common_ones(index):
+    # "weekend" is in two chunks, "lunch" in one
+    assert ids(index.search("weekend lunch", top_k=1)) == ["v1#1"]
+
+
+def test_repeated_term_counts_with_saturation(index):
+    matches = {match["id"]: match["score"] for match in index.search("model", top_k=5)}
+
+    # v2#1 has "model" twice, but tf saturates: less than double the score
+    assert matches["v2#1"] > matches["v1#0"]
+    assert matches["v2#1"] < 2 * matches["v1#0"]
+
+
+def test_unknown_and_stop_words_match_nothing(index):
+    assert index.search("blockchain", top_k=3) == []
+    assert index.search("what is the", top_k=3) == []
+
+
+def test_matches_carry_the_chunk_text(index):
+    match = index.search("kubelet", top_k=1)[0]
+
+    assert match["metadata"] == {"video_id": "v2", "chunk_index": 0, "text": TEXTS["v2"][0]}
+
+
+def test_refresh_lists_documents_only_when_the_marker_changed(storage, index, monkeypatch):
+    listings = []
+    versions = storage.versions
+    monkeypatch.setattr(storage, "versions", lambda namespace: listings.append(namespace) or versions(namespace))
+
+    index.refresh(force=True)
+    assert listings == []
+
+    storage.put(NAMESPACE, "v3", document("v3", ["Terraform provisions the websocket API."]))
+    index.refresh(force=True)
+    assert listings == [NAMESPACE]
+    assert ids(index.search("terraform", top_k=1)) == ["v3#0"]
+
+    storage.delete(NAMESPACE, "v1")
+    index.refresh(force=True)
+    assert index.search("GPT-4o", top_k=1) == []
+    assert len(index.ids) == 3
+
+
+def test_refresh_is_throttled_unless_forced(storage, index):
+    storage.put(NAMESPACE, "v3", document("v3", ["Terraform provisions the websocket API."]))
+
+    index.refresh()
+    assert index.search("terraform", top_k=1) == []
+
+    index.refresh(force=True)
+    assert ids(index.search("terraform", top_k=1)) == ["v3#0"]
+
+
+def test_namespace_without_marker_is_listed_on_every_refresh(storage, index, tmp_path):
+    (tmp_path / NAMESPACE / "_changed").unlink()
+    (tmp_path / NAMESPACE / "v2.json.gz").unlink()
+
+    index.refresh(force=True)
+
+    assert ids(index.search("kubelet", top_k=1)) == []
+    assert storage.marker(NAMESPACE) is None
+
+
+def match(vector_id, score):
+    return {"id": vector_id, "score": score, "metadata": {"id": vector_id}}
+
+
+def test_rrf_ranks_matches_of_both_retrievers_first():
+    dense = [match("a", 0.9), match("b", 0.85), match("c", 0.8)]
+    sparse = [match("d", 12.0), match("c", 9.0), match("e", 3.0)]
+
+    fused = fuse(dense, sparse, method="rrf", rrf_k=60)
+
+    assert ids(fused) == ["c", "a", "d", "b", "e"]
+    assert fused[0]["score"] == pytest.approx(0.5 / 63 + 0.5 / 62)
+    assert (fused[0]["dense_score"], fused[0]["sparse_score"]) == (0.8, 9.0)
+    assert (fused[1]["dense_score"], fused[1]["sparse_score"]) == (0.9, None)
+    assert (fused[2]["dense_score"], fused[2]["sparse_score"]) == (None, 12.0)
+
+
+def test_rrf_dense_weight_breaks_rank_ties():
+    dense = [match("a", 0.9)]
+    sparse = [match("b", 12.0)]
+
+    assert ids(fuse(dense, sparse, dense_weight=0.7)) == ["a", "b"]
+    assert ids(fuse(dense, sparse, dense_weight=0.3)) == ["b", "a"]
+
+
+def test_weighted_fusion_normalizes_bm25_by_the_best_score():
+    dense = [match("a", 0.9), match("b", 0.5)]
+    sparse = [match("b", 20.0), match("c", 10.0)]
+
+    fused = {entry["id"]: entry["score"] for entry in fuse(dense, sparse, method="weighted", dense_weight=0.5)}
+
+    assert fused == pytest.approx({"a": 0.45, "b": 0.25 + 0.5, "c": 0.25})
+    assert ids(fuse(dense, sparse, method="weighted", dense_weight=0.5)) == ["b", "a", "c"]
+
+
+def test_fusion_of_one_retriever_keeps_its_order():
+    sparse = [match("x", 3.0), match("y", 2.0), match("z", 1.0)]
+
+    assert ids(fuse([], sparse, method="rrf")) == ["x", "y", "z"]
+    assert ids(fuse([], sparse, method="weighted")) == ["x", "y", "z"]
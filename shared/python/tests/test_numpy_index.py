@@ -0,0 +1,155 @@
+"""Tests of the segments, deletes, compaction and search modes of the NumPy vector index."""
+import numpy as np
+import pytest
+
+from numpy_index import NumpyIndex
+
+DIMENSIONS = 16
+
+
+def random_vectors(count, seed=0):
+    return np.random.default_rng(seed).normal(size=(count, DIMENSIONS)).astype(np.float32)
+
+
+def clustered_vectors(count, clusters=20, seed=0):
+    """Unit vectors around random centers, like the embeddings of related chunks."""
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(clusters, DIMENSIONS))
+    vectors = centers[rng.integers(clusters, size=count)] + 0.3 * rng.normal(size=(count, DIMENSIONS))
+    return (vectors / np.linalg.norm(vectors, axis=1, keepdims=True)).astype(np.float32)
+
+
+def upsert_video(index, video_id, vectors, **metadata):
+    index.upsert([f"{video_id}#{i}" for i in range(len(vectors))], vectors,
+                 [{"video_id": video_id, "start": i, **metadata} for i in range(len(vectors))])
+
+
+@pytest.mark.parametrize("quantization", ["none", "int8"])
+def test_search_finds_the_upserted_vector(tmp_path, quantization):
+    index = NumpyIndex(str(tmp_path), quantization=quantization)
+    vectors = random_vectors(50)
+    upsert_video(index, "v1", vectors)
+
+    matches = index.search(vectors[7], top_k=3)
+
+    assert [match["id"] for match in matches][0] == "v1#7"
+    assert matches[0]["score"] == pytest.approx(1.0, abs=0.02)
+    assert matches[0]["metadata"] == {"video_id": "v1", "start": 7}
+    assert [match["score"] for match in matches] == sorted((match["score"] for match in matches), reverse=True)
+
+
+def test_upsert_replaces_vectors_with_the_same_id(tmp_path):
+    index = NumpyIndex(str(tmp_path))
+    vectors = random_vectors(10)
+    upsert_video(index, "v1", vectors)
+    index.upsert(["v1#3"], [vectors[5]], [{"video_id": "v1", "start": 30}])
+
+    assert index.count() == 10
+    matches = index.search(vectors[5], top_k=2)
+    assert {match["id"] for match in matches} == {"v1#3", "v1#5"}
+    assert index.search(vectors[3], top_k=1)[0]["id"] != "v1#3"
+
+
+def test_last_duplicate_id_of_one_upsert_wins(tmp_path):
+    index = NumpyIndex(str(tmp_path))
+    vectors = random_vectors(2)
+    index.upsert(["a", "a"], vectors, [{"n": 0}, {"n": 1}])
+
+    assert index.count() == 1
+    assert index.search(vectors[1], top_k=1)[0]["metadata"] == {"n": 1}
+
+
+def test_delete_then_compact(tmp_path):
+    index = NumpyIndex(str(tmp_path), max_deleted_ratio=1.0)
+    vectors = random_vectors(20)
+    upsert_video(index, "v1", vectors[:10])
+    upsert_video(index, "v2", vectors[10:])
+
+    assert index.delete_video("v1") == 10
+    assert index.delete_video("v1") == 0
+    assert index.count() == 10
+    # A segment without live rows is dropped from the manifest right away
+    assert len(index.manifest["segments"]) == 1
+
+    assert index.delete_video("v2", start=6) == 4
+    assert index.manifest["segments"][0]["deleted"] == [6, 7, 8, 9]
+
+    index.compact()
+
+    assert len(index.manifest["segments"]) == 1
+    assert index.manifest["segments"][0]["deleted"] == []
+    assert index.count() == 6
+    matches = index.search(vectors[10], top_k=20, mode="flat")
+    assert sorted(match["id"] for match in matches) == [f"v2#{i}" for i in range(6)]
+
+
+def test_many_deletes_compact_automatically(tmp_path):
+    index = NumpyIndex(str(tmp_path), max_deleted_ratio=0.3)
+    vectors = random_vectors(20)
+    upsert_video(index, "v1", vectors[:5])
+    upsert_video(index, "v2", vectors[5:])
+
+    index.delete_video("v2", start=8)
+
+    assert [segment["deleted"] for segment in index.manifest["segments"]] == [[]]
+    assert index.count() == 13
+
+
+def test_too_many_segments_compact_automatically(tmp_path):
+    index = NumpyIndex(str(tmp_path), max_segments=3)
+    vectors = random_vectors(4)
+    for i, vector in enumerate(vectors):
+        upsert_video(index, f"v{i}", [vector])
+
+    assert len(index.manifest["segments"]) == 1
+    assert index.count() == 4
+
+
+def test_rows_where_matches_missing_keys_with_none(tmp_path):
+    index = NumpyIndex(str(tmp_path))
+    vectors = random_vectors(4)
+    index.upsert(["a", "b", "c", "d"], vectors, [
+        {"video_id": "v1", "kind": "section"},
+        {"video_id": "v1"},
+        {"video_id": "v2", "kind": "section"},
+        {"video_id": "v2"},
+    ])
+    segment = index._segment(index.manifest["segments"][0]["name"])  # pylint: disable=protected-access
+
+    assert segment.rows_where({"kind": [None]}).tolist() == [1, 3]
+    assert segment.rows_where({"kind": ["section", None]}).tolist() == [0, 1, 2, 3]
+    assert segment.rows_where({"video_id": ["v2"], "kind": [None]}).tolist() == [3]
+    assert segment.rows_where({"video_id": ["v3"]}).tolist() == []
+
+    matches = index.search(vectors[0], top_k=4, where={"kind": [None]})
+    assert sorted(match["id"] for match in matches) == ["b", "d"]
+
+
+def test_second_writer_sees_committed_changes(tmp_path):
+    first = NumpyIndex(str(tmp_path))
+    second = NumpyIndex(str(tmp_path))
+    vectors = random_vectors(5)
+
+    upsert_video(first, "v1", vectors)
+    upsert_video(second, "v2", vectors[:2])
+
+    first.refresh()
+    assert first.count() == second.count() == 7
+    assert first.manifest["version"] == second.manifest["version"] == 2
+
+
+def test_ivf_recall_against_flat_search(tmp_path):
+    index = NumpyIndex(str(tmp_path), ivf_min_vectors=1000)
+    vectors = clustered_vectors(2050)
+    upsert_video(index, "v1", vectors[:2000])
+    queries = vectors[2000:]
+
+    assert index._segment(index.manifest["segments"][0]["name"]).ivf is not None  # pylint: disable=protected-access
+
+    found = 0
+    for query in queries:
+        exact = {match["id"] for match in index.search(query, top_k=10, mode="flat")}
+        approximate = {match["id"] for match in index.search(query, top_k=10, mode="ivf", nprobe=8)}
+        found += len(exact & approximate)
+
+    assert found / (10 * len(queries)) >= 0.9
@@ -0,0 +1,199 @@
+"""Tests of the retries, the adaptive limit and the token buckets of the OpenAI scheduler."""
+import threading
+from http.server import ThreadingHTTPServer
+
+import pytest
+
+import openai_scheduler
+from openai_scheduler import OpenAIScheduler, TokenBucket
+
+
+class FakeClock:
+    """Stands in for the time module: sleeping advances the monotonic clock."""
+
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+class FakeResponse:
+    def __init__(self, status_code, headers=None):
+        self.status_code = status_code
+        self.headers = headers or {}
+
+
+class FakeAPIError(Exception):
+    """Error shaped like the APIStatusError of the OpenAI SDK."""
+
+    def __init__(self, status_code, headers=None, error_type=None, message="API error"):
+        super().__init__(message)
+        self.status_code = status_code
+        self.response = FakeResponse(status_code, headers)
+        self.type = error_type
+
+
+def failing(*errors, result="ok"):
+    """Callable raising errors one call at a time, then returning result."""
+    calls = []
+
+    def fn():
+        calls.append(len(calls))
+        if len(calls) <= len(errors):
+            raise errors[len(calls) - 1]
+        return result
+
+    fn.calls = calls
+    return fn
+
+
+@pytest.fixture(name="clock")
+def fixture_clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(openai_scheduler, "time", clock)
+    return clock
+
+
+@pytest.mark.parametrize("status_code", [429, 500, 503])
+def test_retries_honour_retry_after(clock, status_code):
+    scheduler = OpenAIScheduler(base_delay=0.001, max_delay=30.0)
+    fn = failing(FakeAPIError(status_code, {"retry-after": "2"}))
+
+    assert scheduler.call(fn) == "ok"
+    assert len(fn.calls) == 2
+    assert clock.sleeps == [2.0]
+    assert scheduler.stats["retries"] == 1
+
+
+def test_retry_after_ms_takes_precedence(clock):
+    scheduler = OpenAIScheduler(base_delay=0.001)
+    fn = failing(FakeAPIError(429, {"retry-after-ms": "250", "retry-after": "9"}))
+
+    assert scheduler.call(fn) == "ok"
+    assert clock.sleeps == [0.25]
+
+
+def test_retry_after_is_capped_at_max_delay(clock):
+    scheduler = OpenAIScheduler(base_delay=0.001, max_delay=5.0)
+
+    assert scheduler.call(failing(FakeAPIError(429, {"retry-after": "60"}))) == "ok"
+    assert clock.sleeps == [5.0]
+
+
+def test_gives_up_after_max_retries(clock):
+    scheduler = OpenAIScheduler(max_retries=2, base_delay=0.001)
+    fn = failing(*[FakeAPIError(500) for _ in range(5)])
+
+    with pytest.raises(FakeAPIError):
+        scheduler.call(fn)
+    assert len(fn.calls) == 3
+    assert len(clock.sleeps) == 2
+    assert scheduler.stats["failed"] == 1
+
+
+@pytest.mark.parametrize("error", [FakeAPIError(400), FakeAPIError(401), ValueError("bad input")])
+def test_non_retryable_error_is_raised_right_away(clock, error):
+    scheduler = OpenAIScheduler()
+    fn = failing(error)
+
+    with pytest.raises(type(error)):
+        scheduler.call(fn)
+    assert len(fn.calls) == 1
+    assert not clock.sleeps
+    assert scheduler.stats["retries"] == 0
+
+
+def test_rate_limit_halves_the_concurrency_limit(clock):
+    scheduler = OpenAIScheduler(initial_concurrency=8, min_concurrency=2, base_delay=0.001)
+
+    scheduler.call(failing(FakeAPIError(429)))
+    assert int(scheduler.concurrency.limit) == 4
+
+    scheduler.call(failing(FakeAPIError(429), FakeAPIError(429)))
+    assert int(scheduler.concurrency.limit) == 2
+    assert scheduler.stats["rate_limited"] == 3
+
+
+def test_server_errors_keep_the_concurrency_limit(clock):
+    scheduler = OpenAIScheduler(initial_concurrency=8, base_delay=0.001)
+
+    scheduler.call(failing(FakeAPIError(500)))
+    assert int(scheduler.concurrency.limit) == 8
+
+
+def test_empty_bucket_waits_for_the_refill(clock):
+    bucket = TokenBucket(rate_per_minute=60, capacity=2)
+
+    assert bucket.acquire(2) == 0.0
+    assert bucket.acquire(1) == pytest.approx(1.0)
+    assert clock.sleeps == [pytest.approx(1.0)]
+
+
+def test_drained_bucket_throttles_the_next_call(clock):
+    scheduler = OpenAIScheduler(requests_per_minute=120)
+    scheduler.requests.drain()
+
+    assert scheduler.call(lambda: "ok") == "ok"
+    assert scheduler.stats["throttled_seconds"] == pytest.approx(0.5)
+
+
+@pytest.mark.parametrize("error, requests_drained, tokens_drained", [
+    (FakeAPIError(429, error_type="requests"), True, False),
+    (FakeAPIError(429, error_type="tokens"), False, True),
+    (FakeAPIError(429, {"x-ratelimit-remaining-tokens": "0"}), False, True),
+    (FakeAPIError(429, message="Rate limit reached on tokens per min (TPM): Limit 1000"), False, True),
+    (FakeAPIError(429, message="Rate limit reached on requests per min (RPM): Limit 3"), True, False),
+    (FakeAPIError(429), True, True),
+])
+def test_rate_limit_drains_the_exhausted_bucket(clock, error, requests_drained, tokens_drained):
+    scheduler = OpenAIScheduler(requests_per_minute=60, tokens_per_minute=6000, max_retries=0)
+
+    with pytest.raises(FakeAPIError):
+        scheduler.call(failing(error), tokens=100)
+
+    assert (scheduler.requests.tokens <= 0) == requests_drained
+    assert (scheduler.tokens.tokens <= 0) == tokens_drained
+
+
+@pytest.fixture(name="fake_server")
+def fixture_fake_server():
+    from dev.fake_openai_server import FakeOpenAIState, make_handler
+
+    state = FakeOpenAIState(rpm=1, error_rate=0.0, latency=0.0, dimensions=8)
+    server = ThreadingHTTPServer(("127.0.0.1", 0), make_handler(state))
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+
+    yield state, f"http://127.0.0.1:{server.server_address[1]}/v1"
+
+    server.shutdown()
+    server.server_close()
+
+
+def test_rate_limits_of_the_fake_server(fake_server):
+    openai = pytest.importorskip("openai")
+    state, base_url = fake_server
+    client = openai.OpenAI(api_key="test", base_url=base_url, max_retries=0)
+    scheduler = OpenAIScheduler(requests_per_minute=600, tokens_per_minute=6000,
+                                initial_concurrency=8, max_retries=2, base_delay=0.001, max_delay=0.01)
+
+    def embed():
+        return client.embeddings.create(model="text-embedding-3-small", input=["hello"])
+
+    assert len(scheduler.call(embed, tokens=10).data[0].embedding) == 8
+
+    with pytest.raises(openai.RateLimitError):
+        scheduler.call(embed, tokens=10)
+
+    assert state.counts == {"ok": 1, "rate_limited": 3, "error": 0}
+    assert scheduler.stats["rate_limited"] == 3
+    assert int(scheduler.concurrency.limit) == 1
+    # The fake server reports the request limit: only the request bucket is drained
+    assert scheduler.stats["throttled_seconds"] > 0
+    assert scheduler.tokens.tokens > 5000
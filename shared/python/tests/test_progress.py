@@ -0,0 +1,32 @@
+"""Tests of the coalesced progress writes."""
+import progress
+
+
+class FakeDynamoDB:
+    def __init__(self):
+        self.writes = []
+
+    def update_item(self, **kwargs):
+        self.writes.append(kwargs)
+
+
+def test_coalesces_counter_updates(monkeypatch):
+    dynamodb = FakeDynamoDB()
+    monkeypatch.setattr(progress, "_DYNAMODB", dynamodb)
+    monkeypatch.setattr(progress, "PROGRESS_TABLE_NAME", "table")
+
+    reporter = progress.create_progress_reporter("room", "video", "embeddings")
+    reporter.min_interval = 3600
+    reporter.set_total(3)
+    for _ in range(3):
+        reporter.advance("chunksEmbedded")
+    reporter.flush()
+
+    # The first advance writes, the next ones wait for the interval until the flush
+    assert reporter.writes == len(dynamodb.writes) == 2
+    last = dynamodb.writes[-1]
+    assert last["TableName"] == "table"
+    assert last["Key"] == {"PK": {"S": "ROOM#room"}, "SK": {"S": "VIDEO#video"}}
+    value = last["ExpressionAttributeValues"][":progress"]["M"]
+    assert value["counters"] == {"M": {"chunksEmbedded": {"N": "3"}}}
+    assert value["total"] == {"N": "3"}
@@ -0,0 +1,22 @@
+"""Tests of the partial batch processing of SQS events."""
+from sqs_batch import batch_item_failures, process_sqs_records
+
+
+def test_reports_only_the_failed_records():
+    processed = []
+
+    def process_record(record: dict) -> None:
+        if record["body"] == "bad":
+            raise ValueError("bad record")
+        processed.append(record["messageId"])
+
+    records = [{"messageId": "m1", "body": "ok"}, {"messageId": "m2", "body": "bad"},
+               {"messageId": "m3", "body": "ok"}]
+
+    assert process_sqs_records(records, process_record, max_workers=2) == ["m2"]
+    assert sorted(processed) == ["m1", "m3"]
+
+
+def test_batch_item_failures():
+    assert batch_item_failures([]) == {"batchItemFailures": []}
+    assert batch_item_failures(["m2"]) == {"batchItemFailures": [{"itemIdentifier": "m2"}]}
@@ -0,0 +1,64 @@
+"""Round trips of transcripts through the writers and the readers of both formats."""
+import io
+import json
+
+import pytest
+
+import transcript_format
+from transcript_format import (
+    encode_compact_transcript, iter_transcript_segments, load_compact_transcript, read_transcript_segments
+)
+
+TRANSCRIPT = {
+    "text": "Hello world. Grüße aus München — \"quoted\" text.",
+    "segments": [
+        {"start": 0.0, "end": 1.5, "text": "Hello world."},
+        {"start": 1.5, "end": 3.25, "text": "Grüße aus München —"},
+        {"start": 3.25, "end": 4.0, "text": "\"quoted\" text, with [brackets] and {braces}"},
+        {"start": 4.0, "end": 4.0, "text": ""},
+    ]
+}
+
+
+def encoded(fmt: str) -> bytes:
+    if fmt == "compact":
+        return encode_compact_transcript(TRANSCRIPT)
+    return json.dumps(TRANSCRIPT).encode("utf-8")
+
+
+@pytest.fixture(name="small_reads", autouse=True)
+def fixture_small_reads(monkeypatch):
+    # Segments straddle many reads of the streaming readers
+    monkeypatch.setattr(transcript_format, "READ_SIZE", 7)
+
+
+@pytest.mark.parametrize("fmt", ["compact", "json"])
+def test_stream_round_trip(fmt):
+    assert list(iter_transcript_segments(io.BytesIO(encoded(fmt)))) == TRANSCRIPT["segments"]
+
+
+@pytest.mark.parametrize("fmt", ["compact", "json"])
+def test_file_round_trip(fmt, tmp_path):
+    path = tmp_path / "transcript"
+    path.write_bytes(encoded(fmt))
+
+    assert list(read_transcript_segments(str(path))) == TRANSCRIPT["segments"]
+
+
+def test_compact_view():
+    transcript = load_compact_transcript(encoded("compact"))
+
+    assert len(transcript) == len(TRANSCRIPT["segments"])
+    assert transcript.text == TRANSCRIPT["text"]
+    assert list(transcript.segments()) == TRANSCRIPT["segments"]
+
+
+def test_empty_transcript():
+    data = encode_compact_transcript({"text": "", "segments": []})
+    assert not list(iter_transcript_segments(io.BytesIO(data)))
+
+
+def test_truncated_compact_transcript():
+    data = encoded("compact")
+    with pytest.raises(ValueError):
+        list(iter_transcript_segments(io.BytesIO(data[:len(data) // 2])))
@@ -0,0 +1,97 @@
+"""Tests of deleting the vectors of a video from a Pinecone index, including legacy UUID ids."""
+import uuid
+from types import SimpleNamespace
+
+import pytest
+
+from vector_store import PineconeStore
+
+NAMESPACE = "room"
+
+
+class FakePineconeIndex:
+    """
+    Serverless Pinecone index: lists ids by prefix, deletes by id and
+    answers filtered queries. With stale_queries, queries keep returning
+    deleted ids, like an index whose deletes are not visible yet.
+    """
+
+    def __init__(self, stale_queries: bool = False):
+        self.metadata = {}
+        self.deleted = []
+        self.stale_queries = stale_queries
+        self.queries = 0
+        self._ever = {}
+
+    def add(self, vector_id: str, video_id: str) -> None:
+        self.metadata[vector_id] = {"video_id": video_id}
+        self._ever[vector_id] = {"video_id": video_id}
+
+    def describe_index_stats(self):
+        return SimpleNamespace(dimension=4)
+
+    def list(self, prefix: str, namespace: str):
+        assert namespace == NAMESPACE
+        ids = sorted(vector_id for vector_id in self.metadata if vector_id.startswith(prefix))
+        for first in range(0, len(ids), 2):
+            yield ids[first:first + 2]
+
+    def query(self, vector, top_k, namespace, filter):  # pylint: disable=redefined-builtin
+        assert namespace == NAMESPACE and len(vector) == 4 and any(vector)
+        self.queries += 1
+        source = self._ever if self.stale_queries else self.metadata
+        video_id = filter["video_id"]["$eq"]
+        ids = [vector_id for vector_id, metadata in source.items() if metadata["video_id"] == video_id]
+        return SimpleNamespace(matches=[SimpleNamespace(id=vector_id) for vector_id in ids[:top_k]])
+
+    def delete(self, ids, namespace):
+        assert namespace == NAMESPACE and len(ids) <= 1000
+        self.deleted.extend(ids)
+        for vector_id in ids:
+            self.metadata.pop(vector_id, None)
+
+
+@pytest.fixture(name="index")
+def fixture_index():
+    index = FakePineconeIndex()
+    for video_id in ("v1", "v2"):
+        for i in range(5):
+            index.add(f"{video_id}#{i}", video_id)
+        for _ in range(3):
+            index.add(str(uuid.uuid4()), video_id)
+    return index
+
+
+def remaining(index, video_id):
+    return sorted(vector_id for vector_id, metadata in index.metadata.items() if metadata["video_id"] == video_id)
+
+
+def test_delete_without_count_deletes_legacy_vectors(index):
+    PineconeStore(index).delete_video("v1", NAMESPACE)
+
+    assert remaining(index, "v1") == []
+    assert len(remaining(index, "v2")) == 8
+
+
+def test_delete_of_stale_chunks_deletes_legacy_vectors(index):
+    PineconeStore(index).delete_video("v1", NAMESPACE, start=3)
+
+    assert remaining(index, "v1") == ["v1#0", "v1#1", "v1#2"]
+    assert len(remaining(index, "v2")) == 8
+
+
+def test_delete_with_count_deletes_by_id_only(index):
+    PineconeStore(index).delete_video("v1", NAMESPACE, count=5, start=2)
+
+    assert index.deleted == ["v1#2", "v1#3", "v1#4"]
+    assert index.queries == 0
+
+
+def test_legacy_lookup_ends_while_deletes_are_not_visible(index):
+    index.stale_queries = True
+
+    PineconeStore(index).delete_video("v1", NAMESPACE)
+
+    assert remaining(index, "v1") == []
+    assert len(index.deleted) == len(set(index.deleted)) == 8
+    assert index.queries == 2
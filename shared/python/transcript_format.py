@@ -0,0 +1,316 @@
+"""
+Compact binary transcript format, written by the transcription service and
+read by the embeddings service.
+
+Layout of a compact transcript, all integers little-endian:
+
+    magic    4 bytes  b"SVTR"
+    version  uint8    1
+    codec    uint8    1 (zlib)
+    reserved 2 bytes
+    zlib stream of:
+        n_segments  uint32
+        text_bytes  uint32   byte length of the full transcript text
+        starts      float64[n_segments]
+        ends        float64[n_segments]
+        offsets     uint32[n_segments + 1]   offsets into the string table
+        strings     utf-8 segment texts, concatenated
+        text        utf-8 full transcript text
+
+Numeric arrays come before the string table, so a reader can decode the
+timestamps first and then stream the segment texts one by one. This module
+provides the writer, a zero-copy reader over a decoded payload and a
+streaming reader that yields segments while the compressed stream is still
+being read. Plain JSON transcripts stay readable through
+read_transcript_segments. iter_transcript_segments parses either format
+incrementally from a stream such as an S3 response body.
+"""
+import codecs
+import json
+import struct
+import sys
+import zlib
+from array import array
+from typing import BinaryIO, Dict, Iterator
+
+import numpy as np  # pylint: disable=import-error
+
+MAGIC = b"SVTR"
+VERSION = 1
+CODEC_ZLIB = 1
+FILE_HEADER = struct.Struct("<4sBBxx")
+PAYLOAD_HEADER = struct.Struct("<II")
+
+READ_SIZE = 64 * 1024
+
+
+def encode_compact_transcript(transcript: dict, level: int = 6) -> bytes:
+    """
+    Encodes a {"text", "segments"} transcript into the compact format.
+    """
+    segments = transcript.get("segments", [])
+
+    starts = array("d", (float(seg["start"]) for seg in segments))
+    ends = array("d", (float(seg["end"]) for seg in segments))
+
+    encoded_texts = [seg["text"].encode("utf-8") for seg in segments]
+    offsets = array("I", [0])
+    for encoded in encoded_texts:
+        offsets.append(offsets[-1] + len(encoded))
+
+    text = transcript.get("text", "").encode("utf-8")
+
+    # array uses the native byte order, the format is little-endian
+    if sys.byteorder == "big":
+        for values in (starts, ends, offsets):
+            values.byteswap()
+
+    compressor = zlib.compressobj(level)
+    parts = [FILE_HEADER.pack(MAGIC, VERSION, CODEC_ZLIB)]
+
+    for chunk in (
+        PAYLOAD_HEADER.pack(len(segments), len(text)),
+        starts.tobytes(),
+        ends.tobytes(),
+        offsets.tobytes(),
+        *encoded_texts,
+        text
+    ):
+        parts.append(compressor.compress(chunk))
+
+    parts.append(compressor.flush())
+
+    return b"".join(parts)
+
+
+class CompactTranscript:
+    """
+    Zero-copy view of a decompressed compact transcript.
+
+    starts, ends and offsets are numpy views into the payload, segment texts
+    are decoded from the string table only when accessed.
+    """
+
+    def __init__(self, payload: bytes):
+        n_segments, text_bytes = PAYLOAD_HEADER.unpack_from(payload, 0)
+        position = PAYLOAD_HEADER.size
+
+        self.starts = np.frombuffer(payload, dtype="<f8", count=n_segments, offset=position)
+        position += 8 * n_segments
+        self.ends = np.frombuffer(payload, dtype="<f8", count=n_segments, offset=position)
+        position += 8 * n_segments
+        self.offsets = np.frombuffer(payload, dtype="<u4", count=n_segments + 1, offset=position)
+        position += 4 * (n_segments + 1)
+
+        self._payload = memoryview(payload)
+        self._strings_at = position
+        self._text_at = position + int(self.offsets[-1])
+        self._text_bytes = text_bytes
+
+    def __len__(self) -> int:
+        return len(self.starts)
+
+    def segment_text(self, index: int) -> str:
+        """Decodes the text of a single segment."""
+        first = self._strings_at + int(self.offsets[index])
+        last = self._strings_at + int(self.offsets[index + 1])
+        return str(self._payload[first:last], "utf-8")
+
+    @property
+    def text(self) -> str:
+        """The full transcript text."""
+        return str(self._payload[self._text_at:self._text_at + self._text_bytes], "utf-8")
+
+    def segments(self) -> Iterator[Dict[str, float | str]]:
+        """Yields the segments as {"start", "end", "text"} dicts."""
+        for index in range(len(self)):
+            yield {
+                "start": float(self.starts[index]),
+                "end": float(self.ends[index]),
+                "text": self.segment_text(index)
+            }
+
+
+class _DecompressingReader:
+    """
+    Reads exact byte counts from the zlib payload of a compact transcript
+    while pulling compressed data from the underlying stream on demand.
+    """
+
+    def __init__(self, stream: BinaryIO):
+        self._stream = stream
+        self._decompressor = zlib.decompressobj()
+        self._buffer = bytearray()
+
+    def read_exact(self, size: int) -> bytes:
+        while len(self._buffer) < size:
+            compressed = self._decompressor.unconsumed_tail or self._stream.read(READ_SIZE)
+            if not compressed:
+                raise ValueError("Truncated compact transcript")
+            self._buffer += self._decompressor.decompress(compressed, READ_SIZE)
+
+        data = bytes(self._buffer[:size])
+        del self._buffer[:size]
+        return data
+
+
+def _check_file_header(header: bytes) -> None:
+    magic, version, codec = FILE_HEADER.unpack(header)
+
+    if magic != MAGIC:
+        raise ValueError("Not a compact transcript")
+    if version != VERSION or codec != CODEC_ZLIB:
+        raise ValueError(f"Unsupported compact transcript version {version} / codec {codec}")
+
+
+def is_compact_transcript(head: bytes) -> bool:
+    """Returns True when the leading bytes of a file carry the compact format magic."""
+    return head[:len(MAGIC)] == MAGIC
+
+
+def load_compact_transcript(data: bytes) -> CompactTranscript:
+    """Decompresses a compact transcript into a zero-copy view."""
+    _check_file_header(data[:FILE_HEADER.size])
+    return CompactTranscript(zlib.decompress(data[FILE_HEADER.size:]))
+
+
+def iter_compact_segments(stream: BinaryIO) -> Iterator[Dict[str, float | str]]:
+    """
+    Yields the segments of a compact transcript read from a binary stream.
+
+    Only the timestamp arrays and the current segment text are held in
+    memory, the full transcript text at the end of the payload is skipped.
+    """
+    _check_file_header(stream.read(FILE_HEADER.size))
+
+    reader = _DecompressingReader(stream)
+    n_segments, _ = PAYLOAD_HEADER.unpack(reader.read_exact(PAYLOAD_HEADER.size))
+
+    starts = np.frombuffer(reader.read_exact(8 * n_segments), dtype="<f8")
+    ends = np.frombuffer(reader.read_exact(8 * n_segments), dtype="<f8")
+    offsets = np.frombuffer(reader.read_exact(4 * (n_segments + 1)), dtype="<u4")
+    lengths = np.diff(offsets)
+
+    for index in range(n_segments):
+        yield {
+            "start": float(starts[index]),
+            "end": float(ends[index]),
+            "text": reader.read_exact(int(lengths[index])).decode("utf-8")
+        }
+
+
+class _PrefixedStream:
+    """Binary stream that returns already consumed leading bytes before the rest of a stream."""
+
+    def __init__(self, head: bytes, stream: BinaryIO):
+        self._head = head
+        self._stream = stream
+
+    def read(self, size: int = -1) -> bytes:
+        if not self._head:
+            return self._stream.read(size)
+
+        if size is None or size < 0:
+            data, self._head = self._head + self._stream.read(), b""
+            return data
+
+        data, self._head = self._head[:size], self._head[size:]
+        if len(data) < size:
+            data += self._stream.read(size - len(data))
+        return data
+
+
+def iter_json_segments(stream: BinaryIO) -> Iterator[Dict[str, float | str]]:
+    """
+    Yields the segments of a plain JSON transcript while reading the stream.
+
+    Only the "segments" array of the document is parsed, one element at a
+    time. Everything before it (e.g. the full "text") is skipped without
+    being held in memory, so memory stays bounded by the read size and the
+    largest segment.
+    """
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    json_decoder = json.JSONDecoder()
+    buffer = ""
+    eof = False
+
+    def _fill() -> bool:
+        nonlocal buffer, eof
+        if eof:
+            return False
+        data = stream.read(READ_SIZE)
+        eof = not data
+        buffer += decoder.decode(data or b"", final=eof)
+        return not eof or bool(buffer)
+
+    # An unescaped "segments" can only be a key, string contents escape their quotes
+    marker = '"segments"'
+    while True:
+        position = buffer.find(marker)
+        if position >= 0:
+            buffer = buffer[position + len(marker):]
+            break
+        buffer = buffer[-len(marker):]
+        if not _fill():
+            return
+
+    while True:
+        stripped = buffer.lstrip()
+        if stripped.startswith(":"):
+            stripped = stripped[1:].lstrip()
+        if stripped.startswith("["):
+            buffer = stripped[1:]
+            break
+        if stripped:
+            raise ValueError("Malformed JSON transcript: segments is not an array")
+        buffer = stripped
+        if not _fill():
+            return
+
+    while True:
+        buffer = buffer.lstrip().lstrip(",").lstrip()
+        if buffer.startswith("]"):
+            return
+        if not buffer:
+            if not _fill():
+                raise ValueError("Truncated JSON transcript")
+            continue
+
+        try:
+            segment, end = json_decoder.raw_decode(buffer)
+        except json.JSONDecodeError:
+            if not _fill():
+                raise
+            continue
+
+        buffer = buffer[end:]
+        yield segment
+
+
+def iter_transcript_segments(stream: BinaryIO) -> Iterator[Dict[str, float | str]]:
+    """
+    Yields the segments of a transcript in the compact or the plain JSON
+    format while reading it from a binary stream, e.g. an S3 response body.
+    """
+    head = stream.read(len(MAGIC))
+    stream = _PrefixedStream(head, stream)
+
+    if is_compact_transcript(head):
+        yield from iter_compact_segments(stream)
+    else:
+        yield from iter_json_segments(stream)
+
+
+def read_transcript_segments(path: str) -> Iterator[Dict[str, float | str]]:
+    """
+    Yields the segments of a transcript file in the compact format or in
+    the plain JSON format.
+    """
+    with open(path, "rb") as f:
+        head = f.read(len(MAGIC))
+        f.seek(0)
+
+        if is_compact_transcript(head):
+            yield from iter_compact_segments(f)
+        else:
+            yield from json.load(f).get("segments", [])
@@ -0,0 +1,257 @@
+"""
+Vector store interface of the embeddings and chats services.
+
+Two backends are available, selected with VECTOR_STORE_BACKEND:
+
+- "pinecone" (default): the Pinecone index of PINECONE_INDEX_NAME.
+- "numpy": a memory-mapped NumPy index per namespace in VECTOR_STORE_PATH,
+  see numpy_index.py. It searches with VECTOR_STORE_SEARCH "ivf" (default,
+  VECTOR_STORE_NPROBE lists) or "flat" and needs no network access.
+  The default /tmp/vector-store is local to one Lambda container: it is
+  lost on a cold start and not shared between the embeddings and chats
+  Lambdas, so it only suits local development and benchmarks. A deployment
+  needs VECTOR_STORE_PATH on an EFS access point mounted into both Lambdas,
+  which the Terraform of this repository does not provision.
+
+Vector ids are {video_id}#{chunk_index}, every vector carries the chunk
+text under the "text" metadata key and the video_id of its video. Vectors
+written before the ids were deterministic have random UUID ids (LangChain's
+PineconeVectorStore.from_texts); deleting a video without its chunk count
+finds them by their video_id metadata and deletes them as well.
+
+Section vectors, the coarse level of the chunks of a namespace, are stored
+in the namespace of section_namespace() with ids {video_id}#{section_index}.
+The chunks of a section carry its id under the "section_id" metadata key.
+"""
+import logging
+import os
+import threading
+import time
+from typing import Any, Dict, List, Optional, Sequence
+
+from embedding_compression import get_compression
+from numpy_index import NumpyIndex
+
+logger = logging.getLogger()
+
+VECTOR_STORE_BACKEND = os.environ.get("VECTOR_STORE_BACKEND", "pinecone")
+VECTOR_STORE_PATH = os.environ.get("VECTOR_STORE_PATH", "/tmp/vector-store")
+VECTOR_STORE_SEARCH = os.environ.get("VECTOR_STORE_SEARCH", "ivf")
+VECTOR_STORE_NPROBE = int(os.environ.get("VECTOR_STORE_NPROBE", "16"))
+# Buffered vectors per namespace written as one segment of the NumPy index
+VECTOR_STORE_SEGMENT_SIZE = int(os.environ.get("VECTOR_STORE_SEGMENT_SIZE", "20000"))
+# Ids per Pinecone delete request
+DELETE_BATCH_SIZE = 1000
+# Matches per Pinecone query looking up the legacy vectors of a video, the maximum without metadata
+LEGACY_QUERY_TOP_K = 10000
+# Seconds between checks for manifests committed by other writers
+VECTOR_STORE_REFRESH_SECONDS = float(os.environ.get("VECTOR_STORE_REFRESH_SECONDS", "5"))
+
+
+def vector_id(video_id: str, chunk_index: int) -> str:
+    """Deterministic vector id of a chunk, so a redelivered record overwrites its vectors."""
+    return f"{video_id}#{chunk_index}"
+
+
+def section_namespace(namespace: str) -> str:
+    """Namespace of the section vectors of the chunks in namespace."""
+    return f"{namespace}-sections"
+
+
+class VectorStore:
+    """
+    Stores and searches vectors by namespace.
+
+    Vectors are dicts with id, values and metadata, matches are dicts with
+    id, score (cosine similarity) and metadata, best first.
+    """
+
+    def upsert(self, vectors: List[Dict[str, Any]], namespace: str) -> None:
+        raise NotImplementedError
+
+    def flush(self) -> None:
+        """Makes buffered upserts visible to searches."""
+
+    def query(self, vector: Sequence[float], top_k: int, namespace: str,
+              where: Optional[Dict[str, Sequence[Any]]] = None) -> List[Dict[str, Any]]:
+        """
+        Returns the top_k matches of the vector. With where, only vectors
+        whose metadata value of every key is one of the given values; None
+        among the values also matches vectors without the key.
+        """
+        raise NotImplementedError
+
+    def delete_video(self, video_id: str, namespace: str, count: Optional[int] = None, start: int = 0) -> None:
+        """
+        Deletes the vectors of a video from chunk index start on, all of
+        them by default. With the chunk count of the video the ids are
+        known and deleted in batches, otherwise they are looked up.
+        """
+        raise NotImplementedError
+
+
+def _pinecone_filter(where: Dict[str, Sequence[Any]]) -> Dict[str, Any]:
+    conditions = []
+    for key, values in where.items():
+        condition = {key: {"$in": [value for value in values if value is not None]}}
+        if None in values:
+            condition = {"$or": [condition, {key: {"$exists": False}}]}
+        conditions.append(condition)
+    return conditions[0] if len(conditions) == 1 else {"$and": conditions}
+
+
+class PineconeStore(VectorStore):
+    """Vector store on a Pinecone index."""
+
+    def __init__(self, index):
+        self.index = index
+
+    def upsert(self, vectors: List[Dict[str, Any]], namespace: str) -> None:
+        self.index.upsert(vectors=vectors, namespace=namespace)
+
+    def query(self, vector: Sequence[float], top_k: int, namespace: str,
+              where: Optional[Dict[str, Sequence[Any]]] = None) -> List[Dict[str, Any]]:
+        metadata_filter = _pinecone_filter(where) if where else None
+        response = self.index.query(vector=list(vector), top_k=top_k, namespace=namespace,
+                                    filter=metadata_filter, include_metadata=True)
+        return [{"id": match.id, "score": match.score, "metadata": match.metadata or {}}
+                for match in response.matches]
+
+    def _delete_ids(self, ids: List[str], namespace: str) -> None:
+        for first in range(0, len(ids), DELETE_BATCH_SIZE):
+            self.index.delete(ids=ids[first:first + DELETE_BATCH_SIZE], namespace=namespace)
+
+    def _delete_legacy_vectors(self, video_id: str, namespace: str) -> int:
+        """
+        Deletes the vectors of a video with random UUID ids, written before
+        vector ids were deterministic, and returns their count. Serverless
+        indexes neither list them by id prefix nor delete by metadata filter,
+        so they are found by queries filtered on their video_id; the query
+        vector only has to have the dimension of the index.
+        """
+        dimension = self.index.describe_index_stats().dimension
+        probe = [1.0] + [0.0] * (dimension - 1)
+        prefix = vector_id(video_id, "")
+        deleted = set()
+
+        while True:
+            response = self.index.query(vector=probe, top_k=LEGACY_QUERY_TOP_K, namespace=namespace,
+                                        filter={"video_id": {"$eq": video_id}})
+            # Deletes are eventually consistent, deleted ids may still be returned
+            ids = [match.id for match in response.matches
+                   if not match.id.startswith(prefix) and match.id not in deleted]
+            if not ids:
+                break
+            self._delete_ids(ids, namespace)
+            deleted.update(ids)
+
+        if deleted:
+            logger.info("Deleted %d legacy vectors of video %s from %s", len(deleted), video_id, namespace)
+        return len(deleted)
+
+    def delete_video(self, video_id: str, namespace: str, count: Optional[int] = None, start: int = 0) -> None:
+        if count is not None:
+            self._delete_ids([vector_id(video_id, i) for i in range(start, count)], namespace)
+            return
+
+        # Listing by id prefix, as serverless indexes do not delete by metadata filter
+        self._delete_ids([
+            listed_id
+            for page in self.index.list(prefix=vector_id(video_id, ""), namespace=namespace)
+            for listed_id in page
+            if int(listed_id.rsplit("#", 1)[1]) >= start
+        ], namespace)
+        # Without a recorded chunk count the video may predate deterministic ids. Its legacy
+        # vectors are stale from any start on, as re-embedding it wrote new ids
+        self._delete_legacy_vectors(video_id, namespace)
+
+
+class NumpyStore(VectorStore):
+    """
+    Vector store on memory-mapped NumPy indexes, one per namespace directory.
+    Upserts are buffered per namespace and written as segments of
+    VECTOR_STORE_SEGMENT_SIZE vectors and on flush().
+    """
+
+    def __init__(self, root: str, search: str = "ivf", nprobe: int = 16, segment_size: int = 20000,
+                 quantization: str = "none"):
+        self.root = root
+        self.search = search
+        self.nprobe = nprobe
+        self.segment_size = segment_size
+        self.quantization = quantization
+        self._indexes = {}
+        self._pending = {}
+        self._lock = threading.Lock()
+
+    def index(self, namespace: str) -> NumpyIndex:
+        with self._lock:
+            if namespace not in self._indexes:
+                self._indexes[namespace] = NumpyIndex(
+                    os.path.join(self.root, namespace), quantization=self.quantization
+                )
+            index = self._indexes[namespace]
+
+        if time.monotonic() - index.refreshed_at > VECTOR_STORE_REFRESH_SECONDS:
+            index.refresh()
+        return index
+
+    def upsert(self, vectors: List[Dict[str, Any]], namespace: str) -> None:
+        with self._lock:
+            pending = self._pending.setdefault(namespace, [])
+            pending.extend(vectors)
+            if len(pending) < self.segment_size:
+                return
+            del self._pending[namespace]
+
+        self._write(namespace, pending)
+
+    def _write(self, namespace: str, vectors: List[Dict[str, Any]]) -> None:
+        self.index(namespace).upsert(
+            [vector["id"] for vector in vectors],
+            [vector["values"] for vector in vectors],
+            [vector["metadata"] for vector in vectors]
+        )
+
+    def flush(self) -> None:
+        with self._lock:
+            pending, self._pending = self._pending, {}
+
+        for namespace, vectors in pending.items():
+            self._write(namespace, vectors)
+
+    def query(self, vector: Sequence[float], top_k: int, namespace: str,
+              where: Optional[Dict[str, Sequence[Any]]] = None) -> List[Dict[str, Any]]:
+        if not os.path.isdir(os.path.join(self.root, namespace)):
+            return []
+        return self.index(namespace).search(vector, top_k, mode=self.search, nprobe=self.nprobe, where=where)
+
+    def delete_video(self, video_id: str, namespace: str, count: Optional[int] = None, start: int = 0) -> None:
+        # Rows are found by their metadata, the count is not needed
+        def _deleted(vector: Dict[str, Any]) -> bool:
+            return (vector["metadata"].get("video_id") == video_id
+                    and int(vector["id"].rsplit("#", 1)[1]) >= start)
+
+        with self._lock:
+            self._pending[namespace] = [vector for vector in self._pending.get(namespace, [])
+                                        if not _deleted(vector)]
+        if os.path.isdir(os.path.join(self.root, namespace)):
+            self.index(namespace).delete_video(video_id, start=start)
+
+
+def create_vector_store(pinecone_index=None) -> VectorStore:
+    """Creates the vector store of VECTOR_STORE_BACKEND, pinecone_index is used by the Pinecone backend."""
+    if VECTOR_STORE_BACKEND == "numpy":
+        logger.info("Using the NumPy vector store in %s (%s search)", VECTOR_STORE_PATH, VECTOR_STORE_SEARCH)
+        if os.path.abspath(VECTOR_STORE_PATH).startswith("/tmp/"):
+            logger.warning("The NumPy vector store in %s is lost on a cold start and not shared "
+                           "between Lambdas, set VECTOR_STORE_PATH to an EFS mount", VECTOR_STORE_PATH)
+        return NumpyStore(
+            VECTOR_STORE_PATH, search=VECTOR_STORE_SEARCH, nprobe=VECTOR_STORE_NPROBE,
+            segment_size=VECTOR_STORE_SEGMENT_SIZE, quantization=get_compression().quantization
+        )
+
+    if VECTOR_STORE_BACKEND != "pinecone":
+        raise ValueError(f"Unknown vector store backend {VECTOR_STORE_BACKEND!r}")
+
+    return PineconeStore(pinecone_index)